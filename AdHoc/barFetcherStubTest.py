@@ -0,0 +1,105 @@
+# Stub-server test for the BarFetcher: we run a local HTTP server that stands in for a bar API, and point the fetcher's
+# requests at it. The server can fail each request key's first few calls with a 429 (rate limited) or a 500, or fail
+# a key every time, so we can check that:
+#   - requests that fail a few times are retried until they succeed (and aren't called more often than that)
+#   - requests that keep failing are given up on after the retries, and left out of the results (the rest still succeed)
+#   - the token bucket keeps the request rate at or below requests_per_minute (after the initial burst)
+#   - no more than max_workers requests are in flight at once
+#
+# Run from the repository root:  python -m AdHoc.barFetcherStubTest
+
+import http.server
+import json
+import logging
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from TradingApis.barFetcher import BarFetcher
+
+max_workers = 4
+requests_per_minute = 600  # 10 per second, so the pacing is measurable without making the test slow
+burst = 4
+retries = 3
+ok_keys = 20
+retried_keys = {'rateLimited': (2, 429), 'serverError': (1, 500)}  # key: (failures before it succeeds, status)
+failing_keys = {'alwaysFails': 500}  # key: status it fails with every time
+
+calls = dict()  # key: number of requests the server got for it
+call_times = list()  # list of float, time.monotonic() of each request
+in_flight = 0
+max_in_flight = 0
+server_lock = threading.Lock()
+
+
+class StubBarHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        global in_flight, max_in_flight
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        key = query['key'][0]
+        fail_first, status = int(query.get('fail', ['0'])[0]), int(query.get('status', ['500'])[0])
+        with server_lock:
+            calls[key] = calls.get(key, 0) + 1
+            call_times.append(time.monotonic())
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            attempt = calls[key]
+        time.sleep(0.02)  # Like a real request, so the fetcher threads overlap
+        with server_lock:
+            in_flight -= 1
+        if fail_first < 0 or attempt <= fail_first:
+            self.send_response(status)
+            self.end_headers()
+            return
+        body = json.dumps({'key': key, 'bars': [{'close': 100.0}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep the output to our c= a= lines
+
+
+def stub_request(port, key, fail=0, status=500):
+    url = f"http://127.0.0.1:{port}/bars?key={key}&fail={fail}&status={status}"
+    return lambda: json.loads(urllib.request.urlopen(url, timeout=5).read())  # Raises HTTPError for a 429 or 500
+
+
+logging.basicConfig(format='%(message)s', level=logging.INFO)
+server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubBarHandler)
+port = server.server_address[1]
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+requests = {f"ok{i}": stub_request(port, f"ok{i}") for i in range(ok_keys)}
+requests.update({key: stub_request(port, key, fail, status) for key, (fail, status) in retried_keys.items()})
+requests.update({key: stub_request(port, key, -1, status) for key, status in failing_keys.items()})
+
+fetcher = BarFetcher('stubFetcher', max_workers=max_workers, requests_per_minute=requests_per_minute, burst=burst,
+                     retries=retries, backoff=0.05, max_backoff=0.2)
+started = time.perf_counter()
+results = fetcher.fetch(requests)
+elapsed = time.perf_counter() - started
+server.shutdown()
+
+# After the first burst requests, the bucket allows one request every 60 / requests_per_minute seconds (with a little
+# slack for timer resolution)
+total_calls = len(call_times)
+minimum_span = (total_calls - burst) * 60 / requests_per_minute
+checks = {
+    'ok_results': all(results.get(f"ok{i}") == {'key': f"ok{i}", 'bars': [{'close': 100.0}]} for i in range(ok_keys)),
+    'retried_results': all(key in results for key in retried_keys),
+    'retried_calls': all(calls[key] == fail + 1 for key, (fail, _) in retried_keys.items()),
+    'failing_left_out': all(key not in results for key in failing_keys),
+    'failing_calls': all(calls[key] == retries + 1 for key in failing_keys),
+    'ok_calls': all(calls[f"ok{i}"] == 1 for i in range(ok_keys)),
+    'rate_limit': max(call_times) - min(call_times) >= 0.95 * minimum_span,
+    'concurrency': max_in_flight <= max_workers,
+}
+for name, passed in checks.items():
+    print(f"c=barFetcherStubTest a=check name={name} status={'ok' if passed else 'failed'}")
+print(f"c=barFetcherStubTest a=summary requests={len(requests)} calls={total_calls} results={len(results)} "
+      + f"maxInFlight={max_in_flight} seconds={round(elapsed, 2)} minimumSeconds={round(minimum_span, 2)} "
+      + f"failures={sum(not passed for passed in checks.values())}")
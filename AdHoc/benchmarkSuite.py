@@ -0,0 +1,283 @@
+# Benchmark suite for the hot code paths, run against synthetic (but S&P-scale) bar files, so we can measure
+# performance without the private DayTradingDataFilesBasePath data.
+#
+# The synthetic bars are deterministic (seeded random walks, with some momentum bursts so the strategies have something
+# to trigger on) and are written with the same writers the ingestion command uses, so they have the real
+# intradayDetail_{freq}min_{yyyy-mm-dd}.csv / dailySummary.csv layouts (and are flagged as normalized in the manifest).
+# They live in their own data folder (BenchmarkDataFilesBasePath, default: <temp folder>/dayTradingBenchmark/), which
+# we point DayTradingDataFilesBasePath at before importing anything else. The files are only re-generated when the
+# configuration changes.
+#
+# Timed:
+#   read_intraday_details: one day, and the 10-day lookback window
+#   extract_symbol_details: every symbol from one day's details
+#   daily_summary_store: load the daily summary store (from its binary cache) and get the last 10 days' ranges
+#   get_bars / get_latest_bar: every 5-minute bar of a day (cached the way the traders use them)
+#   get_trading_pairs: the Fast Follower training for the last day
+#   trader_hhhl / trader_fastFollower: one simulated trading day of each strategy (in a subprocess, including startup)
+#   to_dataframe: the trade tracker report for a tracker with many closed trades
+#
+# Each benchmark reports the best of --repeat runs. Baselines are kept in benchmarkBaselines.json (in the benchmark
+# DerivedFiles folder), per configuration; a benchmark that takes more than --tolerance times its baseline is flagged
+# as a regression. Use --update-baselines to record new baselines.
+#
+# Run from the repository root:  python -m AdHoc.benchmarkSuite --symbols 500 --days 12 --freq 1 5
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmark_base_path = os.environ.get('BenchmarkDataFilesBasePath',
+                                     os.path.join(tempfile.gettempdir(), 'dayTradingBenchmark') + '/')
+os.environ['DayTradingDataFilesBasePath'] = benchmark_base_path
+for folder in ['BarFiles', 'DerivedFiles', 'LogFiles', 'Models', 'TempFiles']:
+    os.makedirs(benchmark_base_path + folder, exist_ok=True)
+
+import numpy as np  # noqa: E402 (the data path has to be set before importing our modules)
+import pandas as pd  # noqa: E402
+
+from alpaca.trading.enums import PositionSide  # noqa: E402
+
+from ReportProcessing.barResampling import resample_intraday_details, resample_daily_summary  # noqa: E402
+from ReportProcessing.dailySummaryReport import write_daily_summary  # noqa: E402
+from ReportProcessing.dailySummaryStore import daily_summary_store  # noqa: E402
+from ReportProcessing.ingestionManifest import (IngestionManifest, intraday_manifest_key,  # noqa: E402
+                                                daily_summary_manifest_key)
+from ReportProcessing.intradayDetailReport import (read_intraday_details, write_intraday_detail,  # noqa: E402
+                                                   extract_symbol_details)
+from StockTraders.fastFollowerHelpers import get_trading_pairs  # noqa: E402
+from TradingApis.alpacaOperations import get_bars, get_latest_bar  # noqa: E402
+from Util.datesAndTimestamps import (timestamp, date_string, trading_dates, previous_trading_date,  # noqa: E402
+                                     session_timestamp, most_recent_bar_time)
+from Util.pathsAndStockSets import derived_files_path, prod_derived_files_path  # noqa: E402
+from Util.tradeTracker import TradeTracker  # noqa: E402
+from Util.tradingCalendar import trading_calendar  # noqa: E402
+
+last_benchmark_date = timestamp('2024-06-14')
+
+
+# region Synthetic bars
+
+def synthetic_symbols(symbol_count):
+    return [f"S{i:03d}" for i in range(symbol_count)]
+
+
+# A stand-in for the S&P 500 table, so get_symbols() returns the synthetic symbols (and never goes to Wikipedia)
+
+def write_synthetic_sp500_table(symbols):
+    table = pd.DataFrame({'Symbol': symbols, 'Security': [f"Synthetic {symbol}" for symbol in symbols],
+                          'GICS Sector': 'Synthetic', 'GICS Sub-Industry': 'Synthetic',
+                          'Headquarters Location': 'Nowhere', 'Date added': '2000-01-01', 'CIK': 0, 'Founded': '2000'})
+    table.to_csv(prod_derived_files_path + 'sp500Table_2000-01-01.csv', index=False)
+
+
+# One day of 1-minute bars for every symbol, in the intraday detail layout. Prices are random walks (starting from
+# each symbol's previous close), with occasional 15-minute momentum bursts
+
+def synthetic_one_minute_bars(rng, trading_date, symbols, previous_close):
+    calendar = trading_calendar()
+    minutes = (calendar.market_close(trading_date) - calendar.market_open(trading_date)).seconds // 60
+    returns = rng.normal(0.0, 0.0012, size=(len(symbols), minutes))
+    bursts = rng.random(size=(len(symbols), minutes)) < 0.002
+    for symbol_index, minute in zip(*np.nonzero(bursts)):
+        returns[symbol_index, minute:minute + 15] += rng.choice([-1.0, 1.0]) * 0.003
+    close = previous_close[:, None] * np.exp(np.cumsum(returns, axis=1))
+    open_ = np.concatenate([previous_close[:, None], close[:, :-1]], axis=1)
+    spread = np.abs(rng.normal(0.0, 0.0008, size=close.shape))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = np.floor(rng.lognormal(7.0, 1.0, size=close.shape)) + 1
+    timestamps = pd.date_range(calendar.market_open(trading_date), periods=minutes, freq='1min')
+    bars = pd.DataFrame({'symbol': np.repeat(symbols, minutes), 'timestamp': np.tile(timestamps, len(symbols)),
+                         'open': open_.ravel(), 'high': high.ravel(), 'low': low.ravel(), 'close': close.ravel(),
+                         'volume': volume.ravel(), 'trade_count': np.ceil(volume.ravel() / 40),
+                         'vwap': ((high + low + close) / 3).ravel()})
+    return bars, close[:, -1]
+
+
+# Write the synthetic bar files (intraday details for each freq, and the daily summary) for the trading dates, and
+# record them in the manifest
+
+def generate_synthetic_bars(symbols, dates, freqs=(1, 5), seed=0):
+    rng = np.random.default_rng(seed)
+    manifest = IngestionManifest()
+    previous_close = rng.uniform(20.0, 500.0, size=len(symbols))
+    daily_summaries = list()  # list of DataFrame
+    for trading_date in dates:
+        one_minute_bars, previous_close = synthetic_one_minute_bars(rng, trading_date, symbols, previous_close)
+        for freq in freqs:
+            bars = one_minute_bars if freq == 1 else resample_intraday_details(one_minute_bars, freq=freq)
+            filename, quality = write_intraday_detail(bars, trading_date, freq=freq)
+            rows = quality.pop('rows')
+            manifest.record(intraday_manifest_key(date_string(trading_date), freq), filename, rows, True,
+                            synthetic=True, **quality)
+        daily_summaries.append(resample_daily_summary(one_minute_bars))
+        print(f"c=benchmark a=generate date={date_string(trading_date)} rows={len(one_minute_bars)}")
+    filename, quality = write_daily_summary(pd.concat(daily_summaries))
+    rows = quality.pop('rows')
+    manifest.record(daily_summary_manifest_key(), filename, rows, True, synthetic=True,
+                    last_date=date_string(dates[-1]), **quality)
+
+
+# Generate the files, unless the files for this configuration are already there
+
+def ensure_synthetic_bars(config, symbols, dates, freqs):
+    config_filename = derived_files_path('syntheticBarsConfig.json')
+    if os.path.exists(config_filename):
+        with open(config_filename, 'r') as f:
+            if json.load(f) == config:
+                return
+    write_synthetic_sp500_table(symbols)
+    generate_synthetic_bars(symbols, dates, freqs=freqs, seed=config['seed'])
+    with open(config_filename, 'w') as f:
+        json.dump(config, f)
+# endregion / Synthetic bars
+
+
+# region Benchmarks
+
+# Run func repeat times and return the best time (in seconds)
+
+def best_time(func, repeat=3):
+    times = list()  # list of float
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def clear_bar_caches():
+    import TradingApis.alpacaOperations as alpaca_operations
+    alpaca_operations.saved_daily_details_1min = pd.DataFrame()
+    alpaca_operations.saved_daily_details_5min = pd.DataFrame()
+
+
+def walk_bars(trading_date, symbols):
+    clear_bar_caches()
+    for minute in range(5, 391, 5):
+        bar_time = most_recent_bar_time(session_timestamp(trading_date, minute))
+        get_bars(bar_time, bar_time, symbols)
+
+
+def walk_latest_bars(trading_date, symbols):
+    clear_bar_caches()
+    for minute in range(5, 391, 30):
+        for symbol in symbols:
+            get_latest_bar(symbol, session_timestamp(trading_date, minute))
+
+
+def extract_all_symbols(details, symbols):
+    for symbol in symbols:
+        extract_symbol_details(details, symbol)
+
+
+def daily_summary_ranges(trading_date):
+    import ReportProcessing.dailySummaryStore as daily_summary_store_module
+    daily_summary_store_module.global_daily_summary_store = None
+    store = daily_summary_store()
+    return store.window('high', trading_date, 10) - store.window('low', trading_date, 10)
+
+
+# Run one simulated trading day of a strategy in a subprocess (the traders are scripts)
+
+def run_trader(module, trading_date):
+    env = dict(os.environ, TraderFirstDate=date_string(trading_date), TraderLastDate=date_string(trading_date))
+    result = subprocess.run([sys.executable, '-m', module], env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{module} failed: {result.stderr.strip().splitlines()[-1]}")
+
+
+def filled_tracker(trade_count, trading_date):
+    tracker = TradeTracker()
+    start = session_timestamp(trading_date, 30)
+    for i in range(trade_count):
+        decision_time = start + pd.Timedelta(seconds=i)
+        trade = tracker.open_trade(f"S{i % 500:03d}", decision_time, PositionSide.LONG)
+        buy = trade.add_market_buy_order(10, 100.0, decision_time, f"buy-{i}")
+        tracker.apply_fill(buy.order_id, 100.0, decision_time)
+        sell = trade.add_market_sell_order(10, 101.0, decision_time, f"sell-{i}")
+        tracker.apply_fill(sell.order_id, 101.0, decision_time)
+        tracker.close_trade(trade)
+    return tracker
+
+
+def run_benchmarks(symbols, dates, freqs, repeat=3, trades=20000, traders=True):
+    last_date = dates[-1]
+    lookback_start = previous_trading_date(last_date, offset=min(10, len(dates) - 1))
+    lookback_end = previous_trading_date(last_date)
+    day_details = read_intraday_details(last_date)
+    tracker = filled_tracker(trades, last_date)
+    benchmarks = {
+        'read_intraday_details_1day': lambda: read_intraday_details(last_date),
+        'read_intraday_details_lookback': lambda: read_intraday_details(lookback_start, lookback_end),
+        'extract_symbol_details': lambda: extract_all_symbols(day_details, symbols),
+        'daily_summary_store': lambda: daily_summary_ranges(last_date),
+        'get_bars_day': lambda: walk_bars(last_date, symbols),
+        'get_latest_bar': lambda: walk_latest_bars(last_date, symbols),
+        'get_trading_pairs': lambda: get_trading_pairs(last_date, symbol_subset=symbols),
+        'to_dataframe': lambda: tracker.to_dataframe(),
+    }
+    if 1 in freqs:
+        benchmarks['read_intraday_details_1min'] = lambda: read_intraday_details(last_date, freq=1)
+    if traders:
+        benchmarks['trader_hhhl'] = lambda: run_trader('StockTraders.higherHighsHigherLows', last_date)
+        benchmarks['trader_fastFollower'] = lambda: run_trader('StockTraders.fastFollower', last_date)
+    return {name: best_time(func, repeat=1 if name.startswith('trader') else repeat)
+            for name, func in benchmarks.items()}
+# endregion / Benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the hot code paths against synthetic bar files')
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--days', type=int, default=12, help='trading days of bars (10 are used for training)')
+    parser.add_argument('--freq', type=int, nargs='+', default=[1, 5], help='intraday bar sizes to write')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--trades', type=int, default=20000, help='closed trades in the to_dataframe benchmark')
+    parser.add_argument('--skip-traders', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='flag benchmarks slower than this x baseline')
+    parser.add_argument('--update-baselines', action='store_true')
+    args = parser.parse_args()
+
+    freqs = sorted(set(args.freq) | {5})  # The traders and get_trading_pairs use the 5-minute bars
+    config = {'symbols': args.symbols, 'days': args.days, 'freqs': freqs, 'seed': args.seed}
+    symbols = synthetic_symbols(args.symbols)
+    dates = trading_dates(previous_trading_date(last_benchmark_date, offset=args.days - 1), last_benchmark_date)
+    ensure_synthetic_bars(config, symbols, dates, freqs)
+
+    results = run_benchmarks(symbols, dates, freqs, repeat=args.repeat, trades=args.trades,
+                             traders=not args.skip_traders)
+
+    baselines_filename = derived_files_path('benchmarkBaselines.json')
+    baselines = dict()
+    if os.path.exists(baselines_filename):
+        with open(baselines_filename, 'r') as f:
+            baselines = json.load(f)
+    config_key = f"{args.symbols}sym_{args.days}d_{'-'.join(str(freq) for freq in freqs)}min_seed{args.seed}"
+    config_baselines = baselines.get(config_key, dict())
+    regressions = 0
+    for name, seconds in results.items():
+        baseline = config_baselines.get(name)
+        ratio = seconds / baseline if baseline else None
+        status = 'new' if ratio is None else ('regression' if ratio > args.tolerance else 'ok')
+        regressions += status == 'regression'
+        print(f"c=benchmark a=time name={name} seconds={round(seconds, 4)} "
+              + f"baseline={round(baseline, 4) if baseline else None} "
+              + f"ratio={round(ratio, 2) if ratio else None} status={status}")
+    print(f"c=benchmark a=summary config={config_key} benchmarks={len(results)} regressions={regressions}")
+
+    if args.update_baselines:
+        baselines[config_key] = results
+        with open(baselines_filename, 'w') as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
 import pandas as pd
 
+from ReportProcessing.edgeStudy import EdgeStatistics, run_edge_study, shifted, forward_return_pct
+from ReportProcessing.featureStore import feature_panel_chunks
+from ReportProcessing.resultSink import ResultSink
 from ReportProcessing.intradayDetailReport import read_intraday_details, extract_symbol_details
-from StockTraders.fastFollowerHelpers import get_trading_pairs
+from StockTraders.fastFollowerHelpers import get_trading_pairs, compute_trigger_and_effect_df
 from Util.datesAndTimestamps import timestamp, time_string, trading_dates, previous_trading_date
 from Util.pathsAndStockSets import StockSet, set_stock_set, get_symbols, temp_files_path
 
@@ -11,7 +14,7 @@ set_stock_set(StockSet.SP500)
 # Higher Highs; Higher Lows. First approach: look for 3 candles where highs and lows increase; see what percentage gain
 # we have after 10 minutes
 if False:
-    results = list()  # List of DataFrame
+    results = ResultSink(temp_files_path('hhhl_results_first_try'), partition_column='date', max_buffered_rows=None)
     for ts in trading_dates(timestamp('2023-12-01'), timestamp('2024-05-31')):
         print(ts)
         intraday_details = read_intraday_details(ts)
@@ -37,9 +40,8 @@ if False:
             symbol_details['profit_pct'] = 100 * (symbol_details['sell_price'] / symbol_details['buy_price'] - 1)
             hits = symbol_details[symbol_details['hhhl_trigger'] & symbol_details['profit_pct']]
             results.append(hits)
-    results_df = pd.concat(results)
-    results_df = results_df.round(4)
-    results_df.to_csv(temp_files_path('hhhl_results_first_try.csv'), index=False)
+        results.flush()  # Write the day's hits
+    results.close(csv_filename=temp_files_path('hhhl_results_first_try.csv'))
 
 # Higher Highs; Higher Lows. Second approach: Filter out the following:
 #    cases where total gain is less than 4%
@@ -49,7 +51,7 @@ if False:
     gain_threshold = 4  # The sum of the four gains must be at least 4%
     max_high_close_gap = 0.25  # The last high must be at most 0.25% higher than the close
     look_forward = 3  # Take profit in look_forward * 5 minutes
-    results = list()  # List of DataFrame
+    results = ResultSink(temp_files_path('hhhl_results_second_try'), partition_column='date', max_buffered_rows=None)
     for ts in trading_dates(timestamp('2024-06-01'), timestamp('2024-07-18')):
         print(ts)
         intraday_details = read_intraday_details(ts)
@@ -82,9 +84,53 @@ if False:
                                   & (symbol_details['time'] != '09:40:00')
                                   & symbol_details['profit_pct']]
             results.append(hits)
-    results_df = pd.concat(results)
-    results_df = results_df.round(4)
-    results_df.to_csv(temp_files_path('hhhl_results_second_try.csv'), index=False)
+        results.flush()  # Write the day's hits
+    results.close(csv_filename=temp_files_path('hhhl_results_second_try.csv'))
+
+# Higher Highs; Higher Lows. Second approach again, as an edge study: the whole panel is processed at once (a chunk of
+# days at a time), the shifts stay within each day, and we get the hit rates and return percentiles for each time of
+# day (plus the hits themselves) without collecting the results in memory
+if False:
+    gain_threshold = 4  # The sum of the four gains must be at least 4%
+    max_high_close_gap = 0.25  # The last high must be at most 0.25% higher than the close
+    look_forward = 3  # Take profit in look_forward * 5 minutes
+
+    def hhhl_study(panel):
+        high_1, low_1 = shifted(panel, 'high', 1), shifted(panel, 'low', 1)
+        high_2, low_2 = shifted(panel, 'high', 2), shifted(panel, 'low', 2)
+        panel['high_pct_2'] = 100 * (high_1 / high_2 - 1)
+        panel['high_pct_1'] = 100 * (panel['high'] / high_1 - 1)
+        panel['low_pct_2'] = 100 * (low_1 / low_2 - 1)
+        panel['low_pct_1'] = 100 * (panel['low'] / low_1 - 1)
+        panel['score'] = panel['high_pct_1'] + panel['high_pct_2'] + panel['low_pct_1'] + panel['low_pct_2']
+        panel['high_to_close'] = 100 * (panel['high'] / panel['close'] - 1)
+        panel['gain_pct'] = forward_return_pct(panel, look_forward, exit_column='open')  # Sell at the open
+        trigger = ((panel['high_pct_1'] > 0) & (panel['high_pct_2'] > 0) & (panel['low_pct_1'] > 0)
+                   & (panel['low_pct_2'] > 0) & (panel['score'] >= gain_threshold)
+                   & (panel['high_to_close'] <= max_high_close_gap) & (panel['time'] != '09:40:00'))
+        return panel[trigger]
+
+    statistics = run_edge_study(hhhl_study, timestamp('2024-06-01'), timestamp('2024-07-18'),
+                                statistics=EdgeStatistics(group_by=['time']),
+                                hits_sink=ResultSink(temp_files_path('hhhl_results_edge_study'),
+                                                     partition_column='date'))
+    statistics.summary().to_csv(temp_files_path('hhhl_edge_study_by_time.csv'), index=False)
+
+# Higher Highs; Higher Lows. The same study, reading the stored hhhl features (from the feature store) instead of
+# computing them from the bars. The features are only computed the first time
+if False:
+    gain_threshold = 4  # The sum of the four gains must be at least 4%
+    max_high_close_gap = 0.25  # The last high must be at most 0.25% higher than the close
+
+    def hhhl_feature_study(panel):
+        return panel[panel['hhhl_trigger'] & (panel['score'] >= gain_threshold)
+                     & (panel['high_to_close'] <= max_high_close_gap) & (panel['time'] != '09:40:00')]
+
+    start, end = timestamp('2024-06-01'), timestamp('2024-07-18')
+    statistics = run_edge_study(hhhl_feature_study, start, end,
+                                statistics=EdgeStatistics(return_column='profit_pct', group_by=['time']),
+                                panels=feature_panel_chunks(['hhhl'], start, end))
+    statistics.summary().to_csv(temp_files_path('hhhl_feature_study_by_time.csv'), index=False)
 
 # Fast Follower Strategy -- First Approach
 if False:
@@ -107,7 +153,7 @@ if False:
         return symbol_results_df
 
     # Collect the testing results for each day
-    results = list()  # List of DataFrame
+    results = ResultSink(temp_files_path('fast_follower_results_6mo_first_try'), partition_column='date')
     for ts in trading_dates(timestamp('2023-12-01'), timestamp('2024-05-31')):
         print(ts)
 
@@ -152,8 +198,7 @@ if False:
         test = test[['decision_time', 'independent_symbol', 'dependent_symbol', 'date', 'time',
                      'trigger_pct', 'count', 'mean_gain_pct', 'gain_pct']]
         results.append(test)
-    results_df = pd.concat(results).round(4)
-    results_df.to_csv(temp_files_path('fast_follower_results_6mo_first_try.csv'), index=False)
+    results.close(csv_filename=temp_files_path('fast_follower_results_6mo_first_try.csv'))
 
 # Fast Follower Strategy -- Second Approach. Include additional fields to support filtering
 #   compute change over last 5 minutes, 10 minutes, and 15 minutes
@@ -184,7 +229,7 @@ if False:
         symbol_results_df = symbol_results_df.reset_index(drop=True)
         return symbol_results_df
 
-    results = list()  # List of DataFrame
+    results = ResultSink(temp_files_path('fast_follower_results_training_set'), partition_column='date')
     for ts in trading_dates(timestamp('2023-12-01'), timestamp('2024-05-31')):
         # for ts in trading_dates(timestamp('2024-06-01'), timestamp('2024-07-18')):
         print(ts)
@@ -235,9 +280,8 @@ if False:
                      'count', 'mean_gain_pct', 'gain_00', 'gain_05', 'gain_10',
                      'gain_pct']]
         results.append(test)
-    results_df = pd.concat(results).round(4)
-    results_df.to_csv(temp_files_path('fast_follower_results_training_set.csv'), index=False)
-    # results_df.to_csv(temp_files_path('fast_follower_results_test_set.csv'), index=False)
+    results.close(csv_filename=temp_files_path('fast_follower_results_training_set.csv'))
+    # results.close(csv_filename=temp_files_path('fast_follower_results_test_set.csv'))
 
 # Fast Follower Strategy -- Third Approach. Refactor so that we use common code with fastFollower.py (using procedures
 # in fastFollowerHelpers.py)
@@ -250,7 +294,7 @@ if True:
     success_rate_05 = 0.666  # Only accept pairs that gain 0.5% at least 2/3 of the time
 
     symbols = get_symbols()
-    results = list()  # List of DataFrame
+    results = ResultSink(temp_files_path('fast_follower_results_training_set'), partition_column='date')
 
     for ts in trading_dates(timestamp('2023-12-01'), timestamp('2024-05-31')):
         # for ts in trading_dates(timestamp('2024-06-01'), timestamp('2024-07-18')):
@@ -279,6 +323,5 @@ if True:
                      'count', 'mean_gain_pct', 'gain_00', 'gain_05', 'gain_10',
                      'gain_pct']]
         results.append(test)
-    results_df = pd.concat(results).round(4)
-    results_df.to_csv(temp_files_path('fast_follower_results_training_set.csv'), index=False)
-    # results_df.to_csv(temp_files_path('fast_follower_results_test_set.csv'), index=False)
+    results.close(csv_filename=temp_files_path('fast_follower_results_training_set.csv'))
+    # results.close(csv_filename=temp_files_path('fast_follower_results_test_set.csv'))
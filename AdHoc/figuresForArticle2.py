@@ -4,7 +4,7 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 from ReportProcessing.intradayDetailReport import read_intraday_details, extract_symbol_details
-from ReportProcessing.dailySummaryReport import read_daily_summary, extract_symbol_summary
+from ReportProcessing.dailySummaryStore import daily_summary_store
 from Util.pathsAndStockSets import set_stock_set, StockSet
 from Util.datesAndTimestamps import timestamp
 
@@ -25,10 +25,10 @@ if True:
 # Show each symbol as a single timeline (daily resolution), for % change from initial opening price
 # Also, include a slider that allows us to drill into the timeline
 if True:
-    daily_summary = read_daily_summary()
+    store = daily_summary_store()
     fig = go.Figure()
-    for symbol in daily_summary['symbol'].unique():
-        symbol_df = extract_symbol_summary(daily_summary, symbol)
+    for symbol in store.symbols:
+        symbol_df = store.symbol_summary(symbol)
         initial_open = symbol_df['open'].iloc[0]
         symbol_df['pct_change'] = 100 * (symbol_df['close'] / initial_open - 1)
         fig.add_trace(go.Scatter(x=symbol_df['timestamp'], y=symbol_df['pct_change'], name=symbol))
@@ -0,0 +1,38 @@
+# Check that importing our modules stays cheap. Each module is imported in a fresh Python process (like a process-pool
+# worker or a short command line run would), and we flag any module whose import takes longer than the budget.
+#
+# Importing should never hit the network or build anything expensive: the S&P 500 table, the Alpaca credentials, and
+# the NYSE calendar are all loaded lazily, the first time they are used.
+#
+# Run from the repository root:  python AdHoc/importTimeBudget.py
+
+import subprocess
+import sys
+import time
+
+import_time_budget = 1.0  # seconds, including starting the interpreter
+
+modules = ['Util.datesAndTimestamps', 'Util.pathsAndStockSets', 'Util.tradingCalendar', 'Util.tradeTracker',
+           'Util.instrumentation', 'Util.eventLog', 'Util.indicatorEngine', 'Util.tradeIdentification',
+           'Util.tradeExecution', 'TradingApis.alpacaClients', 'TradingApis.alpacaOperations',
+           'ReportProcessing.dailySummaryReport', 'ReportProcessing.dailySummaryStore',
+           'ReportProcessing.intradayDetailReport', 'StockTraders.fastFollowerHelpers']
+
+failures = 0
+for module in modules:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', f"import {module}"], capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        status = 'error'
+    elif elapsed > import_time_budget:
+        status = 'over_budget'
+    else:
+        status = 'ok'
+    failures += status != 'ok'
+    print(f"c=importTimeBudget a=import module={module} seconds={round(elapsed, 3)} status={status}")
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1])
+
+print(f"c=importTimeBudget a=summary modules={len(modules)} failures={failures} budget={import_time_budget}")
+sys.exit(1 if failures else 0)
@@ -0,0 +1,69 @@
+# How much does the daily co-movement prefilter (get_trading_pairs with prefilter_top_k) cost us? For each trading
+# date, we mine the Fast Follower pairs exactly and with the prefilter (for each --top-k), and report the time each took
+# and the recall: the fraction of the exact pairs that the prefiltered run also found. (The prefiltered run only
+# computes the intraday statistics for the candidate pairs, so every pair it finds should also be an exact pair, but we
+# count the overlap rather than rely on that.)
+#
+# Run from the repository root:
+#   python -m AdHoc.pairPrefilterRecall --start 2024-01-02 --end 2024-03-28 --top-k 25 50 100 --feature-store
+
+import argparse
+import time
+
+import pandas as pd
+
+from ReportProcessing.featureStore import materialize_features
+from StockTraders.fastFollowerHelpers import get_trading_pairs
+from Util.datesAndTimestamps import timestamp, trading_dates, date_string, previous_trading_date
+from Util.pathsAndStockSets import StockSet, set_stock_set, get_symbols, temp_files_path
+
+parser = argparse.ArgumentParser(description='Report the recall and speedup of the pair prefilter')
+parser.add_argument('--start', required=True, help='first trading date (yyyy-mm-dd)')
+parser.add_argument('--end', required=True, help='last trading date (yyyy-mm-dd)')
+parser.add_argument('--top-k', type=int, nargs='+', default=[25, 50, 100])
+parser.add_argument('--prefilter-days', type=int, default=60)
+parser.add_argument('--min-count', type=int, default=7)
+parser.add_argument('--mean-gain-pct', type=float, default=0.5)
+parser.add_argument('--success-rate', type=float, default=0.666)
+parser.add_argument('--feature-store', action='store_true', help='train on the stored fastFollower features')
+parser.add_argument('--stock-set', choices=[s.name for s in StockSet], default=StockSet.SP500.name)
+args = parser.parse_args()
+
+set_stock_set(StockSet[args.stock_set])
+symbols = get_symbols()
+pair_parameters = {'symbol_subset': symbols, 'lookback_window': 10, 'effect_window': 15, 'trigger_pct': 1.0,
+                   'min_count': args.min_count, 'mean_gain_pct': args.mean_gain_pct,
+                   'success_rate_05': args.success_rate, 'from_feature_store': args.feature_store}
+if args.feature_store:  # Compute any missing features up front, so they aren't part of the timings
+    materialize_features('fastFollower', previous_trading_date(timestamp(args.start), offset=10),
+                         previous_trading_date(timestamp(args.end)))
+
+
+def mine_pairs(trading_date, **prefilter):
+    start = time.perf_counter()
+    pairs = get_trading_pairs(trading_date, **pair_parameters, **prefilter)
+    return set(zip(pairs['independent_symbol'], pairs['dependent_symbol'])), time.perf_counter() - start
+
+
+results = list()  # list of dict
+for trading_date in trading_dates(timestamp(args.start), timestamp(args.end)):
+    exact_pairs, exact_seconds = mine_pairs(trading_date)
+    for top_k in args.top_k:
+        pairs, seconds = mine_pairs(trading_date, prefilter_top_k=top_k, prefilter_days=args.prefilter_days)
+        found_pairs = len(pairs & exact_pairs)  # exact pairs the prefiltered run also found
+        recall = found_pairs / len(exact_pairs) if exact_pairs else 1.0
+        results.append({'date': date_string(trading_date), 'top_k': top_k, 'exact_pairs': len(exact_pairs),
+                        'prefiltered_pairs': len(pairs), 'found_pairs': found_pairs, 'recall': recall,
+                        'exact_seconds': exact_seconds, 'prefiltered_seconds': seconds})
+        print(f"c=pairPrefilterRecall a=compare date={date_string(trading_date)} topK={top_k} "
+              + f"exactPairs={len(exact_pairs)} prefilteredPairs={len(pairs)} recall={round(recall, 3)} "
+              + f"exactSeconds={round(exact_seconds, 3)} prefilteredSeconds={round(seconds, 3)}")
+
+results_df = pd.DataFrame(results)
+results_df.round(4).to_csv(temp_files_path('pairPrefilterRecall.csv'), index=False)
+for top_k, group in results_df.groupby('top_k'):
+    exact_pairs = group['exact_pairs'].sum()
+    recall = group['found_pairs'].sum() / exact_pairs if exact_pairs else 1.0  # pooled over all the dates
+    speedup = group['exact_seconds'].sum() / group['prefiltered_seconds'].sum()
+    print(f"c=pairPrefilterRecall a=summary topK={top_k} dates={len(group)} recall={round(recall, 3)} "
+          + f"minRecall={round(group['recall'].min(), 3)} speedup={round(speedup, 1)}")
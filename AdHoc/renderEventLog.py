@@ -0,0 +1,17 @@
+# Render a binary event log (see Util/eventLog.py) as the usual c= a= text lines.
+#
+# Run from the repository root:  python -m AdHoc.renderEventLog <binary_filename> [--timestamps] [--level WARNING]
+
+import argparse
+import logging
+
+from Util.eventLog import render_event_log
+
+parser = argparse.ArgumentParser(description='Render a binary event log as text')
+parser.add_argument('filename', help='The binary event log')
+parser.add_argument('--timestamps', action='store_true', help='Start each line with the time it was logged')
+parser.add_argument('--level', default='NOTSET', help='Only show events at this level or above (e.g., WARNING)')
+args = parser.parse_args()
+
+for line in render_event_log(args.filename, timestamps=args.timestamps, level=logging.getLevelName(args.level)):
+    print(line)
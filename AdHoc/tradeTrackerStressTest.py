@@ -0,0 +1,102 @@
+# Stress test for a thread-safe TradeTracker: many writer threads open trades and place orders, while fill threads
+# apply broker-style fills and cancels by order id (like the Alpaca trade update stream would), and a reader thread
+# keeps exporting the report. At the end we check that every trade and order was accounted for exactly once.
+#
+# Run from the repository root:  python -m AdHoc.tradeTrackerStressTest
+
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from alpaca.trading.enums import PositionSide
+
+from Util.tradeTracker import TradeTracker
+
+writer_threads = 8
+fill_threads = 4
+trades_per_writer = 2000
+shares = 10
+buy_price = 100.0
+sell_price = 101.0
+
+tracker = TradeTracker(thread_safe=True)
+fills = queue.SimpleQueue()  # (order_id, price) or None to stop a fill thread
+start_time = pd.Timestamp('2024-06-03 09:30:00', tz='America/New_York')
+
+
+def place_trades(writer):
+    for i in range(trades_per_writer):
+        decision_time = start_time + pd.Timedelta(microseconds=writer * trades_per_writer + i)
+        trade = tracker.open_trade(f"SYM{writer}", decision_time, PositionSide.LONG)
+        order = trade.add_market_buy_order(shares, buy_price, decision_time, f"buy-{writer}-{i}")
+        fills.put((order.order_id, buy_price))
+
+
+def apply_fills():
+    while True:
+        event = fills.get()
+        if event is None:
+            return
+        order_id, price = event
+        trade = tracker.apply_fill(order_id, price, start_time)
+        if order_id.startswith('buy'):
+            # Half the trades sell out; the other half have their sell order cancelled
+            sell_id = 'sell' + order_id[3:]
+            trade.add_market_sell_order(shares, sell_price, start_time, sell_id)
+            if int(order_id.split('-')[-1]) % 2 == 0:
+                tracker.apply_fill(sell_id, sell_price, start_time, filled_shares=shares // 2)  # partial fill first
+                fills.put((sell_id, sell_price))
+            else:
+                tracker.apply_cancel(sell_id, start_time)
+                tracker.close_trade(trade)
+        else:
+            tracker.close_trade(trade)
+
+
+def export_reports(stop):
+    while not stop.is_set():
+        tracker.to_dataframe()
+
+
+stop_exports = threading.Event()
+started = time.perf_counter()
+writers = [threading.Thread(target=place_trades, args=(w,)) for w in range(writer_threads)]
+fillers = [threading.Thread(target=apply_fills) for _ in range(fill_threads)]
+exporter = threading.Thread(target=export_reports, args=(stop_exports,))
+for thread in writers + fillers + [exporter]:
+    thread.start()
+for thread in writers:
+    thread.join()
+
+# Wait until every trade has been closed, then stop the fill threads and the exporter
+total_trades = writer_threads * trades_per_writer
+while tracker.account.active_positions > 0:
+    time.sleep(0.01)
+for _ in fillers:
+    fills.put(None)
+for thread in fillers:
+    thread.join()
+stop_exports.set()
+exporter.join()
+elapsed = time.perf_counter() - started
+
+# Check the results
+report = tracker.to_dataframe()
+expected_profit = (total_trades // 2) * shares * (sell_price - buy_price)
+checks = {
+    'closed_trades': len(tracker.closed_trades) == total_trades,
+    'active_trades': len(tracker.active_trades) == 0,
+    'report_rows': len(report) == total_trades,
+    'orders_indexed': len(tracker.order_index.by_id) == 2 * total_trades,
+    'filled_orders': len(tracker.get_orders_with_status('filled')) == total_trades + total_trades // 2,
+    'cancelled_orders': len(tracker.get_orders_with_status('cancelled')) == total_trades // 2,
+    'active_orders': len(tracker.order_index.by_key) == 0,
+    'realized_profit': abs(tracker.account.realized_profit - expected_profit) < 1e-6,
+    'active_positions': tracker.account.active_positions == 0,
+}
+for name, passed in checks.items():
+    print(f"c=trackerStressTest a=check name={name} status={'ok' if passed else 'failed'}")
+print(f"c=trackerStressTest a=summary trades={total_trades} writers={writer_threads} fillers={fill_threads} "
+      + f"seconds={round(elapsed, 2)} failures={sum(not passed for passed in checks.values())}")
@@ -0,0 +1,339 @@
+# Ingestion command for the bar files (the daily summary and the intraday details).
+#
+# We keep an IngestionManifest of the files that have already been written (with row counts and checksums), so each
+# run only fetches what's missing:
+#   - intraday details: only the (date, freq) files that are missing or were incomplete when we wrote them
+#   - daily summary: only the days after the last date already in dailySummary.csv
+#
+# Requests go through a BarFetcher (TradingApis/barFetcher.py), which runs them concurrently with rate limiting and
+# retries. Alpaca requests are chunked by symbol, yfinance requests are one per symbol, and backfills fetch
+# days_per_batch days at a time.
+#
+# With --derive, we only download the 1-minute bars, and build the other intraday details and the daily summary from
+# them (see ReportProcessing/barResampling.py), so every resolution agrees.
+#
+# All files are written atomically, so an interrupted run never leaves a partial file behind (and the next run just
+# picks up where it left off). The nightly update is then one small request per new day.
+#
+# Usage (from the repository root):
+#   python -m ReportProcessing.barIngestion --source Alpaca --freq 5
+#   python -m ReportProcessing.barIngestion --source yfinance --start 2024-06-03 --end 2024-06-07 --freq 5 1
+#   python -m ReportProcessing.barIngestion --derive --freq 5 15
+#
+# Options:
+#   --source: 'Alpaca' or 'yfinance'
+#   --start, --end: the range of trading dates to make sure we have (default: the last 10 trading days)
+#   --freq: the intraday bar sizes (in minutes) to ingest
+#   --stock-set: 'SP500' or 'DEVELOPMENT'
+#   --skip-daily-summary: don't update dailySummary.csv
+#   --force: re-fetch (or re-build) the intraday details even if the manifest says they are complete
+#   --derive: fetch 1-minute bars and resample them into the --freq bars and the daily summary
+
+import argparse
+import logging
+import os
+
+import pandas as pd
+
+from ReportProcessing.barResampling import build_intraday_detail, build_daily_summary
+from ReportProcessing.dailySummaryReport import write_daily_summary
+from ReportProcessing.ingestionManifest import (IngestionManifest, intraday_manifest_key, daily_summary_manifest_key)
+from ReportProcessing.intradayDetailReport import write_intraday_detail, intraday_detail_filename
+from TradingApis.barFetcher import BarFetcher, chunked
+from Util.datesAndTimestamps import (timestamp, timestamp_now, date_string, trading_dates, next_trading_date,
+                                     previous_trading_date)
+from Util.pathsAndStockSets import StockSet, set_stock_set, get_symbols, bar_files_path
+from Util.tradingCalendar import trading_calendar
+
+intraday_columns = ['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume', 'trade_count', 'vwap']
+yfinance_columns = ['timestamp', 'symbol', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+# A day's file counts as complete if it has at least this fraction of (symbols * bars in the session) rows. Thinly
+# traded stocks don't have a bar for every minute, so we allow some slack
+complete_fraction = {1: 0.8, 5: 0.95}
+
+
+# Each data source provides:
+#   intraday_requests(report_date, freq): dict of key: callable, each returning a DataFrame for part of the day
+#   format_intraday(frames): combine the DataFrames for a day into the intraday detail layout
+#   daily_summary_requests(start, end): dict of key: callable for the daily summary from start through end
+#   format_daily_summary(frames): combine them into the daily summary layout
+#   fetcher: the BarFetcher (concurrency, rate limit, and retries) to use for the source
+
+# region Alpaca
+# One request per chunk of symbols (the SDK follows Alpaca's page tokens for us). The free plan allows 200 requests per
+# minute, and the historical client (with its HTTP session) is shared across the fetcher threads
+
+alpaca_symbols_per_request = 100
+
+
+def alpaca_bars_request(symbols, timeframe, start, end=None):
+    from alpaca.data.requests import StockBarsRequest  # pip install alpaca-py
+    from TradingApis.alpacaClients import historical_client
+
+    request = StockBarsRequest(symbol_or_symbols=symbols, timeframe=timeframe, start=start, end=end)
+    return lambda: historical_client().get_stock_bars(request).df
+
+
+def alpaca_intraday_requests(report_date, freq=5):
+    from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
+
+    calendar = trading_calendar()
+    batch_start = calendar.market_open(report_date)  # Start at 9:30 (when the market opens)
+    batch_end = calendar.market_close(report_date) - pd.Timedelta(minutes=freq)  # ... through the last bar
+    return {(date_string(report_date), i): alpaca_bars_request(symbols, TimeFrame(freq, TimeFrameUnit.Minute),
+                                                               batch_start, batch_end)
+            for i, symbols in enumerate(chunked(get_symbols(), alpaca_symbols_per_request))}
+
+
+# The time zone conversion and sorting happen when the file is normalized (in write_intraday_detail)
+
+def format_alpaca_intraday(frames):
+    result_df = pd.concat(frames).reset_index(drop=False)
+    return result_df[intraday_columns]
+
+
+def alpaca_daily_summary_requests(start, end):
+    from alpaca.data.timeframe import TimeFrame
+
+    end = trading_calendar().market_close(end)  # The daily bars are stamped at midnight, so this includes end's bar
+    return {('dailySummary', i): alpaca_bars_request(symbols, TimeFrame.Day, start, end)
+            for i, symbols in enumerate(chunked(get_symbols(), alpaca_symbols_per_request))}
+
+
+def format_alpaca_daily_summary(frames):
+    result_df = pd.concat(frames).reset_index(drop=False)
+    result_df['timestamp'] = result_df['timestamp'].dt.tz_convert('America/New_York')
+    result_df['date'] = result_df['timestamp'].dt.strftime('%Y-%m-%d')
+    return result_df.set_index(['symbol', 'timestamp'], drop=True)
+# endregion / Alpaca
+
+
+# region yfinance
+# yfinance only takes one symbol per request, so we make one request per symbol (and keep the rate modest, since
+# it's an unofficial API)
+
+def yfinance_history_request(symbol, **history_args):
+    def request():
+        import yfinance as yf
+        history = yf.Ticker(symbol).history(**history_args)
+        history['timestamp'] = history.index
+        history['symbol'] = symbol
+        return history[yfinance_columns]
+    return request
+
+
+def yfinance_intraday_requests(report_date, freq=5):
+    batch_end = report_date + pd.Timedelta('1d')
+    return {(date_string(report_date), symbol): yfinance_history_request(symbol, interval=f"{freq}m",
+                                                                          start=date_string(report_date),
+                                                                          end=date_string(batch_end))
+            for symbol in get_symbols()}
+
+
+def format_yfinance_intraday(frames):
+    result_df = pd.concat([frame for frame in frames if len(frame) > 0])
+    result_df.columns = [column.lower() for column in result_df.columns]
+    return result_df.reset_index(drop=True)
+
+
+def yfinance_daily_summary_requests(start, end):
+    end = end + pd.Timedelta('1d')  # yfinance's end date is exclusive
+    return {('dailySummary', symbol): yfinance_history_request(symbol, start=date_string(start), end=date_string(end))
+            for symbol in get_symbols()}
+
+
+def format_yfinance_daily_summary(frames):
+    result_df = pd.concat([frame for frame in frames if len(frame) > 0])
+    result_df.columns = [column.lower() for column in result_df.columns]
+    result_df['date'] = result_df['timestamp'].dt.strftime('%Y-%m-%d')
+    return result_df.set_index(['symbol', 'timestamp'], drop=True)  # Same layout as the Alpaca daily summary
+# endregion / yfinance
+
+
+sources = {
+    'Alpaca': {'intraday_requests': alpaca_intraday_requests, 'format_intraday': format_alpaca_intraday,
+               'daily_summary_requests': alpaca_daily_summary_requests,
+               'format_daily_summary': format_alpaca_daily_summary,
+               'fetcher': BarFetcher('alpacaFetcher', max_workers=8, requests_per_minute=180)},
+    'yfinance': {'intraday_requests': yfinance_intraday_requests, 'format_intraday': format_yfinance_intraday,
+                 'daily_summary_requests': yfinance_daily_summary_requests,
+                 'format_daily_summary': format_yfinance_daily_summary,
+                 'fetcher': BarFetcher('yfinanceFetcher', max_workers=8, requests_per_minute=120)}
+}
+
+days_per_batch = 5  # Fetch this many days concurrently (and then write them) during backfills
+
+
+# The number of rows we expect in a day's intraday detail file (fewer on early-close days)
+
+def expected_intraday_rows(report_date, freq=5):
+    calendar = trading_calendar()
+    session_minutes = (calendar.market_close(report_date) - calendar.market_open(report_date)).seconds // 60
+    return len(get_symbols()) * (session_minutes // freq)
+
+
+# A session that hasn't closed yet can't be complete
+
+def session_has_closed(report_date):
+    return timestamp_now() >= trading_calendar().market_close(report_date)
+
+
+def ingest_intraday_details(manifest, start, end, freq=5, source='Alpaca', force=False):
+    source = sources[source]
+    missing_dates = list()  # list of Timestamp
+    for report_date in trading_dates(start, end):
+        key = intraday_manifest_key(date_string(report_date), freq)
+        filename = bar_files_path(intraday_detail_filename(report_date, freq=freq))
+        if not force and manifest.is_complete(key, filename):
+            continue
+        if not session_has_closed(report_date):
+            logging.info(f"c=barIngestion a=skip date={date_string(report_date)} freq={freq} reason=sessionOpen")
+            continue
+        missing_dates.append(report_date)
+
+    for batch in chunked(missing_dates, days_per_batch):
+        requests = dict()
+        for report_date in batch:
+            requests.update(source['intraday_requests'](report_date, freq=freq))
+        results = source['fetcher'].fetch(requests)
+        for report_date in batch:
+            keys = [key for key in requests.keys() if key[0] == date_string(report_date)]
+            if any(key not in results for key in keys):  # We'll try this day again on the next run
+                logging.error(f"c=barIngestion a=intradayDetail s=failed date={date_string(report_date)} freq={freq}")
+                continue
+            result_df = source['format_intraday']([results[key] for key in keys])
+            filename, quality = write_intraday_detail(result_df, report_date, freq=freq)
+            rows = quality.pop('rows')
+            expected_rows = expected_intraday_rows(report_date, freq=freq)
+            complete = rows >= complete_fraction.get(freq, 0.8) * expected_rows
+            manifest.record(intraday_manifest_key(date_string(report_date), freq), filename, rows, complete,
+                            expected_rows=expected_rows, **quality)
+            logging.info(f"c=barIngestion a=intradayDetail date={date_string(report_date)} freq={freq} "
+                         + f"rows={rows} expected={expected_rows} complete={complete}")
+
+
+# Build the freq-minute intraday details from the 1-minute files, for the dates whose 1-minute file is complete
+
+def derive_intraday_details(manifest, start, end, freq=5, force=False):
+    for report_date in trading_dates(start, end):
+        key = intraday_manifest_key(date_string(report_date), freq)
+        filename = bar_files_path(intraday_detail_filename(report_date, freq=freq))
+        if not force and manifest.is_complete(key, filename):
+            continue
+        if not one_minute_details_complete(manifest, report_date):
+            logging.info(f"c=barIngestion a=skip date={date_string(report_date)} freq={freq} reason=no1min")
+            continue
+        filename, quality = build_intraday_detail(report_date, freq=freq)
+        rows = quality.pop('rows')
+        manifest.record(key, filename, rows, True, derived_from='1min', **quality)
+        logging.info(f"c=barIngestion a=deriveIntradayDetail date={date_string(report_date)} freq={freq} "
+                     + f"rows={rows}")
+
+
+def one_minute_details_complete(manifest, report_date):
+    return manifest.is_complete(intraday_manifest_key(date_string(report_date), 1),
+                                bar_files_path(intraday_detail_filename(report_date, freq=1)))
+
+
+# Append the days after the last date in dailySummary.csv, through end (or fetch everything since default_start if it
+# doesn't exist yet). With derive=True, we build the new days from the 1-minute files instead, stopping at the first
+# day that doesn't have a complete 1-minute file (so the summary never has holes).
+# The new rows have to have all the columns the existing file has (so the sources can't be mixed: yfinance has no
+# trade_count or vwap), or we raise a ValueError.
+# We never go past the last session that has closed: a day's bar from during the session is partial, and since the
+# next run starts after the last date in the file, it would never be replaced
+
+def ingest_daily_summary(manifest, end, source='Alpaca', default_start=timestamp('2023-07-01'), derive=False):
+    source = sources[source]
+    end = min(end, last_closed_trading_date())
+    filename = bar_files_path('dailySummary.csv')
+    existing_df = pd.read_csv(filename) if os.path.exists(filename) else pd.DataFrame()
+    start = default_start
+    if len(existing_df) > 0:
+        start = next_trading_date(timestamp(existing_df['date'].max()))
+    if start is None or start > end:
+        return
+    if derive:
+        dates = trading_dates(start, end)
+        complete = [one_minute_details_complete(manifest, report_date) for report_date in dates] + [False]
+        last_complete = complete.index(False)
+        if last_complete == 0:
+            return
+        result_df = build_daily_summary(start, dates[last_complete - 1])
+    else:
+        requests = source['daily_summary_requests'](start, end)
+        results = source['fetcher'].fetch(requests)
+        if len(results) < len(requests):
+            logging.error(f"c=barIngestion a=dailySummary s=failed start={date_string(start)}")
+            return
+        result_df = source['format_daily_summary'](list(results.values()))
+        result_df = result_df[result_df['date'] <= date_string(end)]  # In case the source returns a later bar
+    if len(existing_df) > 0:
+        result_df = result_df.reset_index(drop=False)
+        missing_columns = [column for column in existing_df.columns if column not in result_df.columns]
+        if missing_columns:  # e.g., yfinance rows (no trade_count or vwap) after a summary ingested from Alpaca
+            raise ValueError(f"The new daily summary rows don't have {', '.join(missing_columns)}, which {filename} "
+                             + "has; ingest the daily summary from the same source as before (or rebuild it)")
+        result_df['timestamp'] = result_df['timestamp'].astype(str)
+        result_df = pd.concat([existing_df, result_df[existing_df.columns]])
+        result_df = result_df.set_index(list(existing_df.columns[:2]), drop=True)
+    filename, quality = write_daily_summary(result_df)
+    rows = quality.pop('rows')
+    last_date = str(result_df['date'].max())
+    details = {'derived_from': '1min'} if derive else dict()
+    manifest.record(daily_summary_manifest_key(), filename, rows, True, last_date=last_date, **details, **quality)
+    logging.info(f"c=barIngestion a=dailySummary start={date_string(start)} rows={rows} "
+                 + f"lastDate={last_date}")
+
+
+# The most recent trading date whose session has closed
+
+def last_closed_trading_date():
+    today = timestamp_now().normalize()
+    dates = trading_dates(today - pd.Timedelta('10d'), today)
+    return [date for date in dates if session_has_closed(date)][-1]
+
+
+def run_ingestion(start=None, end=None, freqs=(5,), source='Alpaca', daily_summary=True, force=False, derive=False):
+    end = end if end else last_closed_trading_date()
+    start = start if start else previous_trading_date(end, offset=9)
+    manifest = IngestionManifest()
+    if derive:
+        unaligned = [freq for freq in freqs if 30 % freq != 0]
+        if unaligned:  # Fail before downloading anything (see ReportProcessing/barResampling.py)
+            raise ValueError(f"can't derive freq={unaligned}: the bar size has to divide 30")
+        ingest_intraday_details(manifest, start, end, freq=1, source=source, force=force)
+        for freq in [freq for freq in freqs if freq != 1]:
+            derive_intraday_details(manifest, start, end, freq=freq, force=force)
+        if daily_summary:
+            ingest_daily_summary(manifest, end, source=source, default_start=start, derive=True)
+        return
+    if daily_summary:
+        ingest_daily_summary(manifest, end, source=source)
+    for freq in freqs:
+        ingest_intraday_details(manifest, start, end, freq=freq, source=source, force=force)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch the bar files that are missing or incomplete')
+    parser.add_argument('--source', choices=list(sources.keys()), default='Alpaca')
+    parser.add_argument('--start', default=None, help='first trading date (yyyy-mm-dd)')
+    parser.add_argument('--end', default=None, help='last trading date (yyyy-mm-dd)')
+    parser.add_argument('--freq', type=int, nargs='+', default=[5], help='intraday bar sizes in minutes')
+    parser.add_argument('--stock-set', choices=[s.name for s in StockSet], default=StockSet.SP500.name)
+    parser.add_argument('--skip-daily-summary', action='store_true')
+    parser.add_argument('--force', action='store_true')
+    parser.add_argument('--derive', action='store_true', help='build the --freq bars from 1-minute bars')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    set_stock_set(StockSet[args.stock_set])
+    run_ingestion(start=timestamp(args.start) if args.start else None,
+                  end=timestamp(args.end) if args.end else None,
+                  freqs=args.freq, source=args.source, daily_summary=not args.skip_daily_summary, force=args.force,
+                  derive=args.derive)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# barNormalization cleans up bar files once, when they're written, so the code that reads them (and especially the
+# trading loop) can trust them instead of re-checking every interval.
+#
+# normalize_bars:
+#   - converts the timestamps to New York time (vectorized, whatever offset or time zone they came in with)
+#   - drops duplicate (timestamp, symbol) rows, keeping the first one
+#   - sorts the rows by (timestamp, symbol)
+#   - checks the bars, and reports (but keeps) the problems it finds:
+#       ohlc_errors: bars where low > min(open, close), high < max(open, close), or a price isn't positive
+#       gaps: bars missing between a symbol's first and last bar of the day (intraday details only)
+#
+# The ingestion command records the result in the IngestionManifest with normalized=True. Readers only normalize
+# files that aren't flagged (e.g., files written before we started doing this).
+
+import logging
+
+import pandas as pd
+
+from Util.datesAndTimestamps import session_clocks
+
+
+def normalize_bars(df, freq=None, name='bars'):
+    df = df.reset_index(drop=True)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True).dt.tz_convert('America/New_York')
+    if 'date' in df.columns:
+        df['date'] = df['timestamp'].dt.strftime('%Y-%m-%d')
+    rows = len(df)
+    df = df.drop_duplicates(subset=['timestamp', 'symbol'], keep='first')
+    df = df.sort_values(['timestamp', 'symbol'], kind='stable').reset_index(drop=True)
+
+    quality = {'normalized': True, 'rows': len(df), 'duplicates': rows - len(df), 'ohlc_errors': ohlc_errors(df),
+               'gaps': bar_gaps(df, freq) if freq else 0}
+    if quality['duplicates'] + quality['ohlc_errors'] + quality['gaps'] > 0:
+        logging.warning(f"c=barNormalization a=normalize name={name} rows={quality['rows']} "
+                        + f"duplicates={quality['duplicates']} ohlcErrors={quality['ohlc_errors']} "
+                        + f"gaps={quality['gaps']}")
+    return df, quality
+
+
+def ohlc_errors(df):
+    low_ok = df['low'] <= df[['open', 'close']].min(axis=1)
+    high_ok = df['high'] >= df[['open', 'close']].max(axis=1)
+    positive = (df[['open', 'high', 'low', 'close']] > 0).all(axis=1)
+    return int((~(low_ok & high_ok & positive)).sum())
+
+
+# The number of freq-minute bars missing between each symbol's first and last bar (thinly traded stocks have gaps)
+
+def bar_gaps(df, freq):
+    clocks = pd.Series(session_clocks(df['timestamp']), index=df.index)
+    steps = clocks.groupby(df['symbol'], sort=False).diff().dropna()
+    return int(((steps // freq) - 1).clip(lower=0).sum())
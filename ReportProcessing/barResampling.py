@@ -0,0 +1,83 @@
+# barResampling builds coarser bars (N-minute intraday details and the daily summary) from the 1-minute intraday
+# details, so we only have to download (and store) one resolution, the resolutions always agree, and we can try new
+# bar sizes without re-downloading anything.
+#
+# For each symbol and bar:
+#   open: the open of the first 1-minute bar
+#   high / low: the max high / min low
+#   close: the close of the last 1-minute bar
+#   volume, trade_count: the sums
+#   vwap: the volume-weighted average of the 1-minute vwaps (the plain average if there was no volume)
+#
+# Bars are labelled with the time they start, counted from the market open. So the 5-minute bar for 09:30-09:34 is
+# labelled 09:30, and the 15-minute bar for 09:45-09:59 is labelled 09:45. The traders find the latest bar with
+# most_recent_bar_time, which counts from the top of the clock hour instead. The two only agree when freq divides 30
+# (the market opens at half past), so resample_intraday_details rejects any other freq (e.g., 4, 7, 45, or 60).
+#
+# Note that the daily summary built this way only covers the regular session (the daily bars from Alpaca include
+# some extended-hours activity), so volumes and vwaps can differ slightly from the downloaded dailySummary.csv.
+
+import pandas as pd
+
+from ReportProcessing.intradayDetailReport import read_intraday_details, write_intraday_detail
+from Util.datesAndTimestamps import session_minutes, trading_dates
+
+bar_columns = ['open', 'high', 'low', 'close', 'volume', 'trade_count', 'vwap']
+
+
+# Aggregate the 1-minute bars in details into one bar per (symbol, bar_start). details needs the symbol, timestamp
+# and bar columns; bar_start is a Series (aligned with details) of the labels for the bars
+
+def aggregate_bars(details, bar_start):
+    details = details[['symbol', 'timestamp'] + bar_columns].reset_index(drop=True)
+    details['bar_start'] = bar_start.array
+    details['price_volume'] = details['vwap'] * details['volume']
+    details = details.sort_values(['symbol', 'timestamp'], kind='stable')
+    bars = details.groupby(['symbol', 'bar_start'], sort=True).agg(open=('open', 'first'), high=('high', 'max'),
+                                                                   low=('low', 'min'), close=('close', 'last'),
+                                                                   volume=('volume', 'sum'),
+                                                                   trade_count=('trade_count', 'sum'),
+                                                                   price_volume=('price_volume', 'sum'),
+                                                                   mean_vwap=('vwap', 'mean'))
+    bars['vwap'] = (bars['price_volume'] / bars['volume']).where(bars['volume'] > 0, bars['mean_vwap'])
+    bars = bars.drop(columns=['price_volume', 'mean_vwap']).reset_index(drop=False)
+    return bars.rename(columns={'bar_start': 'timestamp'})
+
+
+# Resample 1-minute intraday details (as returned by read_intraday_details(..., freq=1)) to freq-minute bars, in the
+# intraday detail layout
+
+def resample_intraday_details(one_minute_details, freq=5):
+    if 30 % freq != 0:
+        raise ValueError(f"freq={freq} doesn't divide 30, so its bars wouldn't line up with most_recent_bar_time")
+    minutes = session_minutes(one_minute_details['timestamp'])
+    bar_start = one_minute_details['timestamp'] - pd.to_timedelta(minutes % freq, unit='min')
+    bars = aggregate_bars(one_minute_details, bar_start)
+    return bars.set_index(['symbol', 'timestamp'], drop=False)
+
+
+# Build a daily summary (one bar per symbol per day, labelled with midnight of the date) from 1-minute intraday
+# details, in the dailySummary.csv layout
+
+def resample_daily_summary(one_minute_details):
+    bars = aggregate_bars(one_minute_details, one_minute_details['timestamp'].dt.normalize())
+    bars['date'] = bars['timestamp'].dt.strftime('%Y-%m-%d')
+    return bars.set_index(['symbol', 'timestamp'], drop=True)
+
+
+# Build (and write) the freq-minute intraday detail file for report_date from its 1-minute file. Returns the filename
+# it was written to and the normalization results (see write_intraday_detail)
+
+def build_intraday_detail(report_date, freq=5):
+    bars = resample_intraday_details(read_intraday_details(report_date, freq=1), freq=freq)
+    return write_intraday_detail(bars, report_date, freq=freq)
+
+
+# Build the daily summary rows for the trading dates in [report_start, report_end] from their 1-minute files. We go a
+# day at a time, so we never hold more than one day of 1-minute bars in memory
+
+def build_daily_summary(report_start, report_end=None):
+    report_end = report_end if report_end else report_start
+    daily_bars = [resample_daily_summary(read_intraday_details(report_date, freq=1))
+                  for report_date in trading_dates(report_start, report_end)]
+    return pd.concat(daily_bars)
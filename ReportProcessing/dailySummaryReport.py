@@ -1,7 +1,10 @@
 # dailySummaryReport holds the open, high, low, close, volume, trade_count, and vwap for each day for each stock
 
+import os
 import pandas as pd
 
+from ReportProcessing.barNormalization import normalize_bars
+from ReportProcessing.ingestionManifest import ingestion_manifest, daily_summary_manifest_key
 from Util.pathsAndStockSets import bar_files_path
 
 # The report has these fields:
@@ -15,15 +18,35 @@ from Util.pathsAndStockSets import bar_files_path
 #   trade_count: the number of trades that occurred during this day
 #   vwap: the volume-weighted average price for this day (starting from ?)
 #   date: the date for this entry in the form yyyy-mm-dd
+#
+# The rows are unique and sorted by (timestamp, symbol) (the file is normalized when it's written)
 
 
+# Normalize the rows and write the file atomically (to a temp file, then rename it). df is indexed by (symbol,
+# timestamp). Returns the full path of the file and the normalization results
+
 def write_daily_summary(df):
-    df = df.round(4)
-    df.to_csv(bar_files_path('dailySummary.csv'), index=True)
+    df, quality = normalize_bars(df.reset_index(drop=False), name='dailySummary.csv')
+    df = df.set_index(['symbol', 'timestamp'], drop=True).round(4)
+    filename = bar_files_path('dailySummary.csv')
+    df.to_csv(filename + '.tmp', index=True)
+    os.replace(filename + '.tmp', filename)
+    return filename, quality
+
 
+# Read the daily summary (by default, the current stock set's dailySummary.csv). The manifest only vouches for that
+# file, so any other file is normalized as it's read
 
-def read_daily_summary():
-    daily_price_gains = pd.read_csv(bar_files_path('dailySummary.csv'), parse_dates=['timestamp'])
+def read_daily_summary(filename=None):
+    default_filename = bar_files_path('dailySummary.csv')
+    filename = filename if filename else default_filename
+    daily_price_gains = pd.read_csv(filename)
+    if filename == default_filename and ingestion_manifest().is_normalized(daily_summary_manifest_key()):
+        # The timestamps span DST changes, so they have mixed offsets
+        daily_price_gains['timestamp'] = pd.to_datetime(daily_price_gains['timestamp'], utc=True)
+        daily_price_gains['timestamp'] = daily_price_gains['timestamp'].dt.tz_convert('America/New_York')
+    else:
+        daily_price_gains, _ = normalize_bars(daily_price_gains, name=os.path.basename(filename))
     daily_price_gains.set_index(['timestamp', 'symbol'], drop=False, inplace=True)
     return daily_price_gains
 
@@ -0,0 +1,191 @@
+# The DailySummaryStore holds the daily summary (see dailySummaryReport.py) as NumPy arrays, for lookups that would be
+# slow against the DataFrame from read_daily_summary() (a full boolean mask per symbol in extract_symbol_summary, a
+# MultiIndex .loc per (timestamp, symbol) in extract_daily_summary_bar, a pivot per rolling window).
+#
+# Parsing dailySummary.csv takes a while, so the first load writes the arrays to a binary cache next to it
+# (dailySummary.npz in the bar files folder). After that, loads read the cache, unless dailySummary.csv has changed
+# since (its size and modification time are saved in the cache).
+#
+# The rows are kept symbol-major: sorted by (symbol, date), so each symbol's days are a contiguous slice of every
+# column array, from symbol_offsets[i] to symbol_offsets[i + 1]. Each row also has the position of its date in dates
+# (date_indexes), and a key (symbol index * number of dates + date index) that is sorted, so any number of
+# (timestamp, symbol) pairs are found with a single binary search:
+#   lookup(timestamps, symbols): the rows for (timestamp, symbol) pairs, NaN where a pair isn't in the summary
+#   symbol_summary(symbol): one symbol's rows, like extract_symbol_summary (a slice, no mask)
+#   window(column, end_date, days): the column for the days before end_date, for every symbol (symbol x day)
+#   dense(column): the column as a date x symbol DataFrame (like a pivot of the DataFrame)
+#
+#   store = daily_summary_store()
+#   ranges = store.window('high', trading_date, 5) - store.window('low', trading_date, 5)  # the last 5 days' ranges
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from ReportProcessing.dailySummaryReport import read_daily_summary
+from Util.pathsAndStockSets import bar_files_path
+
+value_columns = ['open', 'high', 'low', 'close', 'volume', 'trade_count', 'vwap']
+
+global_daily_summary_store = None
+
+
+# The store for the current stock set's dailySummary.csv. It's loaded the first time it's needed, and re-loaded if the
+# file changes (or the stock set does)
+
+def daily_summary_store():
+    global global_daily_summary_store
+    filename = bar_files_path('dailySummary.csv')
+    if global_daily_summary_store is None or not global_daily_summary_store.is_current(filename):
+        global_daily_summary_store = DailySummaryStore.load(filename)
+    return global_daily_summary_store
+
+
+def daily_summary_cache_filename(filename):
+    return os.path.splitext(filename)[0] + '.npz'
+
+
+# The (size, modification time) of a file, to tell whether it has changed
+
+def file_signature(filename):
+    stat = os.stat(filename)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+class DailySummaryStore:
+    def __init__(self, symbols, dates, symbol_offsets, date_indexes, columns, source_filename=None,
+                 source_signature=None):
+        self.symbols = symbols  # ndarray of str, sorted
+        self.dates = dates  # DatetimeIndex of the dates in the summary (midnight, NY time), sorted
+        self.symbol_offsets = symbol_offsets  # int64: symbol i's rows are symbol_offsets[i]:symbol_offsets[i + 1]
+        self.date_indexes = date_indexes  # int64: the position in dates of each row's date
+        self.columns = columns  # dict of column name: float64 ndarray (one value per row)
+        self.source_filename = source_filename
+        self.source_signature = source_signature
+        self.date_values = dates.asi8  # int64 nanoseconds, for binary searches
+        self.date_strings = dates.strftime('%Y-%m-%d').to_numpy()  # The date column (yyyy-mm-dd) for each date
+        self.symbol_positions = {symbol: i for i, symbol in enumerate(symbols)}  # str: position in symbols
+        self.row_symbol_indexes = np.repeat(np.arange(len(symbols)), np.diff(symbol_offsets))
+        self.row_keys = self.row_symbol_indexes * len(dates) + date_indexes  # Sorted, since the rows are
+
+    @staticmethod
+    def build(daily_summary, source_filename=None, source_signature=None):
+        daily_summary = daily_summary.reset_index(drop=True).sort_values(['symbol', 'timestamp'], kind='stable')
+        symbols, symbol_codes = np.unique(daily_summary['symbol'].to_numpy(dtype=str), return_inverse=True)
+        dates = pd.DatetimeIndex(daily_summary['timestamp'].dt.normalize().unique()).sort_values()
+        date_indexes = dates.get_indexer(daily_summary['timestamp'].dt.normalize()).astype(np.int64)
+        symbol_offsets = np.concatenate([[0], np.cumsum(np.bincount(symbol_codes, minlength=len(symbols)))])
+        columns = {column: daily_summary[column].to_numpy(dtype=np.float64) for column in value_columns}
+        return DailySummaryStore(symbols, dates, symbol_offsets.astype(np.int64), date_indexes, columns,
+                                 source_filename=source_filename, source_signature=source_signature)
+
+    # Load the store from the binary cache, building (and caching) it from the CSV file if the cache is missing or
+    # out of date
+
+    @staticmethod
+    def load(filename=None):
+        filename = filename if filename else bar_files_path('dailySummary.csv')
+        cache_filename = daily_summary_cache_filename(filename)
+        signature = file_signature(filename)
+        if os.path.exists(cache_filename):
+            with np.load(cache_filename, allow_pickle=False) as cache:
+                if np.array_equal(cache['source_signature'], signature):
+                    dates = pd.DatetimeIndex(cache['date_values'], tz='UTC').tz_convert('America/New_York')
+                    return DailySummaryStore(cache['symbols'], dates, cache['symbol_offsets'], cache['date_indexes'],
+                                             {column: cache[column] for column in value_columns},
+                                             source_filename=filename, source_signature=signature)
+        logging.info(f"c=dailySummaryStore a=build filename={filename}")
+        store = DailySummaryStore.build(read_daily_summary(filename), source_filename=filename,
+                                        source_signature=signature)
+        with open(cache_filename + '.tmp', 'wb') as f:
+            np.savez(f, symbols=store.symbols, date_values=store.date_values, symbol_offsets=store.symbol_offsets,
+                     date_indexes=store.date_indexes, source_signature=signature, **store.columns)
+        os.replace(cache_filename + '.tmp', cache_filename)
+        return store
+
+    def is_current(self, filename):
+        return (filename == self.source_filename and os.path.exists(filename)
+                and np.array_equal(file_signature(filename), self.source_signature))
+
+    # region Positions
+    # The positions of the symbols in symbols (-1 for the ones that aren't in the summary)
+
+    def symbol_indexes(self, symbols):
+        return np.array([self.symbol_positions.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+
+    # The positions of the timestamps' dates in dates (-1 for the ones that aren't in the summary)
+
+    def date_indexes_for(self, timestamps):
+        values = pd.DatetimeIndex(timestamps).tz_convert('America/New_York').normalize().asi8
+        positions = np.searchsorted(self.date_values, values)
+        found = positions < len(self.date_values)
+        found[found] = self.date_values[positions[found]] == values[found]
+        return np.where(found, positions, -1)
+
+    # The rows for each (timestamp, symbol) pair (-1 for the pairs that aren't in the summary)
+
+    def row_indexes(self, timestamps, symbols):
+        symbol_indexes = self.symbol_indexes(symbols)
+        date_indexes = self.date_indexes_for(timestamps)
+        keys = symbol_indexes * len(self.dates) + date_indexes
+        rows = np.minimum(np.searchsorted(self.row_keys, keys), max(len(self.row_keys) - 1, 0))
+        found = (symbol_indexes >= 0) & (date_indexes >= 0) & (self.row_keys[rows] == keys)
+        return np.where(found, rows, -1)
+    # endregion / Positions
+
+    # region Queries
+    # One row per (timestamp, symbol) pair, in the order given: timestamp, symbol, found, and the columns (NaN where the
+    # pair isn't in the summary)
+
+    def lookup(self, timestamps, symbols, columns=None):
+        rows = self.row_indexes(timestamps, symbols)
+        found = rows >= 0
+        result = pd.DataFrame({'timestamp': pd.DatetimeIndex(timestamps), 'symbol': list(symbols), 'found': found})
+        for column in (columns if columns else value_columns):
+            result[column] = np.where(found, self.columns[column][rows], np.nan)
+        return result
+
+    # One symbol's rows, indexed by timestamp (like extract_symbol_summary)
+
+    def symbol_summary(self, symbol):
+        i = self.symbol_positions.get(symbol)
+        first, last = (self.symbol_offsets[i], self.symbol_offsets[i + 1]) if i is not None else (0, 0)
+        timestamps = self.dates[self.date_indexes[first:last]]
+        symbol_summary = pd.DataFrame({'timestamp': timestamps, 'symbol': symbol}, index=timestamps)
+        for column in value_columns:
+            symbol_summary[column] = self.columns[column][first:last]
+        symbol_summary['date'] = self.date_strings[self.date_indexes[first:last]]
+        return symbol_summary
+
+    # The column for the last days dates in the summary before end_date's date (or up to and including it, with
+    # include_end), as a (symbol x day) DataFrame with the oldest day first. A time during the day (e.g., a decision
+    # time) still leaves out that day's own bar. A symbol that is missing one of those days has NaN for it
+    #   symbols: the rows, in this order (default: all the symbols in the summary)
+
+    def window(self, column, end_date, days, symbols=None, include_end=False):
+        symbols = list(symbols) if symbols is not None else list(self.symbols)
+        end_date = pd.Timestamp(end_date).tz_convert('America/New_York').normalize()  # e.g., from a decision time
+        last = np.searchsorted(self.date_values, end_date.value, side='right' if include_end else 'left')
+        date_indexes = np.arange(max(0, last - days), last)
+        values = self.dense_values(column, date_indexes, self.symbol_indexes(symbols))
+        return pd.DataFrame(values.T, index=pd.Index(symbols, name='symbol'), columns=self.dates[date_indexes])
+
+    # The column as a (date x symbol) DataFrame, with NaN where a symbol is missing a day
+
+    def dense(self, column, symbols=None):
+        symbols = list(symbols) if symbols is not None else list(self.symbols)
+        values = self.dense_values(column, np.arange(len(self.dates)), self.symbol_indexes(symbols))
+        return pd.DataFrame(values, index=pd.Index(self.dates, name='timestamp'),
+                            columns=pd.Index(symbols, name='symbol'))
+
+    # The column for the given dates (rows) and symbols (columns) as a 2D ndarray. Each symbol's rows for the dates
+    # are found with a binary search per (date, symbol) cell, all at once
+
+    def dense_values(self, column, date_indexes, symbol_indexes):
+        keys = symbol_indexes[np.newaxis, :] * len(self.dates) + date_indexes[:, np.newaxis]
+        rows = np.minimum(np.searchsorted(self.row_keys, keys), max(len(self.row_keys) - 1, 0))
+        found = (symbol_indexes[np.newaxis, :] >= 0) & (self.row_keys[rows] == keys)
+        return np.where(found, self.columns[column][rows], np.nan)
+    # endregion / Queries
@@ -0,0 +1,140 @@
+# Edge studies: how often is a signal followed by a gain, and how big are the gains? This runs a study across all the
+# symbols at once and over years of history, without holding the history in memory.
+#
+# A study is a function that takes a panel and returns the rows where its signal fired, with a forward return column.
+# A panel is the intraday details for a chunk of days, for all the symbols, sorted by (symbol, timestamp), with a
+# day_group column that numbers each symbol's day. Studies build their columns with the vectorized helpers below:
+#   shifted(panel, column, periods): the column shifted within each symbol's day (so a signal never looks back into
+#       the previous day, or forward into the next one)
+#   forward_return_pct(panel, hold_bars): the gain from buying at the open of the next bar and selling at the close
+#       hold_bars bars later (the way the traders do)
+#
+# run_edge_study() streams the history through the study days_per_chunk days at a time (only one chunk is in memory)
+# and folds each chunk's hits into an EdgeStatistics. EdgeStatistics keeps running totals (count, mean, standard
+# deviation, the rate of gains of at least each threshold) and a histogram of the returns, for each group (e.g., each
+# time of day), so its summary (including the return percentiles) never needs the individual hits. Pass a hits_sink
+# (a resultSink.ResultSink) to also stream the hits to disk as they're found.
+#
+#   statistics = run_edge_study(my_study, timestamp('2022-01-03'), timestamp('2024-05-31'),
+#                               statistics=EdgeStatistics(group_by=['time']))
+#   statistics.summary().to_csv(temp_files_path('my_study.csv'))
+
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from ReportProcessing.intradayDetailReport import read_intraday_details
+from TradingApis.barFetcher import chunked
+from Util.datesAndTimestamps import trading_dates, date_string
+
+
+# region Panels
+# The intraday details from first_date to last_date, as a panel (see above)
+
+def read_panel(first_date, last_date, freq=5, symbols=None):
+    panel = read_intraday_details(first_date, last_date, freq=freq).reset_index(drop=True)
+    if symbols:
+        panel = panel[panel['symbol'].isin(symbols)]
+    panel = panel.sort_values(['symbol', 'timestamp'], kind='stable').reset_index(drop=True)
+    panel['day_group'] = panel.groupby(['symbol', 'date'], sort=False).ngroup()
+    return panel
+
+
+def panel_chunks(start, end, days_per_chunk=20, freq=5, symbols=None):
+    for dates in chunked(trading_dates(start, end), days_per_chunk):
+        yield read_panel(dates[0], dates[-1], freq=freq, symbols=symbols)
+
+
+# The column shifted by periods rows (a positive periods looks back; a negative one looks forward), NaN where that
+# would cross into another group. The panel has to be sorted by group (read_panel sorts by symbol and timestamp)
+
+def shifted(panel, column, periods, group_column='day_group'):
+    same_group = panel[group_column].shift(periods) == panel[group_column]
+    return panel[column].shift(periods).where(same_group)
+
+
+def forward_return_pct(panel, hold_bars, entry_bars=1, exit_column='close', group_column='day_group'):
+    exit_price = shifted(panel, exit_column, -hold_bars, group_column)
+    return 100 * (exit_price / shifted(panel, 'open', -entry_bars, group_column) - 1)
+# endregion / Panels
+
+
+# region Statistics
+# The name of the hit-rate column for gains of at least threshold percent
+
+def gain_column(threshold):
+    return f"gain_{round(10 * threshold):02d}"  # e.g., gain_05 for 0.5%
+
+
+class EdgeStatistics:
+    def __init__(self, return_column='gain_pct', group_by=None, thresholds=(0.0, 0.5, 1.0), bin_width=0.05,
+                 max_abs_pct=20.0):
+        self.return_column = return_column
+        self.group_by = group_by  # list of column names, or None for a single 'all' group
+        self.thresholds = thresholds
+        self.edges = np.arange(-max_abs_pct, max_abs_pct + bin_width / 2, bin_width)  # Outliers go in the end bins
+        self.totals = None  # DataFrame indexed by group: count, sum, sum_sq, and a gain_xx count per threshold
+        self.histogram = None  # DataFrame indexed by group, with the number of returns in each bin
+
+    def update(self, hits):
+        hits = hits[hits[self.return_column].notna()]
+        if len(hits) == 0:
+            return
+        returns = hits[self.return_column]
+        if self.group_by:
+            keys = [hits[column] for column in self.group_by]
+        else:
+            keys = [pd.Series('all', index=hits.index, name='group')]
+        frame = pd.DataFrame({'count': 1, 'sum': returns, 'sum_sq': returns ** 2}, index=hits.index)
+        for threshold in self.thresholds:
+            frame[gain_column(threshold)] = (returns >= threshold).astype(int)
+        totals = frame.groupby(keys).sum()
+        bins = np.clip(np.digitize(returns.to_numpy(), self.edges), 1, len(self.edges) - 1)
+        histogram = pd.crosstab(keys, pd.Series(bins, index=hits.index, name='bin'))
+        self.totals = totals if self.totals is None else self.totals.add(totals, fill_value=0)
+        self.histogram = histogram if self.histogram is None else self.histogram.add(histogram, fill_value=0)
+
+    # One row per group: count, mean_gain_pct, std_gain_pct, the rate for each threshold (0.0 to 1.0), and the
+    # 10th/50th/90th percentile returns (to within a bin)
+
+    def summary(self):
+        if self.totals is None:
+            return pd.DataFrame()
+        totals = self.totals
+        summary = pd.DataFrame({'count': totals['count'].astype(int)}, index=totals.index)
+        summary['mean_gain_pct'] = totals['sum'] / totals['count']
+        variance = (totals['sum_sq'] - totals['count'] * summary['mean_gain_pct'] ** 2) / (totals['count'] - 1)
+        summary['std_gain_pct'] = np.sqrt(variance.clip(lower=0))
+        for threshold in self.thresholds:
+            summary[gain_column(threshold)] = totals[gain_column(threshold)] / totals['count']
+        histogram = self.histogram.reindex(columns=range(1, len(self.edges)), fill_value=0).loc[totals.index]
+        cumulative = histogram.cumsum(axis=1).to_numpy() / totals['count'].to_numpy()[:, np.newaxis]
+        midpoints = (self.edges[:-1] + self.edges[1:]) / 2
+        for fraction in [0.1, 0.5, 0.9]:
+            summary[f"p{round(100 * fraction)}_gain_pct"] = midpoints[(cumulative < fraction).sum(axis=1)]
+        return summary.round(4).reset_index(drop=False)
+# endregion / Statistics
+
+
+# Run study over the trading dates from start to end, days_per_chunk days at a time. Returns the EdgeStatistics
+#   panels: the panels to run the study over, instead of panel_chunks(start, end, ...) (e.g.,
+#       featureStore.feature_panel_chunks, for panels that include stored features)
+
+def run_edge_study(study, start, end, statistics=None, days_per_chunk=20, freq=5, symbols=None, hits_sink=None,
+                   panels=None):
+    statistics = statistics if statistics else EdgeStatistics()
+    panels = panels if panels else panel_chunks(start, end, days_per_chunk=days_per_chunk, freq=freq, symbols=symbols)
+    for panel in panels:
+        chunk_start = time.perf_counter()
+        hits = study(panel)
+        statistics.update(hits)
+        if hits_sink:
+            hits_sink.append(hits)
+        logging.info(f"c=edgeStudy a=chunk study={getattr(study, '__name__', 'study')} "
+                     + f"first={date_string(panel['timestamp'].min())} last={date_string(panel['timestamp'].max())} "
+                     + f"rows={len(panel)} hits={len(hits)} seconds={round(time.perf_counter() - chunk_start, 3)}")
+    if hits_sink:
+        hits_sink.close()
+    return statistics
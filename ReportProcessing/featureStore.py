@@ -0,0 +1,193 @@
+# The feature store keeps the per-bar signals that the studies and traders use (the trigger and gain percentages, the
+# Higher Highs; Higher Lows columns, ...) in DerivedFiles, so they are computed once per (date, freq) instead of from
+# the raw bars in every script and every run.
+#
+# A FeatureDefinition has a name, a version, the columns it produces, and a compute function that takes a one-day panel
+# (see edgeStudy.read_panel) and the bar size, and returns those columns. Each day's features are stored as a Parquet
+# file with the timestamp, the symbol, and the feature columns:
+#   DerivedFiles/FeatureStore/{name}_v{version}/{name}_{freq}min_{yyyy-mm-dd}.parquet
+# Bump a definition's version whenever its compute function changes: the new version gets its own folder, so stale
+# features are never read. A day is also recomputed when its bar file is newer than its feature file (e.g., after the
+# bars are re-ingested).
+#
+# load_features() computes any days that are missing, and only reads the requested symbols and columns from the
+# Parquet files. feature_panel_chunks() gives edge studies the raw bar panels with the stored features merged in.
+#
+# The features are computed one day at a time, so the shifts never cross from one day into the next: the first and
+# last bars of each day have NaN for the look-back and forward-return columns.
+#
+# Compute the features ahead of time (from the repository root):
+#   python -m ReportProcessing.featureStore --features fastFollower hhhl --start 2023-12-01 --end 2024-05-31
+
+import argparse
+import logging
+import os
+
+import pandas as pd
+
+from ReportProcessing.edgeStudy import read_panel, panel_chunks, shifted, forward_return_pct
+from ReportProcessing.intradayDetailReport import intraday_detail_filename
+from Util.datesAndTimestamps import timestamp, trading_dates, date_string
+from Util.pathsAndStockSets import StockSet, set_stock_set, bar_files_path, derived_files_path
+
+
+class FeatureDefinition:
+    def __init__(self, name, version, columns, compute):
+        self.name = name
+        self.version = version
+        self.columns = columns
+        self.compute = compute  # callable(panel, freq) -> DataFrame with the columns (same index as panel)
+
+    def folder(self):
+        return derived_files_path(f"FeatureStore/{self.name}_v{self.version}/")
+
+    def filename(self, report_date, freq=5):
+        return self.folder() + f"{self.name}_{freq}min_{date_string(report_date)}.parquet"
+
+
+# region Feature definitions
+# The number of bars that span the given minutes. The features are defined in minutes, so they mean the same thing for
+# every bar size, which has to divide each of those windows evenly
+
+def minutes_to_bars(minutes, freq):
+    if minutes % freq != 0:
+        raise ValueError(f"A {minutes}-minute window isn't a whole number of {freq}-minute bars")
+    return minutes // freq
+
+
+# Fast Follower: how much each stock gained over the last 5, 10, and 15 minutes (the triggers), and the gain from
+# buying at the next open and selling at the close 15 minutes later
+
+def fast_follower_features(panel, freq):
+    features = pd.DataFrame(index=panel.index)
+    features['decision_time'] = (panel['timestamp'] + pd.Timedelta(minutes=freq)).dt.strftime('%H:%M:%S')
+    for minutes in [15, 10, 5]:  # From the open minutes ago (the open of the bar minutes_to_bars - 1 bars back)
+        features[f"trigger_last_{minutes:02d}_pct"] = 100 * (
+            panel['close'] / shifted(panel, 'open', minutes_to_bars(minutes, freq) - 1) - 1)
+    features['gain_pct'] = forward_return_pct(panel, minutes_to_bars(15, freq))  # close of the bar ending 15 min later
+    features['gain_00'] = features['gain_pct'] >= 0  # Did we break even?
+    features['gain_05'] = features['gain_pct'] >= 0.5  # Did we gain at least 0.5%
+    features['gain_10'] = features['gain_pct'] >= 1.0  # Did we gain at least 1.0%
+    return features
+
+
+# Higher Highs; Higher Lows: the changes in the highs and lows over the last three bars (the pattern is in bars, so it
+# spans 15 minutes of 5-minute bars but 3 minutes of 1-minute bars), and the profit from buying at the next open and
+# selling at the open 10 minutes later (the hold in edgeExamplesForArticle3)
+
+def hhhl_features(panel, freq):
+    high_1, low_1 = shifted(panel, 'high', 1), shifted(panel, 'low', 1)
+    high_2, low_2 = shifted(panel, 'high', 2), shifted(panel, 'low', 2)
+    features = pd.DataFrame(index=panel.index)
+    features['decision_time'] = (panel['timestamp'] + pd.Timedelta(minutes=freq)).dt.strftime('%H:%M:%S')
+    features['high_pct_2'] = 100 * (high_1 / high_2 - 1)
+    features['high_pct_1'] = 100 * (panel['high'] / high_1 - 1)
+    features['low_pct_2'] = 100 * (low_1 / low_2 - 1)
+    features['low_pct_1'] = 100 * (panel['low'] / low_1 - 1)
+    features['score'] = (features['high_pct_1'] + features['high_pct_2'] + features['low_pct_1']
+                         + features['low_pct_2'])
+    features['high_to_close'] = 100 * (panel['high'] / panel['close'] - 1)
+    features['hhhl_trigger'] = ((features['high_pct_1'] > 0) & (features['high_pct_2'] > 0)
+                                & (features['low_pct_1'] > 0) & (features['low_pct_2'] > 0))
+    # We buy at the next bar's open, so the open 10 minutes later is 10 minutes' worth of bars after that one
+    features['profit_pct'] = forward_return_pct(panel, minutes_to_bars(10, freq) + 1, exit_column='open')
+    return features
+
+
+feature_definitions = {
+    'fastFollower': FeatureDefinition('fastFollower', 2,
+                                      ['decision_time', 'trigger_last_15_pct', 'trigger_last_10_pct',
+                                       'trigger_last_05_pct', 'gain_pct', 'gain_00', 'gain_05', 'gain_10'],
+                                      fast_follower_features),
+    'hhhl': FeatureDefinition('hhhl', 2,
+                              ['decision_time', 'high_pct_2', 'high_pct_1', 'low_pct_2', 'low_pct_1', 'score',
+                               'high_to_close', 'hhhl_trigger', 'profit_pct'],
+                              hhhl_features),
+}
+# endregion / Feature definitions
+
+
+# A day's features are current if they were written after its bar file
+
+def features_are_current(definition, report_date, freq=5):
+    filename = definition.filename(report_date, freq=freq)
+    if not os.path.exists(filename):
+        return False
+    return os.path.getmtime(filename) >= os.path.getmtime(bar_files_path(intraday_detail_filename(report_date, freq)))
+
+
+# Compute and store the features for each trading date from start to end that doesn't have current features (or all of
+# them with force). Returns the number of days computed
+
+def materialize_features(name, start, end=None, freq=5, force=False):
+    definition = feature_definitions[name]
+    computed = 0
+    for report_date in trading_dates(start, end if end else start):
+        if not force and features_are_current(definition, report_date, freq=freq):
+            continue
+        panel = read_panel(report_date, report_date, freq=freq)
+        features = definition.compute(panel, freq)[definition.columns]
+        features.insert(0, 'symbol', panel['symbol'])
+        features.insert(0, 'timestamp', panel['timestamp'])
+        filename = definition.filename(report_date, freq=freq)
+        os.makedirs(definition.folder(), exist_ok=True)
+        features.to_parquet(filename + '.tmp', index=False)  # You may need to pip install pyarrow
+        os.replace(filename + '.tmp', filename)
+        computed += 1
+    if computed > 0:
+        logging.info(f"c=featureStore a=materialize name={name} v={definition.version} freq={freq} "
+                     + f"start={date_string(start)} end={date_string(end if end else start)} days={computed}")
+    return computed
+
+
+# The stored features (timestamp, symbol, and the columns, or all the definition's columns) from start to end,
+# computing any days that are missing. With symbols, only those symbols' rows are read
+
+def load_features(name, start, end=None, freq=5, symbols=None, columns=None):
+    definition = feature_definitions[name]
+    end = end if end else start
+    materialize_features(name, start, end, freq=freq)
+    read_columns = ['timestamp', 'symbol'] + (list(columns) if columns else definition.columns)
+    filters = [('symbol', 'in', list(symbols))] if symbols else None
+    daily_features = [pd.read_parquet(definition.filename(report_date, freq=freq), columns=read_columns,
+                                      filters=filters)
+                      for report_date in trading_dates(start, end)]
+    features = pd.concat(daily_features, ignore_index=True)
+    features['timestamp'] = features['timestamp'].dt.tz_convert('America/New_York')
+    return features
+
+
+# Like edgeStudy.panel_chunks, with the named features merged in (columns the panel already has are left as they are)
+
+def feature_panel_chunks(names, start, end, days_per_chunk=20, freq=5, symbols=None):
+    for panel in panel_chunks(start, end, days_per_chunk=days_per_chunk, freq=freq, symbols=symbols):
+        first_date, last_date = panel['timestamp'].min().normalize(), panel['timestamp'].max().normalize()
+        for name in names:
+            features = load_features(name, first_date, last_date, freq=freq, symbols=symbols)
+            features = features[['timestamp', 'symbol'] + [column for column in features.columns
+                                                           if column not in panel.columns]]
+            panel = panel.merge(features, on=['timestamp', 'symbol'], how='left')
+        yield panel
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute the stored features that are missing or out of date')
+    parser.add_argument('--features', nargs='+', choices=list(feature_definitions.keys()),
+                        default=list(feature_definitions.keys()))
+    parser.add_argument('--start', required=True, help='first trading date (yyyy-mm-dd)')
+    parser.add_argument('--end', default=None, help='last trading date (yyyy-mm-dd)')
+    parser.add_argument('--freq', type=int, nargs='+', default=[5], help='intraday bar sizes in minutes')
+    parser.add_argument('--stock-set', choices=[s.name for s in StockSet], default=StockSet.SP500.name)
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    set_stock_set(StockSet[args.stock_set])
+    for name in args.features:
+        for freq in args.freq:
+            materialize_features(name, timestamp(args.start), timestamp(args.end) if args.end else None, freq=freq,
+                                 force=args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# The ingestion manifest records which bar files we have already downloaded, so the ingestion command only fetches the
+# days that are missing (or incomplete) instead of re-requesting everything.
+#
+# It's a JSON file (ingestionManifest.json in the bar files folder) holding one entry per file:
+#   key: 'intradayDetail_{freq}min_{yyyy-mm-dd}' or 'dailySummary'
+#   rows: the number of rows written
+#   checksum: sha256 of the file contents
+#   complete: whether the file had all the rows we expected when we wrote it
+#   written_at: when the file was written
+#   normalized: whether the file was normalized when it was written (see ReportProcessing/barNormalization.py)
+#   plus optional details (e.g., last_date for the daily summary)
+#
+# Readers use ingestion_manifest(), which keeps the manifest loaded between calls and re-reads it when the file changes
+# (e.g., after an ingestion run records new files). The ingestion command makes its own IngestionManifest to write to
+
+import datetime as dt
+import hashlib
+import json
+import os
+
+from Util.pathsAndStockSets import bar_files_path
+
+global_ingestion_manifest = None
+global_ingestion_manifest_signature = None
+
+
+def intraday_manifest_key(date_str, freq):
+    return f"intradayDetail_{freq}min_{date_str}"
+
+
+def daily_summary_manifest_key():
+    return 'dailySummary'
+
+
+# Write text (or bytes) to filename atomically: write a temp file and rename it, so readers never see a partial file
+
+def write_file_atomically(filename, contents):
+    mode = 'wb' if isinstance(contents, bytes) else 'w'
+    with open(filename + '.tmp', mode) as f:
+        f.write(contents)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(filename + '.tmp', filename)
+
+
+def file_checksum(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# The manifest for the current stock set's bar files folder. It's loaded the first time it's needed, and re-loaded if
+# the file changes (or the stock set does)
+
+def ingestion_manifest():
+    global global_ingestion_manifest, global_ingestion_manifest_signature
+    filename = bar_files_path('ingestionManifest.json')
+    signature = manifest_signature(filename)
+    if (global_ingestion_manifest is None or global_ingestion_manifest.filename != filename
+            or global_ingestion_manifest_signature != signature):
+        global_ingestion_manifest = IngestionManifest(filename)
+        global_ingestion_manifest_signature = signature
+    return global_ingestion_manifest
+
+
+# The (size, modification time) of the manifest file, to tell whether it has changed (None if there's no file yet)
+
+def manifest_signature(filename):
+    if not os.path.exists(filename):
+        return None
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class IngestionManifest:
+    def __init__(self, filename=None):
+        self.filename = filename if filename else bar_files_path('ingestionManifest.json')
+        self.entries = dict()  # key: dict of entry details
+        if os.path.exists(self.filename):
+            with open(self.filename, 'r') as f:
+                self.entries = json.load(f)
+
+    def entry(self, key):
+        return self.entries.get(key)
+
+    # A file is complete if we recorded it as complete and it's still on disk. With verify=True, we also recompute
+    # the checksum to make sure the file hasn't changed since we wrote it
+
+    def is_complete(self, key, filename, verify=False):
+        entry = self.entries.get(key)
+        if not entry or not entry['complete'] or not os.path.exists(filename):
+            return False
+        return (not verify) or (file_checksum(filename) == entry['checksum'])
+
+    # Readers can skip normalizing files that were normalized when they were written
+
+    def is_normalized(self, key):
+        entry = self.entries.get(key)
+        return bool(entry and entry.get('normalized'))
+
+    def record(self, key, filename, rows, complete, **details):
+        self.entries[key] = {'rows': int(rows), 'checksum': file_checksum(filename), 'complete': bool(complete),
+                             'written_at': dt.datetime.now().isoformat(timespec='seconds'), **details}
+        self.save()
+
+    def save(self):
+        write_file_atomically(self.filename, json.dumps(self.entries, indent=1, sort_keys=True))
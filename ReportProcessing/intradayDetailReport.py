@@ -1,8 +1,11 @@
 # intradayDetailReport holds the open, high, low, close, volume, trade_count, and vwap for each 5 minutes for each stock
 
+import os
 import pandas as pd
 
-from Util.datesAndTimestamps import date_string, trading_dates
+from ReportProcessing.barNormalization import normalize_bars
+from ReportProcessing.ingestionManifest import ingestion_manifest, intraday_manifest_key
+from Util.datesAndTimestamps import date_string, trading_dates, session_minutes, session_clocks
 from Util.pathsAndStockSets import bar_files_path
 
 
@@ -11,6 +14,8 @@ from Util.pathsAndStockSets import bar_files_path
 #   symbol (index): the stock symbol for this entry
 #   date: the date for this entry in the form yyyy-mm-dd (not saved in file)
 #   time: the time for the start of the 5-minute window in the form hh:mm:ss (not saved in file)
+#   session_minute: minutes from the market open to the start of the window (not saved in file)
+#   session_clock: integer session clock for the start of the window (not saved in file)
 #   open: the open price for this stock on for this window
 #   high: the highest price for this stock during this window
 #   low: the lowest price for this stock during this window
@@ -19,29 +24,44 @@ from Util.pathsAndStockSets import bar_files_path
 #   trade_count: the number of trades that occurred during this window
 #   vwap: the volume-weighted average price for this window
 
-# The DataFrame for this report has all the same columns and the index is (timestamp, symbol)
+# The DataFrame for this report has all the same columns and the index is (timestamp, symbol). The (timestamp, symbol)
+# keys are unique and sorted (the files are normalized when they're written)
 
 
 def intraday_detail_filename(report_start, freq=5):
     return f"intradayDetail_{freq}min_{date_string(report_start)}.csv"
 
 
+# Normalize the bars and write the file atomically (to a temp file, then rename it), so a crash never leaves a partial
+# file behind. Returns the full path of the file and the normalization results (rows, duplicates, ohlc_errors, gaps)
+
 def write_intraday_detail(df, report_start, freq=5):
+    filename = bar_files_path(intraday_detail_filename(report_start, freq=freq))
+    df, quality = normalize_bars(df, freq=freq, name=intraday_detail_filename(report_start, freq=freq))
     df = df.round(4)
-    filename = intraday_detail_filename(report_start, freq=freq)
-    df.to_csv(bar_files_path(filename), index=False)
+    df.to_csv(filename + '.tmp', index=False)
+    os.replace(filename + '.tmp', filename)
+    return filename, quality
 
 
 def read_intraday_details(report_start, report_end=None, freq=5):
     report_end = report_end if report_end else report_start  # If there's no report_end, we just look at one day
+    manifest = ingestion_manifest()
     daily_details = list()  # list of DataFrame
     for report_date in trading_dates(report_start, report_end):
         filename = intraday_detail_filename(report_date, freq=freq)
         single_day_details = pd.read_csv(bar_files_path(filename), parse_dates=['timestamp'])
+        if manifest.is_normalized(intraday_manifest_key(date_string(report_date), freq)):
+            # The file has a fixed UTC offset; switch to New York time so days on either side of a DST change combine
+            single_day_details['timestamp'] = single_day_details['timestamp'].dt.tz_convert('America/New_York')
+        else:
+            single_day_details, _ = normalize_bars(single_day_details, freq=freq, name=filename)
         daily_details.append(single_day_details)
     intraday_details = pd.concat(daily_details)
-    intraday_details['date'] = intraday_details['timestamp'].map(lambda d: str(d)[:10])
-    intraday_details['time'] = intraday_details['timestamp'].map(lambda d: str(d)[11:19])
+    intraday_details['date'] = intraday_details['timestamp'].dt.strftime('%Y-%m-%d')
+    intraday_details['time'] = intraday_details['timestamp'].dt.strftime('%H:%M:%S')
+    intraday_details['session_minute'] = session_minutes(intraday_details['timestamp'])
+    intraday_details['session_clock'] = session_clocks(intraday_details['timestamp'])
     intraday_details.set_index(['timestamp', 'symbol'], drop=False, inplace=True)
     return intraday_details
 
@@ -0,0 +1,142 @@
+# The ResultSink streams a study's results to disk as they are produced, instead of collecting every day's DataFrame
+# in a list and writing one big CSV at the end. Memory stays bounded (at most max_buffered_rows rows are held), the
+# results survive a crash, and the results so far can be read while the study is still running.
+#
+# The results go to a folder (e.g., temp_files_path('fast_follower_results')) as a sequence of part files:
+#   {folder}/part-000001.parquet, {folder}/part-000002.parquet, ...
+# or, with a partition_column (e.g., 'date'), one sub-folder per value:
+#   {folder}/date=2024-06-03/part-000001.parquet, ...
+# Each part is written to a hidden temp file and then renamed, so readers only ever see complete parts.
+#
+# With truncate (the default), the parts from a previous run are deleted first. To protect against a wrong folder
+# argument, the sink refuses (with a ValueError) to delete a folder that holds anything other than part files and
+# partition folders of part files. Without truncate, the new parts are numbered after the ones already there.
+#
+#   sink = ResultSink(temp_files_path('fast_follower_results'), partition_column='date')
+#   for ts in trading_dates(...):
+#       sink.append(test)
+#   sink.close(csv_filename=temp_files_path('fast_follower_results.csv'))  # optional: also export one CSV
+#
+#   read_results(temp_files_path('fast_follower_results'), partitions=['2024-06-03'])  # from another process
+
+import glob
+import os
+import re
+import shutil
+
+import pandas as pd
+
+part_file_pattern = re.compile(r'\.?part-(\d+)\.(parquet|csv|tmp)')
+
+
+class ResultSink:
+    def __init__(self, folder, partition_column=None, file_format='parquet', max_buffered_rows=0, round_digits=4,
+                 truncate=True):
+        self.folder = folder
+        self.partition_column = partition_column
+        self.file_format = file_format  # 'parquet' or 'csv'
+        self.max_buffered_rows = max_buffered_rows  # 0 to write every append right away; None to wait for flush()
+        self.round_digits = round_digits
+        self.buffer = list()  # list of DataFrame
+        self.buffered_rows = 0
+        if truncate and os.path.exists(folder):
+            check_result_folder(folder)
+            shutil.rmtree(folder)
+        os.makedirs(folder, exist_ok=True)
+        self.part_number = last_part_number(folder)  # Keep numbering after the parts that are already there
+        self.rows_written = 0
+
+    def append(self, df):
+        if len(df) == 0:
+            return
+        self.buffer.append(df)
+        self.buffered_rows += len(df)
+        if self.max_buffered_rows is not None and self.buffered_rows >= self.max_buffered_rows:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        df = pd.concat(self.buffer, ignore_index=True)
+        if self.round_digits is not None:
+            df = df.round(self.round_digits)
+        if self.partition_column:
+            for value, partition in df.groupby(self.partition_column, sort=True):
+                self.write_part(partition, os.path.join(self.folder, f"{self.partition_column}={value}"))
+        else:
+            self.write_part(df, self.folder)
+        self.rows_written += len(df)
+        self.buffer = list()
+        self.buffered_rows = 0
+
+    def write_part(self, df, folder):
+        self.part_number += 1
+        os.makedirs(folder, exist_ok=True)
+        filename = os.path.join(folder, f"part-{self.part_number:06d}.{self.file_format}")
+        temp_filename = os.path.join(folder, f".part-{self.part_number:06d}.tmp")
+        if self.file_format == 'parquet':
+            df.to_parquet(temp_filename, index=False)  # You may need to pip install pyarrow
+        else:
+            df.to_csv(temp_filename, index=False)
+        os.replace(temp_filename, filename)
+
+    # Write out what's left, and optionally export all the results to a single CSV (one part at a time)
+
+    def close(self, csv_filename=None):
+        self.flush()
+        if csv_filename:
+            export_csv(self.folder, csv_filename)
+
+
+# Raise a ValueError unless everything in folder is a part file (or a leftover temp part), or a partition folder that
+# only holds those
+
+def check_result_folder(folder):
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if os.path.isdir(path) and '=' in name:
+            check_result_folder(path)
+        elif not (os.path.isfile(path) and part_file_pattern.fullmatch(name)):
+            raise ValueError(f"{folder} holds {name}, which isn't a result part; not deleting it")
+
+
+# The highest part number in a folder (0 if there aren't any parts)
+
+def last_part_number(folder):
+    numbers = [int(part_file_pattern.fullmatch(os.path.basename(filename)).group(1))
+               for filename in result_parts(folder)]
+    return max(numbers, default=0)
+
+
+# The complete part files in a folder (optionally just the given partition values), in the order they were written
+
+def result_parts(folder, partitions=None):
+    filenames = glob.glob(os.path.join(folder, 'part-*.*')) + glob.glob(os.path.join(folder, '*=*', 'part-*.*'))
+    if partitions is not None:
+        partitions = set(str(partition) for partition in partitions)
+        filenames = [filename for filename in filenames
+                     if os.path.basename(os.path.dirname(filename)).split('=', 1)[-1] in partitions]
+    return sorted(filenames, key=os.path.basename)
+
+
+def read_part(filename, columns=None):
+    if filename.endswith('.parquet'):
+        return pd.read_parquet(filename, columns=columns)
+    return pd.read_csv(filename, usecols=columns)
+
+
+# The results written so far (safe to call while the study is still running)
+
+def read_results(folder, partitions=None, columns=None):
+    parts = [read_part(filename, columns=columns) for filename in result_parts(folder, partitions=partitions)]
+    return pd.concat(parts, ignore_index=True) if len(parts) > 0 else pd.DataFrame()
+
+
+def export_csv(folder, csv_filename):
+    first_part = True
+    for filename in result_parts(folder):
+        read_part(filename).to_csv(csv_filename + '.tmp', mode='w' if first_part else 'a', header=first_part,
+                                   index=False)
+        first_part = False
+    if not first_part:
+        os.replace(csv_filename + '.tmp', csv_filename)
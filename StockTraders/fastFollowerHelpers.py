@@ -1,11 +1,19 @@
 # Helper functions for the Fast Followers trading strategy.
-# TODO: Also refactor edgeExamplesForArticle3 to use this, instead of inline functions
 
+import logging
+import math
+
+import numpy as np
 import pandas as pd
 
-from ReportProcessing.intradayDetailReport import read_intraday_details, extract_symbol_details
+from ReportProcessing.dailySummaryStore import daily_summary_store
+from ReportProcessing.edgeStudy import shifted, forward_return_pct
+from ReportProcessing.featureStore import load_features
+from ReportProcessing.intradayDetailReport import read_intraday_details
+from TradingApis.barFetcher import chunked
+from Util.memoryAccounting import record_size, fits_in_budget, available_bytes
 from Util.pathsAndStockSets import get_symbols
-from Util.datesAndTimestamps import previous_trading_date, time_string
+from Util.datesAndTimestamps import previous_trading_date, date_string
 
 
 # Get the set of trading pairs for Fast Follower that satisfies the filter criteria
@@ -17,19 +25,74 @@ from Util.datesAndTimestamps import previous_trading_date, time_string
 #   min_count: when filtering trading pairs, we only consider pairs that appeared at least this many times
 #   mean_gain_pct: we only consider pairs where the average gain was at least this
 #   success_rate_05: we only consider pairs where the dependent stock gained 0.5% at least this rate (0.0 to 1.0)
+#   from_feature_store: read the training values from the stored fastFollower features (computed a day at a time, so
+#       the shifts don't cross days) instead of computing them from the bars. Only for an effect_window of 15
+#   prefilter_top_k: if provided, only consider the prefilter_top_k dependent symbols whose daily returns moved most
+#       like each independent symbol's over the prefilter_days trading days before trading_date (see
+#       co_movement_candidates). The intraday statistics are only computed for those pairs, so it's much faster, but
+#       it can miss pairs (AdHoc/pairPrefilterRecall.py reports how many)
 
 def get_trading_pairs(trading_date, symbol_subset=None, lookback_window=10, effect_window=15,
-                      trigger_pct=1.0, min_count=5, mean_gain_pct=0.5, success_rate_05=0.666):
-    train_details = read_intraday_details(previous_trading_date(trading_date, offset=lookback_window),
-                                          previous_trading_date(trading_date))  # 2 weeks
+                      trigger_pct=1.0, min_count=5, mean_gain_pct=0.5, success_rate_05=0.666, from_feature_store=False,
+                      prefilter_top_k=None, prefilter_days=60):
+    first_date = previous_trading_date(trading_date, offset=lookback_window)
+    last_date = previous_trading_date(trading_date)  # 2 weeks
+    if from_feature_store:
+        if effect_window != 15:
+            raise ValueError(f"The stored fastFollower features have an effect_window of 15, not {effect_window}")
+        training_set = load_features('fastFollower', first_date, last_date,
+                                     symbols=symbol_subset if symbol_subset else get_symbols()).dropna()
+    else:
+        train_details = read_intraday_details(first_date, last_date)
+        record_size('tradingPairsTrainDetails', train_details)
 
-    # Compute the training values
-    training_set = compute_trigger_and_effect_df(train_details, symbol_subset=symbol_subset,
-                                                 effect_window=effect_window)
+        # Compute the training values
+        training_set = compute_trigger_and_effect_df(train_details, symbol_subset=symbol_subset,
+                                                     effect_window=effect_window)
+    training_bytes = record_size('tradingPairsTrainingSet', training_set)
 
-    # Compute expected gain for each trigger
+    # Compute expected gain for each trigger. The cross-join (every trigger with every stock at the same timestamp) is
+    # by far the biggest intermediate, so if it won't fit in the memory budget, we do it for a chunk of independent
+    # symbols at a time. Each chunk has its own (independent, dependent) pairs, so the results are the same
     triggers = training_set[training_set['trigger_last_15_pct'] >= trigger_pct]
-    cross_join = triggers.merge(training_set, on='timestamp')
+    cross_join_bytes = estimated_cross_join_bytes(triggers, training_set, training_bytes)
+    candidate_pairs = None
+    if prefilter_top_k:
+        # Each trigger is only joined with (at most) prefilter_top_k dependents, instead of every symbol
+        symbols = training_set['symbol'].unique()
+        candidate_pairs = co_movement_candidates(trading_date, symbols, top_k=prefilter_top_k, days=prefilter_days)
+        cross_join_bytes = cross_join_bytes * min(1.0, prefilter_top_k / max(len(symbols), 1))
+    record_size('tradingPairsCrossJoin', int(cross_join_bytes))
+    chunk_count = 1
+    if not fits_in_budget(cross_join_bytes):
+        chunk_count = math.ceil(cross_join_bytes / max(available_bytes(), 1))
+        logging.info(f"c=fastFollower a=getTradingPairs s=chunked date={date_string(trading_date)} "
+                     + f"crossJoinMb={round(cross_join_bytes / 2 ** 20, 1)} chunks={chunk_count}")
+    independent_symbols = triggers['symbol'].unique()
+    chunk_size = max(1, math.ceil(len(independent_symbols) / chunk_count))
+    average_gains = pd.concat([pair_average_gains(triggers[triggers['symbol'].isin(chunk)], training_set,
+                                                  candidate_pairs=candidate_pairs)
+                               for chunk in chunked(list(independent_symbols), chunk_size)]
+                              + [pair_average_gains(triggers.iloc[:0], training_set)])  # (in case of no triggers)
+
+    # Select the best ones (i.e., ones where the average gain meets our goal
+    average_gains = average_gains[(average_gains['mean_gain_pct'] >= mean_gain_pct)
+                                  & (average_gains['gain_05'] >= success_rate_05)
+                                  & (average_gains['count'] >= min_count)
+                                  & (average_gains['independent_symbol'] != average_gains['dependent_symbol'])]
+    return average_gains
+
+
+# Cross-join the triggers with the training set (on timestamp) and compute the average gains for each pair. With
+# candidate_pairs (independent_symbol, dependent_symbol), each trigger is only joined with its candidate dependents
+
+def pair_average_gains(triggers, training_set, candidate_pairs=None):
+    if candidate_pairs is None:
+        cross_join = triggers.merge(training_set, on='timestamp')
+    else:
+        triggers = triggers.merge(candidate_pairs, left_on='symbol', right_on='independent_symbol')
+        cross_join = triggers.merge(training_set, left_on=['timestamp', 'dependent_symbol'],
+                                    right_on=['timestamp', 'symbol'])
     average_gains = cross_join.groupby(['symbol_x', 'symbol_y']).agg({'gain_pct_y': ['count', 'mean'],
                                                                       'gain_00_y': ['mean'],
                                                                       'gain_05_y': ['mean'],
@@ -43,31 +106,58 @@ def get_trading_pairs(trading_date, symbol_subset=None, lookback_window=10, effe
                                                   'gain_00_y_mean': 'gain_00',
                                                   'gain_05_y_mean': 'gain_05',
                                                   'gain_10_y_mean': 'gain_10'})
-
-    # Select the best ones (i.e., ones where the average gain meets our goal
-    average_gains = average_gains[(average_gains['mean_gain_pct'] >= mean_gain_pct)
-                                  & (average_gains['gain_05'] >= success_rate_05)
-                                  & (average_gains['count'] >= min_count)
-                                  & (average_gains['independent_symbol'] != average_gains['dependent_symbol'])]
     return average_gains
 
 
+# Coarse prefilter for get_trading_pairs: for each symbol, the top_k other symbols whose daily returns (close to close)
+# were most correlated with its own over the days trading days before trading_date. Returns a DataFrame of
+# (independent_symbol, dependent_symbol) candidate pairs
+
+def co_movement_candidates(trading_date, symbols, top_k=50, days=60):
+    store = daily_summary_store()
+    symbols = set(symbols)
+    closes = store.window('close', trading_date, days + 1, symbols=[s for s in store.symbols if s in symbols]).T
+    returns = closes.pct_change(fill_method=None).iloc[1:]
+    top_k = min(top_k, len(returns.columns) - 1)
+    if top_k < 1:
+        return pd.DataFrame({'independent_symbol': pd.Series(dtype=str), 'dependent_symbol': pd.Series(dtype=str)})
+    correlations = returns.corr(min_periods=max(2, days // 2)).to_numpy()
+    correlations[np.isnan(correlations)] = -np.inf  # Not enough history to say
+    np.fill_diagonal(correlations, -np.inf)
+    top = np.argpartition(-correlations, top_k - 1, axis=1)[:, :top_k]
+    keep = np.take_along_axis(correlations, top, axis=1) > -np.inf
+    columns = returns.columns.to_numpy()
+    return pd.DataFrame({'independent_symbol': np.repeat(columns, top_k)[keep.ravel()],
+                         'dependent_symbol': columns[top.ravel()][keep.ravel()]})
+
+
+# Estimate the size of triggers.merge(training_set, on='timestamp') from the number of rows per timestamp on each
+# side (without building it)
+
+def estimated_cross_join_bytes(triggers, training_set, training_bytes):
+    if len(triggers) == 0:
+        return 0
+    rows = (triggers['timestamp'].value_counts() * training_set['timestamp'].value_counts()).sum()
+    bytes_per_row = 2 * training_bytes / len(training_set)  # a row from each side
+    return int(rows * bytes_per_row)
+
+
+# The trigger and gain columns for every symbol at once. The shifts are within each symbol (across the days of the
+# training window, like the per-symbol loop this replaced), using the panel helpers from edgeStudy
+
 def compute_trigger_and_effect_df(intraday_details, symbol_subset=None, effect_window=15):
     symbols = symbol_subset if symbol_subset else get_symbols()
     effect_shift = round(effect_window / 5)
-    symbol_results = list()  # List of DataFrame (one for each symbol)
-    for symbol in symbols:
-        s_hist = extract_symbol_details(intraday_details, symbol)
-        s_hist['decision_time'] = s_hist['timestamp'].map(lambda ts: time_string(ts + pd.Timedelta('5m')))
-        s_hist['trigger_last_15_pct'] = 100 * (s_hist['close'] / s_hist.shift(2)['open'] - 1)
-        s_hist['trigger_last_10_pct'] = 100 * (s_hist['close'] / s_hist.shift(1)['open'] - 1)
-        s_hist['trigger_last_05_pct'] = 100 * (s_hist['close'] / s_hist['open'] - 1)
-        s_hist['gain_pct'] = 100 * (s_hist.shift(-effect_shift)['close'] / s_hist.shift(-1)['open'] - 1)
-        s_hist['gain_00'] = s_hist['gain_pct'] >= 0  # Did we break even?
-        s_hist['gain_05'] = s_hist['gain_pct'] >= 0.5  # Did we gain at least 0.5%
-        s_hist['gain_10'] = s_hist['gain_pct'] >= 1.0  # Did we gain at least 1.0%
-        s_hist = s_hist.dropna()  # Drop rows where we don't have gain_pct (usually end of day)
-        symbol_results.append(s_hist)
-    symbol_results_df = pd.concat(symbol_results)
-    symbol_results_df = symbol_results_df.reset_index(drop=True)
-    return symbol_results_df
+    s_hist = intraday_details[intraday_details['symbol'].isin(symbols)].reset_index(drop=True)
+    s_hist['symbol_order'] = s_hist['symbol'].map({symbol: order for order, symbol in enumerate(symbols)})
+    s_hist = s_hist.sort_values(['symbol_order', 'timestamp'], kind='stable').reset_index(drop=True)
+    s_hist['decision_time'] = (s_hist['timestamp'] + pd.Timedelta('5m')).dt.strftime('%H:%M:%S')
+    s_hist['trigger_last_15_pct'] = 100 * (s_hist['close'] / shifted(s_hist, 'open', 2, 'symbol') - 1)
+    s_hist['trigger_last_10_pct'] = 100 * (s_hist['close'] / shifted(s_hist, 'open', 1, 'symbol') - 1)
+    s_hist['trigger_last_05_pct'] = 100 * (s_hist['close'] / s_hist['open'] - 1)
+    s_hist['gain_pct'] = forward_return_pct(s_hist, effect_shift, group_column='symbol')
+    s_hist['gain_00'] = s_hist['gain_pct'] >= 0  # Did we break even?
+    s_hist['gain_05'] = s_hist['gain_pct'] >= 0.5  # Did we gain at least 0.5%
+    s_hist['gain_10'] = s_hist['gain_pct'] >= 1.0  # Did we gain at least 1.0%
+    s_hist = s_hist.drop(columns=['symbol_order']).dropna()  # Drop rows without gain_pct (usually end of day)
+    return s_hist.reset_index(drop=True)
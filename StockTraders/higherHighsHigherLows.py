@@ -10,23 +10,36 @@
 
 import logging
 import math
+import os
+import time
 import pandas as pd
 
 from TradingApis.alpacaClients import TradeMode, QueryMode, set_alpaca_modes, get_trade_mode
 from TradingApis.alpacaOperations import get_bars
+from Util.barScheduler import BarScheduler
+from Util.checkpoints import save_checkpoint, load_checkpoint, remove_checkpoint
 from Util.pathsAndStockSets import StockSet, set_stock_set, temp_files_path, get_symbols
-from Util.tradeTracker import trade_tracker
-from Util.datesAndTimestamps import (timestamp, sleep_until_time, time_string, date_string, most_recent_bar_time,
-                                     trading_dates, datetime_string)
+from Util.tradeTracker import trade_tracker, set_trade_tracker, set_trade_tracker_thread_safe
+from Util.latencyMonitor import LatencyMonitor
+from Util.memoryAccounting import set_memory_budget, log_memory_summary
+from Util.eventLog import start_event_log, log_event
+from Util.instrumentation import set_instrumentation, span, count, log_instrumentation_summary
+from Util.datesAndTimestamps import (timestamp, date_string, most_recent_bar_minute, trading_dates,
+                                     session_minute_from_string, session_timestamp)
 from Util.tradeExecution import TimedHoldLongTradeExecutor, process_trade_executors
+from Util.tradeJournal import TradeJournal, replay_journal
 from Util.tradeIdentification import HigherHighsHigherLowsTradeIdentifier
 
 logging.basicConfig(format='%(message)s', level=logging.INFO)
+start_event_log()  # Write the log lines on a background thread (pass a binary_filename to also keep a binary log)
 
 set_stock_set(StockSet.SP500)
 # set_alpaca_modes(new_trade_mode=TradeMode.PRODUCTION, new_query_mode=QueryMode.API)
 # set_alpaca_modes(new_trade_mode=TradeMode.PAPER, new_query_mode=QueryMode.API)
 set_alpaca_modes(new_trade_mode=TradeMode.SIMULATION, new_query_mode=QueryMode.FILE)
+set_trade_tracker_thread_safe(get_trade_mode() != TradeMode.SIMULATION)  # Fills may arrive on other threads
+set_instrumentation(True)  # Log how long each stage of the interval takes (spanSummary lines for each day)
+set_memory_budget(None)  # e.g., 4 * 2 ** 30 to keep the bar caches and big intermediates under 4GB
 
 buying_power = 100000
 max_trades = 2
@@ -37,66 +50,133 @@ maximum_drop_pct = 0.25  # Require that the diff between high and close in final
 earliest_trade_time = '09:50:00'  # Don't make trades using the first bar of the trading day
 hold_duration = 10  # Max time (in minutes) to hold the trade before cashing out
 latest_trade_time = '15:45:00'  # Don't initiate any trades after 3:40pm (so we are closed out by 3:55pm)
+latest_trade_minute = session_minute_from_string(latest_trade_time)
+first_decision_minute = session_minute_from_string('09:35:00')  # Decide after the first bar closes...
+last_decision_minute = session_minute_from_string('16:00:00')  # ... through the market close
 symbols = get_symbols()
 
+# Checkpointing: save the trader state every checkpoint_interval bars, and (optionally) resume from the last checkpoint
+checkpoint_name = f"hhhl_{get_trade_mode().name}"
+checkpoint_interval = 12  # Save after every 12 bars, i.e., every hour (0 to turn off checkpointing)
+resume_from_checkpoint = False
+checkpoint = load_checkpoint(checkpoint_name) if resume_from_checkpoint else None
+if checkpoint:
+    buying_power = checkpoint['buying_power']
+    set_trade_tracker(checkpoint['tracker'])
+
+# Stream trade and order events to an append-only journal as they happen. When resuming, we keep the records from
+# before the checkpoint (and drop the ones after it, since we redo that work) and keep appending. The checkpoint only
+# has the open trades, so the closed ones are read back from the journal
+journal_filename = temp_files_path(f"tradeJournal_hhhl_{get_trade_mode().name}.bin")
+journal = TradeJournal(journal_filename, truncate=not checkpoint,
+                       keep_records=checkpoint.get('journal_records') if checkpoint else None)
+trade_tracker().attach_journal(journal)
+if checkpoint:
+    trade_tracker().restore_closed_trades(replay_journal(journal_filename))  # The checkpoint leaves them out
+
+# Wake up 2 seconds after each bar boundary (no waiting when we're simulating)
+# Track the latency from each bar to our orders and fills (bar_close is only meaningful when trading live)
+latency_monitor = LatencyMonitor('hhhl')
+live_trading = get_trade_mode() != TradeMode.SIMULATION
+
+scheduler = BarScheduler('hhhl', accelerated=(get_trade_mode() == TradeMode.SIMULATION), wake_offset=2.0)
+
+# The range of trading dates to trade over. The environment variables let the benchmark suite run a single day
+first_trading_date = timestamp(os.environ.get('TraderFirstDate', '2023-12-01'))
+last_trading_date = timestamp(os.environ.get('TraderLastDate', '2024-05-31'))
+
 trade_tracker_df = pd.DataFrame()
-for trading_date in trading_dates(timestamp('2023-12-01'), timestamp('2024-05-31')):
+for trading_date in trading_dates(first_trading_date, last_trading_date):
     # for trading_date in [timestamp('2024-01-22')]:
-    logging.info(f"c=hhhl a=trade s=started date={date_string(trading_date)} " +
-                 f"starting_balance={round(buying_power, 2)}")
-    trade_amount = buying_power / 2
-
-    # make trade identifiers for each symbol
-    trade_identifiers = list()  # list of HigherHighsHigherLowsTradeIdentifiers
-    for symbol in symbols:
-        identifier = HigherHighsHigherLowsTradeIdentifier(symbol, minimum_gain_pct, maximum_drop_pct,
-                                                          earliest_trade_time)
-        trade_identifiers.append(identifier)
-
-    # walk through the day and make trades
-    trade_executors = list()
-
-    for delta in pd.timedelta_range(start='09:35:00', end='16:00:00', freq='5min'):
-        decision_time = trading_date + delta
-        sleep_until_time(decision_time + pd.Timedelta('00:00:02'), 'hhhl', 'wait_for_bar')
-        logging.info(f"c=hhhl a=tradeDuringInterval s=started dt={datetime_string(decision_time)} " +
-                     f"a={round(buying_power, 2)}")
-        buying_power, realized_profit, current_profit = process_trade_executors(trade_executors, decision_time,
-                                                                                buying_power=buying_power)
-
-        # Count how many active trades there are
-        active_trades = 0
-        for executor in trade_executors:
-            if executor.state != 'complete':
-                active_trades += 1
-
-        if time_string(decision_time) <= latest_trade_time:
+    if checkpoint and trading_date < checkpoint['trading_date']:
+        continue  # We already finished this day before the checkpoint
+    log_event('hhhl', 'trade', s='started', date=date_string(trading_date), starting_balance=round(buying_power, 2))
+
+    if checkpoint and trading_date == checkpoint['trading_date']:
+        # Pick up the day where the checkpoint left off
+        trade_amount = checkpoint['trade_amount']
+        trade_identifiers = checkpoint['identifiers']
+        trade_executors = checkpoint['executors']
+    else:
+        checkpoint = None
+        trade_tracker().account.begin_period()  # Report profits for each trading day
+        trade_amount = buying_power / 2
+
+        # make trade identifiers for each symbol
+        trade_identifiers = list()  # list of HigherHighsHigherLowsTradeIdentifiers
+        for symbol in symbols:
+            identifier = HigherHighsHigherLowsTradeIdentifier(symbol, minimum_gain_pct, maximum_drop_pct,
+                                                              earliest_trade_time)
+            trade_identifiers.append(identifier)
+
+        # walk through the day and make trades
+        trade_executors = list()
+
+    for interval, minute in enumerate(range(first_decision_minute, last_decision_minute + 1, 5)):
+        decision_time = session_timestamp(trading_date, minute)
+        if checkpoint and decision_time <= checkpoint['decision_time']:
+            continue  # This bar was already processed before the checkpoint
+        scheduler.wait_for_bar(decision_time)
+        log_event('hhhl', 'tradeDuringInterval', s='started', dt=decision_time, a=round(buying_power, 2))
+        with span('processTradeExecutors'):
+            buying_power, realized_profit, current_profit = process_trade_executors(trade_executors, decision_time,
+                                                                                    buying_power=buying_power)
+
+        # The number of today's trades that are still active is kept up to date by the tracker's portfolio account
+        active_trades = trade_tracker().account.period_active_positions()
+
+        if minute <= latest_trade_minute:
 
             # See what gets triggered
             candidates = list()
-            bar_time = most_recent_bar_time(decision_time)
-            current_bars = get_bars(bar_time, bar_time, symbols)
-            current_bars = current_bars.set_index(['symbol'], drop=False)
-            current_bars = current_bars[~current_bars.index.duplicated(keep='first')]
-            for identifier in trade_identifiers:
-                if identifier.symbol in current_bars.index:
-                    current_bar = current_bars.loc[identifier.symbol]
-                    triggered, details = identifier.consume_5min_bar(current_bar)
-                    if triggered:
-                        candidates.append(details)
+            bar_time = session_timestamp(trading_date, most_recent_bar_minute(minute))
+            with span('getBars'):
+                current_bars = get_bars(bar_time, bar_time, symbols)
+                current_bars = current_bars.set_index(['symbol'], drop=False)  # unique: bar files are normalized
+            bar_available = time.time()
+            with span('identifierStep'):
+                for identifier in trade_identifiers:
+                    if identifier.symbol in current_bars.index:
+                        current_bar = current_bars.loc[identifier.symbol]
+                        triggered, details = identifier.consume_5min_bar(current_bar)
+                        if triggered:
+                            details['triggered_at'] = time.time()
+                            candidates.append(details)
+            count('candidates', len(candidates))
 
             # Select which trades to execute
             if len(candidates) > 0:
-                for candidate in candidates[:max_trades-active_trades]:
-                    shares = math.floor(trade_amount/candidate['target_buy_price'])
-                    executor = TimedHoldLongTradeExecutor(candidate['symbol'], shares, decision_time,
-                                                          candidate['target_buy_price'], hold_duration)
-                    print(f"c=hhhl a=selectTrade dt={datetime_string(decision_time)} "
-                          + f"sym={candidate['symbol']} direction=LONG")
-                    trade_executors.append(executor)
-        logging.info(f"c=hhhl a=tradeDuringInterval s=completed dt={datetime_string(decision_time)} "
-                     + f"realizedProfit=${round(realized_profit, 2)} currentProfit=${round(current_profit, 2)}")
+                with span('candidateSelection'):
+                    for candidate in candidates[:max_trades-active_trades]:
+                        shares = math.floor(trade_amount/candidate['target_buy_price'])
+                        latency = {'bar_available': bar_available, 'triggered': candidate['triggered_at']}
+                        if live_trading:
+                            latency['bar_close'] = decision_time.timestamp()
+                        executor = TimedHoldLongTradeExecutor(candidate['symbol'], shares, decision_time,
+                                                              candidate['target_buy_price'], hold_duration,
+                                                              latency=latency)
+                        log_event('hhhl', 'selectTrade', dt=decision_time, sym=candidate['symbol'], direction='LONG')
+                        trade_executors.append(executor)
+        latency_monitor.observe(executor.trade for executor in trade_executors)
+        latency_monitor.log_summary(decision_time)
+        log_event('hhhl', 'tradeDuringInterval', s='completed', dt=decision_time,
+                  realizedProfit=round(realized_profit, 2), currentProfit=round(current_profit, 2),
+                  exposure=round(trade_tracker().account.exposure, 2))
+
+        if checkpoint_interval and (interval + 1) % checkpoint_interval == 0:
+            with span('saveCheckpoint'):
+                save_checkpoint(checkpoint_name, {'tracker': trade_tracker(), 'executors': trade_executors,
+                                                  'identifiers': trade_identifiers, 'buying_power': buying_power,
+                                                  'trade_amount': trade_amount, 'trading_date': trading_date,
+                                                  'decision_time': decision_time,
+                                                  'journal_records': journal.flush()})
+    scheduler.log_drift_summary(trading_date)
+    log_instrumentation_summary('hhhl', trading_date)
+    log_memory_summary('hhhl', trading_date)
+    checkpoint = None
 
+journal.close()
+remove_checkpoint(checkpoint_name)  # We finished every trading date, so there's nothing to resume
 trade_tracker_df = trade_tracker().to_dataframe()
 trade_tracker_df = trade_tracker_df.round(4)
 filename = f"purchaseTracker_{date_string(trading_date).replace('-', '')}_{get_trade_mode().name}.csv"
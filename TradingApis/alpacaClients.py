@@ -33,17 +33,23 @@ global_historical_client = None  # client for making data requests
 global_data_stream = None  # client to set up real-time streaming of data
 
 
-paper_creds = {
-    'end_point': 'https://paper-api.alpaca.markets',
-    'APCA-API-KEY-ID': os.environ['AlpacaPaperKeyId'],
-    'APCA-API-SECRET-KEY': os.environ['AlpacaPaperSecretKey']
-}
+# Credentials are read from the environment the first time a client is created (not at import time), so scripts and
+# worker processes that never talk to Alpaca don't need them
 
-prod_creds = {
-    'end_point': 'https://api.alpaca.markets',
-    'APCA-API-KEY-ID': os.environ['AlpacaProdKeyId'],
-    'APCA-API-SECRET-KEY': os.environ['AlpacaProdSecretKey']
-}
+def paper_creds():
+    return {
+        'end_point': 'https://paper-api.alpaca.markets',
+        'APCA-API-KEY-ID': os.environ['AlpacaPaperKeyId'],
+        'APCA-API-SECRET-KEY': os.environ['AlpacaPaperSecretKey']
+    }
+
+
+def prod_creds():
+    return {
+        'end_point': 'https://api.alpaca.markets',
+        'APCA-API-KEY-ID': os.environ['AlpacaProdKeyId'],
+        'APCA-API-SECRET-KEY': os.environ['AlpacaProdSecretKey']
+    }
 
 
 # Define the different Trade and Query Modes and provide an accessor to set the modes
@@ -84,31 +90,25 @@ def trading_client():
     global global_trading_client
     if not global_trading_client:
         if trade_mode == TradeMode.PRODUCTION:
-            global_trading_client = TradingClient(prod_creds['APCA-API-KEY-ID'],
-                                                  prod_creds['APCA-API-SECRET-KEY'],
-                                                  paper=False)
+            creds = prod_creds()
+            global_trading_client = TradingClient(creds['APCA-API-KEY-ID'], creds['APCA-API-SECRET-KEY'], paper=False)
         else:  # trade_mode == TradeMode.PAPER
-            global_trading_client = TradingClient(paper_creds['APCA-API-KEY-ID'],
-                                                  paper_creds['APCA-API-SECRET-KEY'],
-                                                  paper=True)
+            creds = paper_creds()
+            global_trading_client = TradingClient(creds['APCA-API-KEY-ID'], creds['APCA-API-SECRET-KEY'], paper=True)
     return global_trading_client
 
 
 def historical_client():
     global global_historical_client
     if not global_historical_client:
-        if trade_mode == TradeMode.PRODUCTION:
-            global_historical_client = StockHistoricalDataClient(prod_creds['APCA-API-KEY-ID'],
-                                                                 prod_creds['APCA-API-SECRET-KEY'])
-        else:  # trade_mode == TradeMode.PAPER
-            global_historical_client = StockHistoricalDataClient(paper_creds['APCA-API-KEY-ID'],
-                                                                 paper_creds['APCA-API-SECRET-KEY'])
+        creds = prod_creds() if trade_mode == TradeMode.PRODUCTION else paper_creds()
+        global_historical_client = StockHistoricalDataClient(creds['APCA-API-KEY-ID'], creds['APCA-API-SECRET-KEY'])
     return global_historical_client
 
 
 def alpaca_data_stream():
     global global_data_stream
     if not global_data_stream:
-        creds = prod_creds if trade_mode == TradeMode.PRODUCTION else paper_creds
+        creds = prod_creds() if trade_mode == TradeMode.PRODUCTION else paper_creds()
         global_data_stream = StockDataStream(creds['APCA-API-KEY-ID'], creds['APCA-API-SECRET-KEY'])
     return global_data_stream
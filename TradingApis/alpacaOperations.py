@@ -3,24 +3,37 @@
 # article. The key thing is that the interfaces that our Trade Identifiers and Trade Executors use are the same
 # for SIMULATION, PAPER, and PRODUCTION
 
-import logging
 import pandas as pd
+import uuid
 
 from alpaca.trading.enums import OrderSide, OrderType, PositionSide
 
 from ReportProcessing.intradayDetailReport import read_intraday_details
-from Util.datesAndTimestamps import most_recent_bar_time
+from Util.datesAndTimestamps import most_recent_bar_time, session_clock
+from Util.eventLog import log_event
+from Util.instrumentation import span, count
+from Util.memoryAccounting import register_cache, record_size, enforce_budget
 from Util.pathsAndStockSets import get_symbols
 
 
+# Simulated orders get their own unique ids (like the UUIDs from Alpaca), so they can be looked up in the order index
+
+def simulated_order_id():
+    return f"SIM-{uuid.uuid4()}"
+
+
 def place_market_buy_order(trade, shares, target_purchase_price, order_start):
     # NOTE: For SIMULATION, we'll automatically get our target purchase price, if it's in the next bar
-    order = trade.add_market_buy_order(shares, target_purchase_price, order_start, 'SIM')
+    order = trade.add_market_buy_order(shares, target_purchase_price, order_start, simulated_order_id())
+    trade.mark_latency('buy_submitted')
+    count('ordersPlaced')
     return order
 
 
 def place_market_sell_order(trade, shares, target_sell_price, order_start):
-    order = trade.add_market_sell_order(shares, target_sell_price, order_start, 'SIM')
+    order = trade.add_market_sell_order(shares, target_sell_price, order_start, simulated_order_id())
+    trade.mark_latency('sell_submitted')
+    count('ordersPlaced')
     return order
 
 
@@ -31,6 +44,7 @@ def place_market_sell_order(trade, shares, target_sell_price, order_start):
 
 def get_latest_bar(symbol, decision_time, freq=5):
     bar_time = most_recent_bar_time(decision_time, freq=freq)
+    count('latestBarLookups')
     bars = get_bars(bar_time, bar_time, symbols=[symbol], freq=freq)
     if len(bars) > 0:
         return True, bars.iloc[0]
@@ -44,49 +58,75 @@ saved_daily_details_1min = pd.DataFrame()
 saved_daily_details_5min = pd.DataFrame()
 
 
+# The caches are registered with the memory accounting, which can evict them (they are just re-read on the next miss)
+
+def evict_daily_details_1min():
+    global saved_daily_details_1min
+    saved_daily_details_1min = pd.DataFrame()
+
+
+def evict_daily_details_5min():
+    global saved_daily_details_5min
+    saved_daily_details_5min = pd.DataFrame()
+
+
+register_cache('dailyDetails1min', evict_daily_details_1min)
+register_cache('dailyDetails5min', evict_daily_details_5min)
+
+
 # If the bars for the designated range are already cached, use them. Otherwise, read the appropriate file.
-# If symbols is provided, we filter the bars to contain just those bars
+# If symbols is provided, we filter the bars to contain just those bars. We compare the integer session_clock column,
+# rather than the timestamps, to keep the per-bar filtering cheap
 
 def get_bars(start, end, symbols=None, freq=5):
     global saved_daily_details_1min, saved_daily_details_5min
     symbols = symbols if symbols else get_symbols()
+    start_clock, end_clock = session_clock(start), session_clock(end)
     if freq == 1:
-        if not daily_details_contains_range(saved_daily_details_1min, start, end):
-            saved_daily_details_1min = read_intraday_details(start, report_end=end, freq=1)
-        results = saved_daily_details_1min[saved_daily_details_1min['timestamp'].between(start, end)
+        if not daily_details_contains_range(saved_daily_details_1min, start_clock, end_clock):
+            count('barCacheMisses')
+            with span('readIntradayDetails'):
+                saved_daily_details_1min = read_intraday_details(start, report_end=end, freq=1)
+            record_size('dailyDetails1min', saved_daily_details_1min)
+            enforce_budget(keep='dailyDetails1min')
+        results = saved_daily_details_1min[saved_daily_details_1min['session_clock'].between(start_clock, end_clock)
                                            & saved_daily_details_1min['symbol'].isin(symbols)]
         return results
     else:  # freq == 5
-        if not daily_details_contains_range(saved_daily_details_5min, start, end):
-            saved_daily_details_5min = read_intraday_details(start, report_end=end, freq=5)
-        results = saved_daily_details_5min[saved_daily_details_5min['timestamp'].between(start, end)
+        if not daily_details_contains_range(saved_daily_details_5min, start_clock, end_clock):
+            count('barCacheMisses')
+            with span('readIntradayDetails'):
+                saved_daily_details_5min = read_intraday_details(start, report_end=end, freq=5)
+            record_size('dailyDetails5min', saved_daily_details_5min)
+            enforce_budget(keep='dailyDetails5min')
+        results = saved_daily_details_5min[saved_daily_details_5min['session_clock'].between(start_clock, end_clock)
                                            & saved_daily_details_5min['symbol'].isin(symbols)]
         return results
 
 
-def daily_details_contains_range(daily_details, start, end):
+def daily_details_contains_range(daily_details, start_clock, end_clock):
     if len(daily_details) == 0:
         return False
     else:
-        min_timestamp = daily_details['timestamp'].min()
-        max_timestamp = daily_details['timestamp'].max()
-        return (min_timestamp <= start) and (end <= max_timestamp)
+        min_clock = daily_details['session_clock'].min()
+        max_clock = daily_details['session_clock'].max()
+        return (min_clock <= start_clock) and (end_clock <= max_clock)
 
 
 #
 
 def process_orders_for_trade(trade, decision_time, freq=5):
-    for order in list(trade.active_orders):
+    for order in list(trade.active_orders.values()):
         completed, price, order_end = check_order_status(order, trade, decision_time, freq=freq)
         if completed:
             if order.order_side == OrderSide.BUY:  # Our initial BUY has completed
                 trade.add_buy_order_execution(order.order_type, 'filled', price, order_end)
-                logging.info(f"c=alpacaOps a=startTrade d={order_end} sym={order.symbol} price={price} side=LONG")
+                log_event('alpacaOps', 'startTrade', d=order_end, sym=order.symbol, price=price, side='LONG')
                 return False, -trade.shares * price, order
             else:  # Our final SELL has completed to close the position
                 trade.add_sell_order_execution(order.order_type, 'filled', price, order_end)
-                logging.info(f"c=alpacaOps a=endTrade d={order_end} sym={order.symbol} price={price} "
-                             + f"result={order.order_type.name} gain={round(trade.actual_gain, 2)}%")
+                log_event('alpacaOps', 'endTrade', d=order_end, sym=order.symbol, price=price,
+                          result=order.order_type.name, gain=f"{round(trade.actual_gain, 2)}%")
                 cancel_orders_for_trade(trade, decision_time)
                 return True, trade.shares * price, order
     return False, 0, None
@@ -103,6 +143,6 @@ def check_order_status(order, trade, decision_time, freq=5):
 
 
 def cancel_orders_for_trade(trade, trade_end):
-    for order in list(trade.active_orders):
+    for order in list(trade.active_orders.values()):
         # NOTE: We'll add logic for interacting with the broker API later
         trade.close_order(order, 'cancelled', 0, trade_end)
@@ -0,0 +1,88 @@
+# The BarFetcher runs data requests (to Alpaca, yfinance, or anything else) with bounded concurrency, rate limiting,
+# and retries, so backfills don't have to make hundreds of requests one after the other.
+#
+#   - Concurrency: requests run on a thread pool with max_workers threads (the clients are shared between threads, so
+#     their HTTP connections get reused)
+#   - Rate limiting: a TokenBucket shared by all the threads allows at most requests_per_minute requests (with bursts
+#     of up to burst requests)
+#   - Retries: a failed request is retried up to retries times, with exponential backoff (plus jitter)
+#
+# Requests are plain callables, so the fetcher doesn't care what they talk to. For testing, point the callables at a
+# local stub server (e.g., one built with http.server) instead of the real APIs.
+
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity  # maximum number of tokens (i.e., the largest burst)
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Block until a token is available and take it
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BarFetcher:
+    def __init__(self, name, max_workers=8, requests_per_minute=180, burst=None, retries=4, backoff=1.0,
+                 max_backoff=30.0):
+        self.name = name
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(requests_per_minute / 60, burst if burst else max_workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    # Call request() once we have a token, retrying with exponential backoff if it raises
+
+    def call_with_retries(self, key, request):
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                return request()
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = min(self.max_backoff, self.backoff * (2 ** attempt)) * (0.5 + random.random())
+                logging.warning(f"c={self.name} a=retry key={key} attempt={attempt + 1} delay={round(delay, 2)} "
+                                + f"error={type(e).__name__}")
+                time.sleep(delay)
+
+    # Run the requests (a dict of key: callable) and return a dict of key: result. Requests that still fail after all
+    # the retries are logged and left out of the results
+
+    def fetch(self, requests):
+        results = dict()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                   thread_name_prefix=self.name) as executor:
+            futures = {executor.submit(self.call_with_retries, key, request): key for key, request in requests.items()}
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    logging.error(f"c={self.name} a=fetch s=failed key={key} error={type(e).__name__}: {e}")
+        return results
+
+
+# Split symbols into chunks of at most chunk_size symbols (e.g., to keep each Alpaca request reasonably small)
+
+def chunked(symbols, chunk_size):
+    return [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
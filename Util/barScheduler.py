@@ -0,0 +1,71 @@
+# The BarScheduler wakes the trading loop up right after each bar becomes available.
+#
+# sleep_until_time() used to do this by polling the wall clock with whole-second sleeps. The scheduler converts the
+# wakeup time into a deadline on the monotonic clock (which can't jump around when the system clock is adjusted),
+# sleeps until just before that deadline, and then spins for the last couple of milliseconds, which gets us to within
+# a fraction of a millisecond of the target.
+#
+# Features:
+#   wake_offset: seconds after the bar boundary to wake up (gives the data provider time to publish the bar)
+#   pre_bar_hook: optional callable(bar_boundary) that is run pre_bar_lead seconds before we wake up, so we can get
+#       prep work out of the way before the bar arrives
+#   accelerated: don't sleep at all (for SIMULATION, where the whole day is replayed from files)
+#   drift: for every wakeup, we record how late (in seconds) we woke up compared to the target, including the bars
+#       where the target had already passed when we got there (the loop fell behind). Use log_drift_summary() to log the
+#       stats for the day
+
+import logging
+import time
+
+from Util.eventLog import log_event
+from Util.instrumentation import percentile
+
+spin_threshold = 0.002  # Spin (rather than sleep) for the last 2 milliseconds before a deadline
+
+
+class BarScheduler:
+    def __init__(self, component_name, accelerated=False, wake_offset=2.0, pre_bar_hook=None, pre_bar_lead=0.0):
+        self.component_name = component_name
+        self.accelerated = accelerated
+        self.wake_offset = wake_offset
+        self.pre_bar_hook = pre_bar_hook
+        self.pre_bar_lead = pre_bar_lead
+        self.drifts = list()  # list of float, seconds late for each wakeup
+
+    # Block until wake_offset seconds after bar_boundary (a timezone-aware Timestamp)
+
+    def wait_for_bar(self, bar_boundary):
+        target = bar_boundary.timestamp() + self.wake_offset  # seconds since the epoch
+        if self.pre_bar_hook:
+            self.sleep_until(target - self.pre_bar_lead)
+            self.pre_bar_hook(bar_boundary)
+        timed, drift = self.sleep_until(target)
+        if timed:
+            self.drifts.append(drift)
+            log_event(self.component_name, 'waitForBar', level=logging.DEBUG, bar=str(bar_boundary),
+                      driftMs=round(1000 * drift, 3))
+
+    # Sleep until target (seconds since the epoch). Returns (timed, drift), where drift is how late we woke up: if the
+    # target has already passed, we return right away, and the drift is how long ago it passed. timed is False when
+    # accelerated (there's no drift to report)
+
+    def sleep_until(self, target):
+        if self.accelerated:
+            return False, 0.0
+        deadline = time.monotonic() + (target - time.time())
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True, -remaining  # Already late
+        while remaining > 0:
+            if remaining > spin_threshold:
+                time.sleep(remaining - spin_threshold)
+            remaining = deadline - time.monotonic()
+        return True, -remaining
+
+    def log_drift_summary(self, trading_date):
+        if len(self.drifts) > 0:
+            drifts = sorted(self.drifts)
+            logging.info(f"c={self.component_name} a=driftSummary date={str(trading_date.date())} "
+                         + f"wakeups={len(drifts)} meanMs={round(1000 * sum(drifts) / len(drifts), 3)} "
+                         + f"p99Ms={round(1000 * percentile(drifts, 0.99), 3)} maxMs={round(1000 * drifts[-1], 3)}")
+        self.drifts = list()
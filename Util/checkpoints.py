@@ -0,0 +1,60 @@
+# Checkpoints let a long backtest (or a live session that gets restarted mid-day) pick up where it left off, instead of
+# re-running everything from the first trading date.
+#
+# A checkpoint is a single dict holding the full trader state, for example:
+#   tracker: the TradeTracker (its active trades, with their orders; the closed trades are in the TradeJournal)
+#   executors: the list of Trade Executors for the current trading day
+#   identifiers: the list of Trade Identifiers (including the bars they have buffered so far)
+#   buying_power: the current buying power
+#   trading_date: the trading date we were working on
+#   decision_time: the last decision_time that was fully processed
+#   journal_records: the number of records on disk in the TradeJournal, from journal.flush() (a resumed run drops the
+#       records after these)
+#
+# The whole dict is pickled in one shot (so executors and the tracker keep pointing at the same TradeInfo objects) and
+# compressed with zlib. We write to a temp file and then rename it, so a crash in the middle of a save leaves the
+# previous checkpoint intact.
+
+import logging
+import os
+import pickle
+import zlib
+
+from Util.pathsAndStockSets import temp_files_path
+
+
+def checkpoint_filename(name):
+    return temp_files_path(f"checkpoint_{name}.bin")
+
+
+def save_checkpoint(name, state):
+    filename = checkpoint_filename(name)
+    payload = zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 1)
+    with open(filename + '.tmp', 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(filename + '.tmp', filename)
+    logging.debug(f"c=checkpoints a=save name={name} bytes={len(payload)}")
+
+
+# Return the state dict that was saved under name, or None if there isn't a checkpoint
+
+def load_checkpoint(name):
+    filename = checkpoint_filename(name)
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as f:
+        state = pickle.loads(zlib.decompress(f.read()))
+    logging.info(f"c=checkpoints a=load name={name} date={state.get('trading_date')} "
+                 + f"decisionTime={state.get('decision_time')}")
+    return state
+
+
+# Remove the checkpoint saved under name (the traders do this once they finish every trading date, so a later run
+# that resumes doesn't pick up a finished one)
+
+def remove_checkpoint(name):
+    filename = checkpoint_filename(name)
+    if os.path.exists(filename):
+        os.remove(filename)
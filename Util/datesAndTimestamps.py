@@ -1,21 +1,21 @@
 # Helpers to consistently use pandas Timestamps (with timezone info) across everything
 
-import datetime as dt
 import logging
 import pandas as pd
-import pandas_market_calendars as mcal  # Also might need to pip install exchange_calendars
 import time
 
+from Util.tradingCalendar import trading_calendar
 
-# Sleep the processing until wakeup_timestamp and also log the delay
+
+# Sleep the processing until wakeup_timestamp and also log the delay. The trading loops use BarScheduler (in
+# Util/barScheduler.py) instead, which wakes up much more precisely
 
 def sleep_until_time(wakeup_timestamp, component_name, action_name):
-    today = pd.to_datetime(dt.datetime.today()).tz_localize('America/Los_Angeles')
-    time_to_wait = wakeup_timestamp - today
-    if time_to_wait.value > 0:
-        logging.debug(f"c={component_name} a={action_name} s=waiting seconds={time_to_wait.seconds} "
+    time_to_wait = (wakeup_timestamp - timestamp_now()).total_seconds()
+    if time_to_wait > 0:
+        logging.debug(f"c={component_name} a={action_name} s=waiting seconds={round(time_to_wait, 3)} "
                       + f"wakeupTime={str(wakeup_timestamp)}")
-        time.sleep(time_to_wait.seconds)
+        time.sleep(time_to_wait)
 
 
 # Some utils for creating our timestamps and extracting useful strings out of them
@@ -30,7 +30,7 @@ def timestamp(string):
 # Create a timestamp for this moment
 
 def timestamp_now():
-    return pd.to_datetime(dt.datetime.today()).tz_localize('America/Los_Angeles').tz_convert('America/New_York')
+    return pd.Timestamp.now(tz='America/New_York')
 
 
 # Output a string for the date component of this timestamp
@@ -65,34 +65,88 @@ def most_recent_bar_time(time_stamp=None, freq=5):
     return time_stamp - d
 
 
-# some utils for accessing trading dates from the NYSE
+# Integer session clock. In the hot path (the trading loop, trade identifiers, and the bar caches) we compare times as
+# integers instead of formatting Timestamps into strings on every bar:
+#   session minute: minutes since the market open (09:30 -> 0, 09:35 -> 5, 16:00 -> 390)
+#   day ordinal: the proleptic Gregorian ordinal of the date (same as datetime.date.toordinal())
+#   session clock: day_ordinal * minutes_per_day + session minute. Session clocks can be compared across days
+#
+# We only convert to and from Timestamps at the boundaries (reading files, calling the APIs, and logging)
+
+market_open_minute = 9 * 60 + 30  # minute of the day for 09:30
+minutes_per_day = 24 * 60
+epoch_day_ordinal = 719163  # day ordinal for 1970-01-01
+
+
+def session_minute(time_stamp):
+    return time_stamp.hour * 60 + time_stamp.minute - market_open_minute
+
+
+# Convert a time string (e.g., '09:50:00') into a session minute (e.g., 20)
+
+def session_minute_from_string(time_str):
+    hours, minutes = time_str.split(':')[:2]
+    return int(hours) * 60 + int(minutes) - market_open_minute
+
+
+def session_minute_string(minute):
+    hours, minutes = divmod(market_open_minute + minute, 60)
+    return f"{hours:02d}:{minutes:02d}:00"
+
+
+def day_ordinal(time_stamp):
+    return time_stamp.toordinal()
+
+
+def session_clock(time_stamp):
+    return time_stamp.toordinal() * minutes_per_day + session_minute(time_stamp)
 
-nyse = mcal.get_calendar('NYSE')
-nyse_dates = nyse.valid_days('2023-01-01', '2024-12-31', tz='America/New_York')
 
+# Vectorized versions of session_minute and session_clock for a Series of Timestamps (e.g., the timestamp column of
+# an intraday detail report)
 
-# Get trading dates in the interval (inclusive)
+def session_minutes(time_stamps):
+    return time_stamps.dt.hour * 60 + time_stamps.dt.minute - market_open_minute
 
-def trading_dates(start=timestamp('2000/01/01'), end=timestamp('2099/12/31')):
-    dates = nyse.valid_days(start, end, tz='America/New_York')
-    return dates.to_list()
+
+def session_clocks(time_stamps):
+    day_ordinals = time_stamps.dt.tz_localize(None).values.astype('datetime64[D]').astype('int64') + epoch_day_ordinal
+    return day_ordinals * minutes_per_day + session_minutes(time_stamps).values
+
+
+# Build the timestamp for session minute on trading_date (a midnight Timestamp)
+
+def session_timestamp(trading_date, minute):
+    return trading_date + pd.Timedelta(minutes=market_open_minute + minute)
+
+
+# Integer version of most_recent_bar_time: the session minute of the most recent bar available at session minute
+
+def most_recent_bar_minute(minute, freq=5):
+    return minute - (minute % freq) - freq
+
+
+# some utils for accessing trading dates from the NYSE. These use the (lazily loaded, disk-cached) TradingCalendar,
+# which covers the years configured with set_calendar_years()
+
+# Get trading dates in the interval (inclusive). Without start/end, we return every date in the calendar
+
+def trading_dates(start=None, end=None):
+    calendar = trading_calendar()
+    start = start if start is not None else calendar.dates[0]
+    end = end if end is not None else calendar.dates[-1]
+    return calendar.dates_between(start, end).to_list()
 
 
 # Find a trading date following the specified trading date. If current_date isn't a trading date we return None
 
 def next_trading_date(current_date, offset=1):
-    if current_date not in nyse_dates:
+    calendar = trading_calendar()
+    i = calendar.ordinal(current_date)
+    if i is None:
         return None
-    i = nyse_dates.get_loc(current_date)
-    if i + offset >= len(nyse_dates) or i + offset < 0:
-        return None
-    return nyse_dates[i + offset]
+    return calendar.date_at(i + offset)
 
 
 def previous_trading_date(current_date, offset=1):
-    if current_date not in nyse_dates:
-        return None
-    i = nyse_dates.get_loc(current_date)
-    if i - offset >= len(nyse_dates) or i - offset < 0:
-        return None
-    return nyse_dates[i - offset]
+    return next_trading_date(current_date, offset=-offset)
@@ -0,0 +1,188 @@
+# Structured, non-blocking logging for the trading loop.
+#
+#   log_event('hhhl', 'selectTrade', dt=decision_time, sym=symbol, direction='LONG')
+#
+# logs the same line as logging.info(f"c=hhhl a=selectTrade dt={datetime_string(decision_time)} sym=... ..."), but the
+# event is only turned into text when a handler writes it (and not at all if the level is filtered out), so the caller
+# pays for a level check and a LogRecord, not for formatting.
+#
+# start_event_log() moves the root logger's handlers (e.g., the console handler from logging.basicConfig) behind a
+# queue: the root logger gets a QueueHandler that hands the records off as they are, and a QueueListener thread
+# formats and writes them. Everything that goes through logging (including the plain logging.info calls elsewhere)
+# goes through the same queue, so the lines stay in order, and the trading thread never waits on the console or the
+# disk. With a binary_filename, the listener also appends each record to a compact binary file (4-byte little-endian
+# length followed by a pickled (created, levelno, component, action, fields, timestamp_keys) tuple; the fields named
+# in timestamp_keys are Timestamps stored as nanoseconds since the epoch, which pickle at a fraction of the size, and
+# plain log lines have a component of None and the message in fields).
+# render_event_log() turns that file back into the usual c= a= text:
+#
+#   python -m AdHoc.renderEventLog <binary_filename> [--timestamps] [--level WARNING]
+#
+# Without start_event_log(), log_event() just logs synchronously like everything else.
+
+import atexit
+import logging
+import logging.handlers
+import pickle
+import queue
+import struct
+
+import pandas as pd
+
+from Util.datesAndTimestamps import datetime_string
+
+record_header = struct.Struct('<I')
+
+global_listener = None  # QueueListener, while the event log is running
+global_saved_handlers = list()  # The root logger's handlers from before start_event_log()
+
+
+class Event:
+    __slots__ = ['component', 'action', 'fields']
+
+    def __init__(self, component, action, fields):
+        self.component = component
+        self.action = action
+        self.fields = fields
+
+    def __str__(self):
+        return render_event(self.component, self.action, self.fields)
+
+
+def log_event(component, action, level=logging.INFO, **fields):
+    logger = logging.getLogger()
+    if logger.isEnabledFor(level):
+        logger.log(level, Event(component, action, fields))
+
+
+# The fields that aren't written with str(), so the lines are the same as the f-strings they replaced:
+#   dt: the decision time, like datetime_string
+#   realizedProfit, currentProfit, exposure: dollar amounts, with a leading $
+
+def dollars(value):
+    return f"${value}"
+
+
+field_formats = {'dt': datetime_string, 'realizedProfit': dollars, 'currentProfit': dollars, 'exposure': dollars}
+
+
+def format_value(key, value):
+    field_format = field_formats.get(key)
+    return field_format(value) if field_format else str(value)
+
+
+def render_event(component, action, fields):
+    if component is None:
+        return fields
+    return ' '.join([f"c={component}", f"a={action}"] + [f"{key}={format_value(key, value)}"
+                                                           for key, value in fields.items()])
+
+
+# A QueueHandler that hands the record off as it is. (The standard one formats the message on the caller's thread, so
+# it can be sent to another process.)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+class BinaryEventHandler(logging.Handler):
+    def __init__(self, filename):
+        super().__init__()
+        self.file = open(filename, 'ab')
+
+    def emit(self, record):
+        try:
+            if isinstance(record.msg, Event):
+                fields = record.msg.fields
+                timestamp_keys = tuple(key for key, value in fields.items() if isinstance(value, pd.Timestamp))
+                if timestamp_keys:
+                    fields = {key: value.value if key in timestamp_keys else value for key, value in fields.items()}
+                event = (record.created, record.levelno, record.msg.component, record.msg.action, fields,
+                         timestamp_keys)
+            else:
+                event = (record.created, record.levelno, None, None, record.getMessage(), ())
+            payload = pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+            self.file.write(record_header.pack(len(payload)) + payload)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def start_event_log(binary_filename=None):
+    global global_listener, global_saved_handlers
+    if global_listener:
+        return
+    root = logging.getLogger()
+    global_saved_handlers = list(root.handlers)
+    handlers = list(global_saved_handlers)
+    if binary_filename:
+        handlers.append(BinaryEventHandler(binary_filename))
+    records = queue.SimpleQueue()
+    for handler in global_saved_handlers:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    global_listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    global_listener.start()
+    atexit.register(stop_event_log)
+
+
+# Write out everything that has been logged so far, stop the listener thread, and put the original handlers back
+
+def stop_event_log():
+    global global_listener
+    if not global_listener:
+        return
+    listener = global_listener
+    global_listener = None
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, DeferredQueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        if handler in global_saved_handlers:
+            root.addHandler(handler)
+        else:
+            handler.close()
+
+
+# Read the (created, levelno, component, action, fields) events from a binary event log, with the Timestamps back in
+# New York time. A partial record at the end (from a crash in the middle of a write) is ignored
+
+def read_event_log(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    events = list()
+    offset = 0
+    while offset + record_header.size <= len(data):
+        (length,) = record_header.unpack_from(data, offset)
+        offset += record_header.size
+        if offset + length > len(data):
+            logging.warning(f"c=eventLog a=read s=truncatedRecord filename={filename}")
+            break
+        created, levelno, component, action, fields, timestamp_keys = pickle.loads(data[offset:offset + length])
+        for key in timestamp_keys:
+            fields[key] = pd.Timestamp(fields[key], tz='UTC').tz_convert('America/New_York')
+        events.append((created, levelno, component, action, fields))
+        offset += length
+    return events
+
+
+# The text lines for the events in a binary event log (optionally with the time each one was logged)
+
+def render_event_log(filename, timestamps=False, level=logging.NOTSET):
+    for created, levelno, component, action, fields in read_event_log(filename):
+        if levelno < level:
+            continue
+        line = render_event(component, action, fields)
+        if timestamps:
+            when = pd.Timestamp(created, unit='s', tz='UTC').tz_convert('America/New_York')
+            line = f"{when.strftime('%Y-%m-%d %H:%M:%S.%f')} {line}"
+        yield line
@@ -0,0 +1,149 @@
+# The IndicatorEngine keeps the common indicators up to date for every symbol as the bars arrive, so the trade
+# identifiers can read them instead of each buffering its own bars and re-deriving them.
+#
+#   engine = IndicatorEngine(symbols)  # one per trading day (or call reset() at the start of each day)
+#   engine.update(current_bars)  # each bar, with the bars from get_bars (symbol, open, high, low, close, volume, vwap)
+#   engine.value('return_pct_3', symbol)  # the gain over the last 3 bars (open of 3 bars ago to the latest close)
+#
+# The indicators (for each symbol, as of its latest bar of the day; NaN until the symbol has enough bars):
+#   close: the latest close
+#   return_pct_{n} (for each n in return_bars): 100 * (latest close / open n-1 bars ago - 1), so return_pct_1 is the
+#       gain during the latest bar
+#   vwap: the volume-weighted average price over the last vwap_bars bars (each bar's vwap weighted by its volume), or
+#       over all of today's bars until there are vwap_bars of them
+#   atr: the average true range over the last atr_bars bars (the first bar of the day uses its high - low)
+#   volume_z: the z-score of the latest bar's volume against the last volume_bars bars (including the latest)
+#   bars: the number of bars the symbol has had today
+#
+# The state is one NumPy array per quantity, with a row per symbol: ring buffers of the last few values, and running
+# sums over the windows. Each bar adds the new value to the sums and subtracts the one that drops out of the window,
+# so the work per symbol per bar doesn't depend on the window sizes. The engine works the same way for 5-minute and
+# 1-minute bars (the windows are in bars); use one engine per bar size.
+#
+# replay_panel() runs the engine over a historical panel (see ReportProcessing/edgeStudy.py) one bar time at a time,
+# through the same update(), so studies see exactly the values the traders saw.
+
+import numpy as np
+import pandas as pd
+
+
+class IndicatorEngine:
+    def __init__(self, symbols, return_bars=(1, 3), vwap_bars=12, atr_bars=14, volume_bars=20):
+        self.symbols = list(symbols)
+        self.symbol_index = pd.Index(self.symbols)  # for get_indexer
+        self.symbol_positions = {symbol: i for i, symbol in enumerate(self.symbols)}  # str: row in the arrays
+        self.return_bars = tuple(return_bars)
+        self.vwap_bars = vwap_bars
+        self.atr_bars = atr_bars
+        self.volume_bars = volume_bars
+        self.names = (['close'] + [f"return_pct_{n}" for n in self.return_bars]
+                      + ['vwap', 'atr', 'volume_z', 'bars'])
+        self.reset()
+
+    # Clear the state (e.g., at the start of a trading day)
+
+    def reset(self):
+        symbol_count = len(self.symbols)
+        self.bar_counts = np.zeros(symbol_count, dtype=np.int64)
+        self.last_close = np.full(symbol_count, np.nan)
+        self.opens = np.zeros((symbol_count, max(self.return_bars)))  # ring buffer of the recent opens
+        self.dollar_volumes = RollingSum(symbol_count, self.vwap_bars)  # vwap * volume
+        self.volumes = RollingSum(symbol_count, self.vwap_bars)
+        self.true_ranges = RollingSum(symbol_count, self.atr_bars)
+        self.z_volumes = RollingSum(symbol_count, self.volume_bars)
+        self.z_volumes_squared = RollingSum(symbol_count, self.volume_bars)
+        self.values = {name: np.full(symbol_count, np.nan) for name in self.names}  # name: value for each symbol
+        self.values['bars'] = np.zeros(symbol_count)
+
+    # Consume one bar time's bars (a DataFrame with a row per symbol). Symbols without a bar keep their values, and
+    # symbols the engine doesn't know about are ignored
+
+    def update(self, bars):
+        rows = self.symbol_index.get_indexer(bars['symbol'])
+        known = rows >= 0
+        rows = rows[known]
+        open_, high, low, close, volume = (bars[column].to_numpy(dtype=np.float64)[known]
+                                           for column in ['open', 'high', 'low', 'close', 'volume'])
+        vwap = bars['vwap'].to_numpy(dtype=np.float64)[known] if 'vwap' in bars else (high + low + close) / 3
+        counts = self.bar_counts[rows]  # bars before this one
+        self.opens[rows, counts % self.opens.shape[1]] = open_
+        previous_close = self.last_close[rows]
+        true_range = np.where(np.isnan(previous_close), high - low,
+                              np.fmax(high, previous_close) - np.fmin(low, previous_close))
+        dollar_volume = self.dollar_volumes.add(rows, counts, vwap * volume)
+        window_volume = self.volumes.add(rows, counts, volume)
+        true_range_sum = self.true_ranges.add(rows, counts, true_range)
+        volume_sum = self.z_volumes.add(rows, counts, volume)
+        volume_sum_squared = self.z_volumes_squared.add(rows, counts, volume ** 2)
+
+        with np.errstate(divide='ignore', invalid='ignore'):  # The NaNs are masked out by the np.where()s
+            for n in self.return_bars:
+                first_open = self.opens[rows, (counts - (n - 1)) % self.opens.shape[1]]
+                self.values[f"return_pct_{n}"][rows] = np.where(counts >= n - 1, 100 * (close / first_open - 1),
+                                                                np.nan)
+            self.values['vwap'][rows] = np.where(window_volume > 0, dollar_volume / window_volume, np.nan)
+            self.values['atr'][rows] = np.where(counts + 1 >= self.atr_bars, true_range_sum / self.atr_bars, np.nan)
+            mean_volume = volume_sum / self.volume_bars
+            variance = (volume_sum_squared - self.volume_bars * mean_volume ** 2) / (self.volume_bars - 1)
+            std_volume = np.sqrt(np.clip(variance, 0, None))
+            self.values['volume_z'][rows] = np.where((counts + 1 >= self.volume_bars) & (std_volume > 0),
+                                                     (volume - mean_volume) / std_volume, np.nan)
+        self.values['close'][rows] = close
+        self.last_close[rows] = close
+        self.bar_counts[rows] = counts + 1
+        self.values['bars'][rows] = counts + 1
+
+    # region Readouts
+    # The latest value of an indicator for one symbol (NaN if the symbol isn't in the engine)
+
+    def value(self, name, symbol):
+        i = self.symbol_positions.get(symbol)
+        return self.values[name][i] if i is not None else np.nan
+
+    # The latest values of all the indicators, one row per symbol
+
+    def indicators(self, symbols=None):
+        if symbols is None:
+            return pd.DataFrame(self.values, index=pd.Index(self.symbols, name='symbol'))
+        rows = self.symbol_index.get_indexer(symbols)
+        return pd.DataFrame({name: np.where(rows >= 0, values[rows], np.nan) for name, values in self.values.items()},
+                            index=pd.Index(symbols, name='symbol'))
+    # endregion / Readouts
+
+
+# Running sums over the last window values, for each row. The values are kept in a ring buffer, so each add() replaces
+# the value that drops out of the window
+
+class RollingSum:
+    def __init__(self, row_count, window):
+        self.window = window
+        self.values = np.zeros((row_count, window))
+        self.sums = np.zeros(row_count)
+
+    # Add value (an array) to the given rows, where counts are the number of values each row already has. Returns
+    # those rows' new sums
+
+    def add(self, rows, counts, value):
+        slots = counts % self.window
+        self.sums[rows] += value - self.values[rows, slots]
+        self.values[rows, slots] = value
+        return self.sums[rows]
+
+
+# The indicators for each row of a panel (sorted by symbol and timestamp, like edgeStudy.read_panel), as of that row's
+# bar: the engine is fed every bar time in order, and reset at the start of each day. Returns a DataFrame with the
+# indicator columns and the panel's index
+
+def replay_panel(panel, **engine_parameters):
+    engine = IndicatorEngine(panel['symbol'].unique(), **engine_parameters)
+    results = {name: np.full(len(panel), np.nan) for name in engine.names}
+    current_date = None
+    for bar_time, bars in panel.reset_index(drop=True).groupby('timestamp', sort=True):
+        if bar_time.date() != current_date:
+            engine.reset()
+            current_date = bar_time.date()
+        engine.update(bars)
+        rows = engine.symbol_index.get_indexer(bars['symbol'])
+        for name in engine.names:
+            results[name][bars.index] = engine.values[name][rows]
+    return pd.DataFrame(results, index=panel.index)
@@ -0,0 +1,88 @@
+# Lightweight instrumentation for the hot paths: timing spans and counters, summarized per trading day.
+#
+#   with span('getBars'):
+#       bars = get_bars(...)
+#   count('candidates', len(candidates))
+#
+# Instrumentation is off by default. When it's off, span() returns a shared do-nothing context manager and count()
+# returns right away, so leaving the calls in the trading loop costs next to nothing. Turn it on with
+# set_instrumentation(True).
+#
+# log_instrumentation_summary() logs one line per span (count, p50/p90/p99/max and total milliseconds) and one line
+# per counter, in the usual c= a= style, and then resets everything for the next day.
+
+import contextlib
+import logging
+import threading
+import time
+
+global_instrumentation_enabled = False
+global_span_durations = dict()  # span name: list of int (nanoseconds)
+global_counters = dict()  # counter name: int
+global_counters_lock = threading.Lock()  # count() is a read-modify-write, and fills can arrive on other threads
+no_span = contextlib.nullcontext()
+
+
+def set_instrumentation(enabled=True):
+    global global_instrumentation_enabled
+    global_instrumentation_enabled = enabled
+
+
+def instrumentation_enabled():
+    return global_instrumentation_enabled
+
+
+class Span:
+    __slots__ = ['name', 'start']
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter_ns() - self.start
+        durations = global_span_durations.get(self.name)
+        if durations is None:
+            durations = global_span_durations.setdefault(self.name, list())
+        durations.append(duration)  # list.append is atomic, so spans can be recorded from several threads
+        return False
+
+
+def span(name):
+    if not global_instrumentation_enabled:
+        return no_span
+    return Span(name)
+
+
+def count(name, amount=1):
+    if not global_instrumentation_enabled:
+        return
+    with global_counters_lock:
+        global_counters[name] = global_counters.get(name, 0) + amount
+
+
+# The value at fraction (e.g., 0.99 for p99) of a sorted list (also used by the latency monitor and the bar scheduler)
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def log_instrumentation_summary(component_name, trading_date):
+    global global_span_durations, global_counters
+    date_str = str(trading_date.date())
+    for name, durations in sorted(global_span_durations.items()):
+        durations = sorted(durations)
+        logging.info(f"c={component_name} a=spanSummary date={date_str} span={name} n={len(durations)} "
+                     + f"p50Ms={round(percentile(durations, 0.5) / 1e6, 3)} "
+                     + f"p90Ms={round(percentile(durations, 0.9) / 1e6, 3)} "
+                     + f"p99Ms={round(percentile(durations, 0.99) / 1e6, 3)} "
+                     + f"maxMs={round(durations[-1] / 1e6, 3)} totalMs={round(sum(durations) / 1e6, 1)}")
+    with global_counters_lock:
+        counters, global_counters = global_counters, dict()
+    for name, value in sorted(counters.items()):
+        logging.info(f"c={component_name} a=counterSummary date={date_str} counter={name} value={value}")
+    global_span_durations = dict()
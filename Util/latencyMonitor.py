@@ -0,0 +1,82 @@
+# Decision latency tracking. In PAPER/PRODUCTION a signal loses value by the second, so we time each trade from the
+# bar that triggered it to the fill.
+#
+# Each TradeInfo has a latency dict of stage: wall-clock time (seconds since the epoch) for these stages:
+#   bar_close: the bar boundary (when the bar that triggered the trade closed). Only recorded when trading live, since
+#       in SIMULATION the bars are from the past
+#   bar_available: when the trading loop had the bars in hand
+#   triggered: when the trade identifier fired
+#   buy_submitted / sell_submitted: when the order was placed (alpacaOperations.place_market_*_order)
+#   buy_filled / sell_filled: when we saw the fill (TradeInfo.add_*_order_execution, which the broker fills go through)
+#
+# The latency_intervals below are exported with the tracker report (in milliseconds). During the session, the
+# LatencyMonitor keeps a rolling window of each interval, logs p50/p90/p99 after each interval that had new trades,
+# and logs a latencyAlert warning for any trade that goes over its interval's threshold.
+
+import collections
+import logging
+
+from Util.eventLog import log_event
+from Util.instrumentation import percentile
+
+# interval name: (start stage, end stage)
+latency_intervals = {'barToTrigger': ('bar_available', 'triggered'),
+                     'triggerToSubmit': ('triggered', 'buy_submitted'),
+                     'barCloseToSubmit': ('bar_close', 'buy_submitted'),
+                     'buySubmitToFill': ('buy_submitted', 'buy_filled'),
+                     'sellSubmitToFill': ('sell_submitted', 'sell_filled')}
+
+default_alert_thresholds_ms = {'triggerToSubmit': 500, 'barCloseToSubmit': 5000, 'buySubmitToFill': 2000,
+                               'sellSubmitToFill': 2000}
+
+
+# The interval (in milliseconds) from a trade's latency dict, or None if either stage hasn't happened yet
+
+def latency_ms(latency, interval):
+    start_stage, end_stage = latency_intervals[interval]
+    start, end = latency.get(start_stage), latency.get(end_stage)
+    if start is None or end is None:
+        return None
+    return round(1000 * (end - start), 3)
+
+
+class LatencyMonitor:
+    def __init__(self, component_name, window=100, alert_thresholds_ms=None):
+        self.component_name = component_name
+        self.alert_thresholds_ms = alert_thresholds_ms if alert_thresholds_ms else default_alert_thresholds_ms
+        self.samples = {interval: collections.deque(maxlen=window) for interval in latency_intervals}
+        self.observed = set()  # (symbol, decision_time, interval) that have already been added to the samples
+        self.new_samples = 0
+
+    # Add the intervals that have completed since the last call, for each of the trades
+
+    def observe(self, trades):
+        for trade in trades:
+            for interval in latency_intervals:
+                key = (trade.symbol, trade.decision_time, interval)
+                if key in self.observed:
+                    continue
+                ms = latency_ms(trade.latency, interval)
+                if ms is None:
+                    continue
+                self.observed.add(key)
+                self.samples[interval].append(ms)
+                self.new_samples += 1
+                threshold = self.alert_thresholds_ms.get(interval)
+                if threshold is not None and ms > threshold:
+                    log_event(self.component_name, 'latencyAlert', level=logging.WARNING, interval=interval,
+                              sym=trade.symbol, ms=ms, thresholdMs=threshold)
+
+    # Log the rolling percentiles (only if there were new samples since the last summary)
+
+    def log_summary(self, decision_time):
+        if self.new_samples == 0:
+            return
+        for interval, samples in self.samples.items():
+            if len(samples) == 0:
+                continue
+            values = sorted(samples)
+            log_event(self.component_name, 'latencySummary', dt=decision_time, interval=interval, n=len(values),
+                      p50Ms=percentile(values, 0.5), p90Ms=percentile(values, 0.9), p99Ms=percentile(values, 0.99),
+                      maxMs=values[-1])
+        self.new_samples = 0
@@ -0,0 +1,111 @@
+# Memory accounting for the bar caches and the big intermediate DataFrames, so we can see how much memory they take
+# (before the machine starts swapping) and keep them under a budget.
+#
+#   register_cache(name, evict): a module-level cache that can be dropped (and re-read later) when we need the memory
+#   record_size(name, obj): record the deep size of a cache's new contents, or of a large intermediate. We keep the
+#       high-water mark for each name
+#   available_bytes(): how much of the budget is left after the caches
+#   fits_in_budget(extra_bytes): would the registered caches plus extra_bytes stay under the budget? Code with a
+#       chunked alternative (e.g., the cross-join in get_trading_pairs) uses this to pick its code path
+#   enforce_budget(keep): evict the largest caches (other than keep) until the caches fit in the budget
+#   log_memory_summary(component_name, trading_date): log the high-water marks for the day (and the process peak RSS
+#       where the platform reports it), then reset them
+#
+# There's no budget by default (set_memory_budget(None)), in which case we only do the accounting.
+
+import logging
+import sys
+
+import pandas as pd
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+global_memory_budget = None  # bytes, or None for no budget
+global_caches = dict()  # name: {'evict': callable, 'bytes': int}
+global_high_water = dict()  # name: bytes
+
+
+def set_memory_budget(budget_bytes=None):
+    global global_memory_budget
+    global_memory_budget = budget_bytes
+
+
+def memory_budget():
+    return global_memory_budget
+
+
+# Deep size (in bytes) of a DataFrame or Series (including the strings in object columns), or of a list/dict of them
+
+def deep_size(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True, index=True)
+        return int(usage.sum()) if isinstance(obj, pd.DataFrame) else int(usage)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_size(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(deep_size(value) for value in obj)
+    return sys.getsizeof(obj)
+
+
+def register_cache(name, evict):
+    global_caches[name] = {'evict': evict, 'bytes': 0}
+
+
+# Record the size of obj (or a number of bytes) under name. Returns the size in bytes
+
+def record_size(name, obj):
+    size = obj if isinstance(obj, int) else deep_size(obj)
+    if name in global_caches:
+        global_caches[name]['bytes'] = size
+    global_high_water[name] = max(global_high_water.get(name, 0), size)
+    return size
+
+
+def cached_bytes():
+    return sum(cache['bytes'] for cache in global_caches.values())
+
+
+# Bytes left in the budget (after the caches), or None if there's no budget
+
+def available_bytes():
+    return None if global_memory_budget is None else max(0, global_memory_budget - cached_bytes())
+
+
+def fits_in_budget(extra_bytes=0):
+    return global_memory_budget is None or cached_bytes() + extra_bytes <= global_memory_budget
+
+
+def enforce_budget(keep=None):
+    if global_memory_budget is None:
+        return
+    for name, cache in sorted(global_caches.items(), key=lambda item: -item[1]['bytes']):
+        if cached_bytes() <= global_memory_budget:
+            return
+        if name == keep or cache['bytes'] == 0:
+            continue
+        logging.info(f"c=memory a=evict cache={name} mb={round(cache['bytes'] / 2 ** 20, 1)} "
+                     + f"budgetMb={round(global_memory_budget / 2 ** 20, 1)}")
+        cache['evict']()
+        cache['bytes'] = 0
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # macOS reports bytes, Linux reports kilobytes
+
+
+def log_memory_summary(component_name, trading_date):
+    global global_high_water
+    date_str = str(trading_date.date())
+    for name, size in sorted(global_high_water.items()):
+        logging.info(f"c={component_name} a=memorySummary date={date_str} name={name} "
+                     + f"highWaterMb={round(size / 2 ** 20, 1)}")
+    peak_rss = peak_rss_bytes()
+    logging.info(f"c={component_name} a=memorySummary date={date_str} cachedMb={round(cached_bytes() / 2 ** 20, 1)} "
+                 + f"peakRssMb={round(peak_rss / 2 ** 20, 1) if peak_rss else None}")
+    global_high_water = dict()
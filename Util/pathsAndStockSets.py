@@ -6,7 +6,9 @@
 # We store data files in folders corresponding to their use (e.g., bar data files) and which stock set they are. I keep
 # the development stock set files in a sub-folder of the main production set, but may revisit that someday
 
+import datetime as dt
 import enum
+import glob
 import os
 import pandas as pd
 
@@ -42,10 +44,39 @@ def set_stock_set(new_stock_set=StockSet.SP500):
 #   Date added: string in the form '1957-03-04' representing (probably) when the stock was added to NYSE
 #   CIK
 #   Founded: Mostly 4-character dates
+#
+# Rather than fetching the table every time this module is imported, we keep versioned snapshots of it in the
+# DerivedFiles folder (sp500Table_yyyy-mm-dd.csv) and load the latest one the first time it's needed. Call
+# refresh_sp500_snapshot() to grab a new version from Wikipedia (we also do this if there aren't any snapshots yet).
 
 # Note: You may need to pip install lxml
 
-sp500_table = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')[0]
+sp500_url = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
+global_sp500_table = None
+
+
+def sp500_snapshot_files():
+    return sorted(glob.glob(prod_derived_files_path + 'sp500Table_*.csv'))
+
+
+def refresh_sp500_snapshot():
+    global global_sp500_table
+    table = pd.read_html(sp500_url)[0]
+    filename = prod_derived_files_path + f"sp500Table_{dt.date.today()}.csv"
+    table.to_csv(filename + '.tmp', index=False)
+    os.replace(filename + '.tmp', filename)
+    global_sp500_table = table
+    return filename
+
+
+def sp500_table():
+    global global_sp500_table
+    if global_sp500_table is None:
+        snapshots = sp500_snapshot_files()
+        if len(snapshots) == 0:
+            snapshots = [refresh_sp500_snapshot()]
+        global_sp500_table = pd.read_csv(snapshots[-1], keep_default_na=False)
+    return global_sp500_table
 
 
 # return all (503) stocks in the S&P 500 if we're using the production data set, otherwise the smaller dev set
@@ -54,7 +85,7 @@ def get_symbols():
     if global_stock_set == StockSet.DEVELOPMENT:
         return ['PARA', 'PKG', 'POOL', 'RHI', 'TSLA']
     else:
-        return sp500_table['Symbol'].to_list()
+        return sp500_table()['Symbol'].to_list()
 
 
 # Paths are based off of a single file location, which should be stored as an environment variable
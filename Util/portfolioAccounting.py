@@ -0,0 +1,92 @@
+# The PortfolioAccount keeps the portfolio totals up to date incrementally, as trades are opened, filled, re-priced,
+# and closed, so the trading loop doesn't have to rescan every trade on every bar. It's owned by the TradeTracker,
+# which feeds it the changes.
+#
+# It tracks:
+#   realized_profit: total profit of the closed trades
+#   unrealized_profit: total current profit of the open trades (based on their current_price)
+#   exposure: total market value of the open positions (negative for shorts)
+#   active_positions: the number of open trades (including trades whose opening order hasn't filled yet)
+#
+# begin_period() marks the start of a reporting period (e.g., a trading day). period_realized_profit() and
+# period_profit() then report the realized profit and the total (realized + unrealized) profit since then, and
+# period_active_positions() the number of trades opened since then that are still open. The traders cap their trades
+# per day with period_active_positions(): a trade left open from an earlier day (e.g., a sell that never filled) still
+# counts in active_positions, but it shouldn't use up one of today's trades.
+
+from alpaca.trading.enums import PositionSide
+
+
+class PortfolioAccount:
+    def __init__(self):
+        self.realized_profit = 0.0
+        self.unrealized_profit = 0.0
+        self.exposure = 0.0
+        self.active_positions = 0
+        self.period_start_realized_profit = 0.0
+        self.period_open_trades = set()  # (symbol, decision_time) of the open trades opened since begin_period
+        self.open_trade_values = dict()  # (symbol, decision_time): (current profit, exposure) of each open trade
+
+    def begin_period(self):
+        self.period_start_realized_profit = self.realized_profit
+        self.period_open_trades = set()
+
+    def period_realized_profit(self):
+        return self.realized_profit - self.period_start_realized_profit
+
+    def period_profit(self):
+        return self.period_realized_profit() + self.unrealized_profit
+
+    def period_active_positions(self):
+        return len(self.period_open_trades)
+
+    def on_open_trade(self, trade):
+        self.active_positions += 1
+        self.period_open_trades.add((trade.symbol, trade.decision_time))
+        self.open_trade_values[(trade.symbol, trade.decision_time)] = (0.0, 0.0)
+
+    # Update the totals after a change to an open trade (a fill or a new current_price). O(1)
+
+    def on_trade_update(self, trade):
+        key = (trade.symbol, trade.decision_time)
+        if key not in self.open_trade_values:
+            return
+        old_profit, old_exposure = self.open_trade_values[key]
+        new_profit, new_exposure = trade.current_profit(), position_exposure(trade)
+        self.unrealized_profit += new_profit - old_profit
+        self.exposure += new_exposure - old_exposure
+        self.open_trade_values[key] = (new_profit, new_exposure)
+
+    def on_close_trade(self, trade):
+        key = (trade.symbol, trade.decision_time)
+        if key not in self.open_trade_values:
+            return
+        old_profit, old_exposure = self.open_trade_values.pop(key)
+        self.unrealized_profit -= old_profit
+        self.exposure -= old_exposure
+        self.realized_profit += trade.current_profit()
+        self.active_positions -= 1
+        self.period_open_trades.discard(key)
+
+    # Recompute everything from scratch (e.g., after rebuilding a tracker from a journal). The open trades all count as
+    # opened in the current period
+
+    def rebuild(self, active_trades, closed_trades):
+        self.__init__()
+        for trade in closed_trades:
+            self.realized_profit += trade.current_profit()
+        for trade in active_trades:
+            self.on_open_trade(trade)
+            self.on_trade_update(trade)
+
+
+# Market value of the shares we currently hold (or owe, for shorts) for the trade
+
+def position_exposure(trade):
+    if not trade.current_price:
+        return 0.0
+    if (trade.position_side == PositionSide.LONG) and trade.actual_buy_price and not trade.actual_sell_price:
+        return trade.shares * trade.current_price
+    if (trade.position_side == PositionSide.SHORT) and trade.actual_sell_price and not trade.actual_buy_price:
+        return -trade.shares * trade.current_price
+    return 0.0
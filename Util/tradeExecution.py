@@ -4,10 +4,14 @@
 #
 # For right now, I'm just implementing the 2nd one
 
+import logging
+
 from alpaca.trading.enums import OrderSide, PositionSide
 
 from TradingApis.alpacaOperations import (place_market_buy_order, place_market_sell_order,
                                           get_latest_bar, process_orders_for_trade)
+from Util.eventLog import log_event
+from Util.instrumentation import span, count
 from Util.tradeTracker import trade_tracker
 
 
@@ -45,38 +49,47 @@ class SingleStockTradeExecutor:
         return False
 
 
+# Process the orders and the latest bar for each executor that isn't complete. The profit figures come from the
+# tracker's PortfolioAccount (which is updated incrementally by the fills and price updates), so we don't rescan the
+# trades. realized_profit and current_profit cover the current period (see PortfolioAccount.begin_period)
+
 def process_trade_executors(trade_executors, decision_time, buying_power=0):
-    current_profit = 0
-    realized_profit = 0
     for executor in trade_executors:
+        if executor.state == 'complete':
+            continue
         trade = executor.trade
-        if executor.state != 'complete':
+        count('activeExecutors')
+        with span('processOrders'):
             _, amount_transacted, completed_order = process_orders_for_trade(trade, decision_time)
-            if completed_order:
-                buying_power += amount_transacted
-                is_done = executor.handle_order_fill(completed_order, decision_time)
-                if is_done:
-                    executor.state = 'complete'
-                    trade_tracker().close_trade(trade)
+        if completed_order:
+            buying_power += amount_transacted
+            is_done = executor.handle_order_fill(completed_order, decision_time)
+            if is_done:
+                executor.state = 'complete'
+                trade_tracker().close_trade(trade)
         if executor.state != 'complete':
-            success, bar = get_latest_bar(trade.symbol, decision_time)
-            if success:
-                executor.consume_5min_bar(bar, decision_time)
-        if executor.state == 'complete':
-            realized_profit += trade.current_profit()
-        current_profit += trade.current_profit()
-    return buying_power, realized_profit, current_profit
+            with span('executorBar'):
+                success, bar = get_latest_bar(trade.symbol, decision_time)
+                if success:
+                    trade.update_current_price(bar['close'])
+                    executor.consume_5min_bar(bar, decision_time)
+    account = trade_tracker().account
+    return buying_power, account.period_realized_profit(), account.period_profit()
 
 
 # region TimedHoldLongTradeExecutor
 # Simple executor that buys a stock, holds it for a fixed time, and then sells it
 # States: 'buy', 'hold', 'sell', 'complete'
+# latency: optional dict of the latency stages that happened before the trade was opened (bar_close, bar_available,
+#   triggered)
 class TimedHoldLongTradeExecutor(SingleStockTradeExecutor):
-    def __init__(self, symbol, shares, decision_time, target_buy_price, hold_duration):
+    def __init__(self, symbol, shares, decision_time, target_buy_price, hold_duration, latency=None):
         self.decision_time = decision_time
         self.actual_buy_price = None
         self.hold_duration = hold_duration
         trade = trade_tracker().open_trade(symbol, decision_time, PositionSide.LONG)
+        if latency:
+            trade.latency.update(latency)
         _ = place_market_buy_order(trade, shares, target_buy_price, decision_time)
         SingleStockTradeExecutor.__init__(self, trade, 'buy')
 
@@ -89,14 +102,16 @@ class TimedHoldLongTradeExecutor(SingleStockTradeExecutor):
             self.state = 'complete'
             return True
         else:
-            print(f"SimpleLongTradeExecutor: Unknown trade for {self.state}: {order.order_side} {order.order_type}")
+            log_event('tradeExecution', 'unknownTrade', level=logging.WARNING, sym=self.trade.symbol, state=self.state,
+                      side=order.order_side.name, type=order.order_type.name)
             return False
 
     def consume_1min_bar(self, bar, ts):
         return False
 
     def consume_5min_bar(self, bar, ts):
-        if (ts - self.decision_time).seconds >= self.hold_duration * 60:  # Cash out after X minutes
+        # Cash out after X minutes (once: the sell order stays active until it's filled)
+        if self.state != 'sell' and (ts - self.decision_time).seconds >= self.hold_duration * 60:
             target_sell_price = bar['close']
             _ = place_market_sell_order(self.trade, self.trade.shares, target_sell_price, ts)
             self.state = 'sell'
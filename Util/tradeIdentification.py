@@ -9,6 +9,14 @@
 #
 # details will be a dictionary containing details of the trade opportunity (e.g., symbol, target price,
 # direction, ...)
+#
+# Bars are expected to come from read_intraday_details (via get_bars or get_latest_bar), so they include the integer
+# session_minute column. Identifiers compare times as session minutes rather than time strings
+#
+# Identifiers can also read their signals from a shared IndicatorEngine (see Util/indicatorEngine.py) that the trader
+# updates once per bar for all the symbols, instead of buffering bars and re-deriving the signals themselves:
+#   consume_5min_indicators(IndicatorEngine, decision_minute) -- returns (True, details) if there is a trading
+#       opportunity (the multi-stock class has the same method)
 
 # The class for multi-stock trades supports the following methods:
 #   __init__(self, symbols, initial_state) -- constructor
@@ -16,8 +24,8 @@
 #   consume_5min_bars(DataFrame)  -- returns (True, details) if there is a trading opportunity
 #   consume_snapshots(dict)  -- returns (True, details) if there is a trading opportunity
 
-import pandas as pd
-from Util.datesAndTimestamps import time_string
+from Util.datesAndTimestamps import session_minute_from_string
+from Util.instrumentation import count
 
 
 class SingleStockTradeIdentifier:
@@ -34,6 +42,9 @@ class SingleStockTradeIdentifier:
     def consume_snapshot(self, snapshot):
         return False, None
 
+    def consume_5min_indicators(self, indicators, decision_minute):
+        return False, None
+
 
 class DoubleStockTradeIdentifier:
     def __init__(self, symbol1, symbol2, initial_state):
@@ -50,6 +61,9 @@ class DoubleStockTradeIdentifier:
     def consume_snapshots(self, symbol1_snapshot, symbol2_snapshot):
         return False, None
 
+    def consume_5min_indicators(self, indicators, decision_minute):
+        return False, None
+
 
 # region HigherHighsHigherLowsTradeIdentifier
 # States:
@@ -67,17 +81,17 @@ class HigherHighsHigherLowsTradeIdentifier(SingleStockTradeIdentifier):
         SingleStockTradeIdentifier.__init__(self, symbol, 'looking_for_trades')
         self.minimum_gain_pct = minimum_gain_pct
         self.maximum_drop_pct = maximum_drop_pct
-        self.earliest_trade_time = earliest_trade_time
+        self.earliest_trade_minute = session_minute_from_string(earliest_trade_time)
         self.recent_bars = list()  # list of Series, containing bars from the previous 10 minutes
 
     def consume_1min_bar(self, bar):
         return False, None
 
     def consume_5min_bar(self, bar):
-        current_time = time_string(bar['timestamp'] + pd.Timedelta(minutes=5))
+        current_minute = bar['session_minute'] + 5
         self.recent_bars = self.recent_bars[-2:]
         self.recent_bars.append(bar)
-        if current_time >= self.earliest_trade_time and len(self.recent_bars) == 3:
+        if current_minute >= self.earliest_trade_minute and len(self.recent_bars) == 3:
             # first, check for higher highs and higher lows
             b0, b1, b2 = self.recent_bars[0], self.recent_bars[1], self.recent_bars[2]
             if not ((b0['high'] < b1['high'] < b2['high']) and (b0['low'] < b1['low'] < b2['low'])):
@@ -89,6 +103,7 @@ class HigherHighsHigherLowsTradeIdentifier(SingleStockTradeIdentifier):
             drop_pct = 100 * (bar['high'] / bar['close'] - 1)
             if high_gain_pct + low_gain_pct >= self.minimum_gain_pct and drop_pct <= self.maximum_drop_pct:
                 details = {'symbol': self.symbol, 'target_buy_price': float(round(bar['close'], 4))}
+                count('hhhlTriggers')
                 return True, details
         return False, None
 
@@ -116,16 +131,17 @@ class FastFollowerTradeIdentifier(DoubleStockTradeIdentifier):
         self.ind_15min_trigger_pct = ind_15min_trigger_pct
         self.ind_5min_trigger_pct = ind_5min_trigger_pct
         self.dep_5min_trigger_pct = dep_5min_trigger_pct
-        self.earliest_trade_time = earliest_trade_time
+        self.earliest_trade_minute = session_minute_from_string(earliest_trade_time)
         self.independent_bars = list()
+        self.independent_opens = list()  # float: the independent symbol's last 3 opens (consume_5min_indicators)
 
     def consume_1min_bars(self, symbol1_bar, symbol2_bar):
         return False, None
 
     def consume_5min_bars(self, symbol1_bar, symbol2_bar):
-        current_time = time_string(symbol1_bar['timestamp'] + pd.Timedelta(minutes=5))
+        current_minute = symbol1_bar['session_minute'] + 5
         self.independent_bars.append(symbol1_bar)
-        if current_time >= self.earliest_trade_time and len(self.independent_bars) > 2:
+        if current_minute >= self.earliest_trade_minute and len(self.independent_bars) > 2:
             ind_trigger_last_15_pct = 100 * (symbol1_bar['close'] / self.independent_bars[-3]['open'] - 1)
             ind_trigger_last_5_pct = 100 * (symbol1_bar['close'] / symbol1_bar['open'] - 1)
             dep_trigger_last_5_pct = 100 * (symbol2_bar['close'] / symbol2_bar['open'] - 1)
@@ -136,9 +152,33 @@ class FastFollowerTradeIdentifier(DoubleStockTradeIdentifier):
             details = {'symbol': self.symbol2,
                        'target_buy_price': float(round(symbol2_bar['close'], 4)),
                        'independent_symbol': self.symbol1}
+            count('fastFollowerTriggers')
             return True, details
         return False, None
 
+    # The same triggers as consume_5min_bars, from an IndicatorEngine (with return_pct_1) that has consumed the latest
+    # bars. Call it for the same bars as consume_5min_bars (only when both symbols have a bar). The 15-minute trigger
+    # has to use the pair's own bar history, like consume_5min_bars does: the engine sees every one of the independent
+    # symbol's bars, including the ones where the dependent symbol had no bar. So we keep the independent symbol's
+    # opens from the pair's bars (each open is the engine's close and return_pct_1 turned back into a price, which
+    # matches the bar's open up to rounding)
+
+    def consume_5min_indicators(self, indicators, decision_minute):
+        close_1, return_1 = indicators.value('close', self.symbol1), indicators.value('return_pct_1', self.symbol1)
+        self.independent_opens = self.independent_opens[-2:] + [close_1 / (1 + return_1 / 100)]
+        if decision_minute < self.earliest_trade_minute or len(self.independent_opens) <= 2:
+            return False, None
+        ind_trigger_last_15_pct = 100 * (close_1 / self.independent_opens[0] - 1)
+        if not (ind_trigger_last_15_pct > self.ind_15min_trigger_pct  # (a NaN never triggers)
+                and return_1 > self.ind_5min_trigger_pct
+                and indicators.value('return_pct_1', self.symbol2) > self.dep_5min_trigger_pct):
+            return False, None
+        details = {'symbol': self.symbol2,
+                   'target_buy_price': float(round(indicators.value('close', self.symbol2), 4)),
+                   'independent_symbol': self.symbol1}
+        count('fastFollowerTriggers')
+        return True, details
+
     def consume_snapshots(self, symbol1_snapshot, symbol2_snapshot):
         return False, None
 # endregion / FastFollowerTradeIdentifier
@@ -0,0 +1,231 @@
+# The TradeJournal streams trade and order events to an append-only file as they happen, so a crash doesn't lose the
+# trades that were made before it (and we don't have to wait for a giant to_csv at the end of a long backtest).
+#
+# File format: a sequence of records, each one a 4-byte little-endian length followed by a pickled (kind, payload)
+# tuple, where kind is one of:
+#   'trade': payload is a dict with the current values of a TradeInfo's fields
+#   'order': payload is a dict with the current values of an OrderInfo's fields
+#   'close_trade': payload is the (symbol, decision_time) key of the trade that was closed
+#
+# Each record is a full snapshot of the trade (or order), so replaying the journal just keeps the latest version of
+# each one.
+#
+# Resuming from a checkpoint: the records written after the checkpoint was saved describe work that the resumed run
+# does again (and the re-placed orders get new order ids, so replaying both copies would count those orders twice).
+# So before saving a checkpoint, the traders call journal.flush(), which waits until everything recorded so far is on
+# disk and returns the number of records in the file. The checkpoint saves that count, and the resumed run opens the
+# journal with keep_records set to it, which cuts the file back to just the records from before the checkpoint.
+#
+# record() only puts the event on a queue; a background thread pickles the events, writes them in batches, and calls
+# fsync after every batch (or every flush_interval seconds when things are quiet), so the trading thread never waits
+# on the disk. If an event can't be pickled or a write fails, the writer logs the error and keeps going, and close()
+# raises the first error to the caller.
+
+import logging
+import os
+import pickle
+import queue
+import struct
+import threading
+
+from Util.tradeTracker import TradeTracker, TradeInfo, OrderInfo
+
+record_header = struct.Struct('<I')
+
+trade_fields = [field for field in TradeInfo.__slots__ if field not in ['active_orders', 'closed_orders', 'tracker']]
+order_fields = list(OrderInfo.__slots__)
+copied_trade_fields = ['data', 'latency']  # The dicts the trading thread keeps changing after the record is queued
+
+
+class TradeJournal:
+    def __init__(self, filename, truncate=False, keep_records=None, batch_size=256, flush_interval=1.0):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.events = queue.SimpleQueue()
+        if truncate or not os.path.exists(filename):
+            self.records = 0
+            self.file = open(filename, 'wb')
+        else:
+            self.records = truncate_journal(filename, keep_records)
+            self.file = open(filename, 'ab')
+        self.written_records = self.records  # The records in the file (only changed by the writer thread)
+        self.error = None  # The first exception from the writer thread (raised by close())
+        self.writer = threading.Thread(target=self.write_events, name='tradeJournal', daemon=True)
+        self.writer.start()
+
+    # Queue an event. records counts the events in the journal (including the ones that are still queued)
+
+    def record(self, kind, payload):
+        self.records += 1
+        self.events.put((kind, payload))
+
+    # The payload is a snapshot of the trade as of now: the writer thread pickles it later, so the mutable fields are
+    # copied (otherwise the trading thread could change them in the middle of the pickle). The order fields are all
+    # immutable values
+
+    def record_trade(self, trade):
+        payload = {field: getattr(trade, field) for field in trade_fields}
+        for field in copied_trade_fields:
+            if payload[field] is not None:
+                payload[field] = dict(payload[field])
+        self.record('trade', payload)
+
+    def record_order(self, order):
+        self.record('order', {field: getattr(order, field) for field in order_fields})
+
+    def record_close_trade(self, trade):
+        self.record('close_trade', (trade.symbol, trade.decision_time))
+
+    # Wait until everything that has been recorded so far is written and fsynced. Returns the number of records in the
+    # file (which leaves out any events the writer failed to write)
+
+    def flush(self):
+        request = threading.Event()
+        self.events.put(request)
+        request.wait()
+        return self.written_records
+
+    # Flush everything that has been recorded so far and stop the writer thread. Raises the first error the writer
+    # thread ran into (after closing the file)
+
+    def close(self):
+        self.events.put(None)
+        self.writer.join()
+        self.file.close()
+        if self.error:
+            raise self.error
+
+    def write_events(self):
+        done = False
+        while not done:
+            batch = list()  # list of bytes
+            flush_request = None  # threading.Event from flush(), set once the batch is on disk
+            try:
+                event = self.events.get(timeout=self.flush_interval)
+                while event is not None:
+                    if isinstance(event, threading.Event):
+                        flush_request = event
+                        break
+                    self.add_to_batch(batch, event)
+                    if len(batch) >= 2 * self.batch_size:
+                        break
+                    event = self.events.get_nowait()
+                done = event is None
+            except queue.Empty:
+                pass
+            if len(batch) > 0:
+                try:
+                    self.file.write(b''.join(batch))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.written_records += len(batch) // 2
+                except Exception as e:
+                    self.writer_failed('write', e, records=len(batch) // 2)
+            if flush_request:
+                flush_request.set()
+
+    def add_to_batch(self, batch, event):
+        try:
+            payload = pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            self.writer_failed('pickle', e, kind=event[0])
+            return
+        batch.append(record_header.pack(len(payload)))
+        batch.append(payload)
+
+    def writer_failed(self, stage, error, **fields):
+        details = ' '.join(f"{key}={value}" for key, value in fields.items())
+        logging.error(f"c=tradeJournal a={stage} s=failed filename={self.filename} {details} "
+                      + f"error={type(error).__name__}: {error}")
+        if not self.error:
+            self.error = error
+
+
+# Cut a journal file back to its first keep_records complete records (or just drop a partial record at the end, if
+# keep_records is None). Returns the number of records left in the file
+
+def truncate_journal(filename, keep_records=None):
+    with open(filename, 'r+b') as f:
+        data = f.read()
+        offset = 0
+        records = 0
+        while offset + record_header.size <= len(data) and (keep_records is None or records < keep_records):
+            (length,) = record_header.unpack_from(data, offset)
+            if offset + record_header.size + length > len(data):
+                break
+            offset += record_header.size + length
+            records += 1
+        if offset < len(data):
+            logging.info(f"c=tradeJournal a=truncate filename={filename} records={records} "
+                         + f"droppedBytes={len(data) - offset}")
+            f.truncate(offset)
+    return records
+
+
+# Read the events from a journal file. A partial record at the end (from a crash in the middle of a write) is ignored
+
+def read_journal(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    events = list()  # list of (kind, payload)
+    offset = 0
+    while offset + record_header.size <= len(data):
+        (length,) = record_header.unpack_from(data, offset)
+        offset += record_header.size
+        if offset + length > len(data):
+            logging.warning(f"c=tradeJournal a=read s=truncatedRecord filename={filename}")
+            break
+        events.append(pickle.loads(data[offset:offset + length]))
+        offset += length
+    return events
+
+
+# Rebuild a TradeTracker from the events in a journal file
+
+def replay_journal(filename):
+    tracker = TradeTracker()
+    for kind, payload in read_journal(filename):
+        if kind == 'trade':
+            key = (payload['symbol'], payload['decision_time'])
+            trade = tracker.get_trade_info(*key)
+            if not trade:
+                trade = tracker.open_trade(payload['symbol'], payload['decision_time'], payload['position_side'])
+            for field, value in payload.items():
+                setattr(trade, field, value)
+        elif kind == 'order':
+            replay_order(tracker, payload)
+        elif kind == 'close_trade':
+            trade = tracker.get_trade_info(*payload)
+            if trade:
+                tracker.close_trade(trade)
+    tracker.account.rebuild(tracker.active_trades.values(), tracker.closed_trades.values())
+    return tracker
+
+
+def replay_order(tracker, payload):
+    trade = tracker.get_trade_info(payload['symbol'], payload['decision_time'])
+    if not trade:
+        return
+    order = tracker.get_order(payload['order_id'])
+    if not order:
+        order = trade.add_order(payload['order_side'], payload['order_type'], payload['target_price'],
+                                payload['order_start'], payload['order_id'])
+    status = payload['status']
+    for field, value in payload.items():
+        setattr(order, field, value)
+    if order.order_end and trade.get_active_order(order.order_side, order.order_type) is order:
+        trade.close_order(order, status, order.actual_price, order.order_end)
+    else:
+        tracker.order_index.set_status(order, status)
+
+
+# Compact a journal into the usual trade tracker report (a CSV, and optionally a Parquet file)
+
+def compact_journal(filename, csv_filename=None, parquet_filename=None):
+    trade_tracker_df = replay_journal(filename).to_dataframe().round(4)
+    if csv_filename:
+        trade_tracker_df.to_csv(csv_filename, index=False)
+    if parquet_filename:
+        trade_tracker_df.to_parquet(parquet_filename, index=False)  # You may need to pip install pyarrow
+    return trade_tracker_df
@@ -18,40 +18,137 @@
 #  - actual_profit: what $ gain was received
 #  - current_price: the most recent price quote for the stock (used for computing current portfolio value)
 #  - data: an optional dict to store additional data that is particular to the trade strategy
+#  - latency: dict of stage: wall-clock time for the stages from the triggering bar to the fills (see
+#      Util/latencyMonitor.py). The report has a {interval}_ms column for each of the latency_intervals
 
 # For short sells, we use the same alpacaOperations procedures as long buys, but they are exercised in the
 # reverse direction. I.e., we start with a Sell and end with a Buy
+#
+# If a TradeJournal (Util/tradeJournal.py) is attached to the tracker, every change to a trade or one of its orders is
+# also streamed to the journal as it happens
+#
+# Concurrency: a TradeTracker created with thread_safe=True guards all of its state (trades, the order index, the
+# portfolio account, and the journal hand-off) with a single re-entrant lock. Every public method of TradeTracker and
+# TradeInfo that reads or changes that state is @synchronized, so each call is atomic with respect to the others,
+# whether it comes from the trading loop, a worker thread placing orders, or a thread handling broker fills. None of
+# the methods block on I/O or await, so they can also be called directly from asyncio tasks (the lock is only held
+# for the duration of the call, never across an await). Iterating over active_trades/closed_trades directly is not
+# protected; use to_dataframe(), active_symbols(), or the get_* methods from other threads.
+#
+# With thread_safe=False (the default, which the SIMULATION path uses) the lock is a shared no-op context manager, so
+# single-threaded runs don't pay for locking
+
+import contextlib
+import functools
+import logging
+import threading
+import time
 
 import pandas as pd
 
 from alpaca.trading.enums import OrderSide, OrderType, PositionSide
 
-from Util.datesAndTimestamps import time_string
+from Util.eventLog import log_event
+from Util.latencyMonitor import latency_intervals, latency_ms
+from Util.portfolioAccounting import PortfolioAccount
 
 trade_tracker_fields_for_csv = ['decision_time', 'symbol', 'shares', 'position_side', 'outcome',
                                 'buy_time', 'target_buy_price', 'actual_buy_price',
                                 'sell_time', 'target_sell_price', 'actual_sell_price', 'actual_gain', 'actual_profit']
 
 global_trade_tracker = None
+global_trade_tracker_lock = threading.Lock()
+global_trade_tracker_thread_safe = False
+
+no_lock = contextlib.nullcontext()
 
 
 def trade_tracker():
     global global_trade_tracker
     if not global_trade_tracker:
-        global_trade_tracker = TradeTracker()
+        with global_trade_tracker_lock:
+            if not global_trade_tracker:
+                global_trade_tracker = TradeTracker(thread_safe=global_trade_tracker_thread_safe)
     return global_trade_tracker
 
 
+# Choose whether the global trade tracker (created on first use) is thread safe. Call this before using the tracker
+
+def set_trade_tracker_thread_safe(thread_safe=True):
+    global global_trade_tracker_thread_safe
+    global_trade_tracker_thread_safe = thread_safe
+
+
+# Replace the global trade tracker (e.g., with one restored from a checkpoint)
+
+def set_trade_tracker(tracker):
+    global global_trade_tracker
+    global_trade_tracker = tracker
+
+
+# Decorator for methods that must hold the tracker's lock (self.lock) while they run
+
+def synchronized(method):
+    @functools.wraps(method)
+    def synchronized_method(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return synchronized_method
+
+
 class TradeTracker:
-    active_trades = dict()  # (symbol, decision_time): TradeInfo
-    closed_trades = dict()  # (symbol, decision_time): TradeInfo
+    def __init__(self, thread_safe=False):
+        self.thread_safe = thread_safe
+        self.lock = threading.RLock() if thread_safe else no_lock
+        self.active_trades = dict()  # (symbol, decision_time): TradeInfo
+        self.closed_trades = dict()  # (symbol, decision_time): TradeInfo
+        self.order_index = OrderIndex()  # indexes the orders of every trade
+        self.journal = None  # optional TradeJournal that we stream trade and order events to
+        self.account = PortfolioAccount()  # incrementally maintained P&L, exposure, and position counts
 
+    # The journal (which owns a file and a writer thread) and the lock aren't part of the tracker's saved state (e.g.,
+    # in a checkpoint). Re-attach the journal after restoring the tracker. With a journal attached, the closed trades
+    # (and their orders) are left out too: the journal already has them, so a checkpoint only costs as much as the open
+    # trades. Bring them back with restore_closed_trades()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.journal:
+            state['closed_trades'] = dict()
+            state['order_index'] = OrderIndex.for_trades(self.active_trades.values())
+        state['journal'] = None
+        state['lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock() if self.thread_safe else no_lock
+
+    def attach_journal(self, journal):
+        self.journal = journal
+
+    # Put back the closed trades that a checkpoint left out, from the tracker replayed from the journal (see
+    # Util/tradeJournal.replay_journal). The trades that are open in this tracker keep their current state
+
+    @synchronized
+    def restore_closed_trades(self, replayed_tracker):
+        for key, trade in replayed_tracker.closed_trades.items():
+            if key not in self.active_trades and key not in self.closed_trades:
+                trade.tracker = self
+                self.closed_trades[key] = trade
+                self.order_index.add_trade(trade)
+
+    @synchronized
     def open_trade(self, symbol, decision_time, position_side, data=None):
         key = (symbol, decision_time)
-        trade = TradeInfo(symbol, decision_time, position_side, data=None)
+        trade = TradeInfo(symbol, decision_time, position_side, data=data, tracker=self)
         self.active_trades[key] = trade
+        self.account.on_open_trade(trade)
+        if self.journal:
+            self.journal.record_trade(trade)
         return trade
 
+    @synchronized
     def get_trade_info(self, symbol, decision_time):
         if (symbol, decision_time) in self.closed_trades:
             return self.closed_trades[(symbol, decision_time)]
@@ -59,18 +156,80 @@ class TradeTracker:
             return self.active_trades[(symbol, decision_time)]
         return None
 
+    @synchronized
     def close_trade(self, trade):
         if (trade.symbol, trade.decision_time) in self.active_trades:
             self.active_trades.pop((trade.symbol, trade.decision_time))
             self.closed_trades[(trade.symbol, trade.decision_time)] = trade
+            self.account.on_close_trade(trade)
+            if self.journal:
+                self.journal.record_close_trade(trade)
+
+    # Order lookups (all O(1) dict lookups via the order index)
+
+    @synchronized
+    def get_order(self, order_id):
+        return self.order_index.by_id.get(order_id)
+
+    @synchronized
+    def get_active_orders(self, symbol, order_side, order_type):
+        return list(self.order_index.by_key.get((symbol, order_side, order_type), dict()).values())
+
+    @synchronized
+    def get_orders_with_status(self, status):
+        return list(self.order_index.by_status.get(status, dict()).values())
+
+    def get_trade_for_order(self, order):
+        return self.get_trade_info(order.symbol, order.decision_time)
+
+    # Apply a fill event (e.g., from the broker) to the order with order_id. If filled_shares is less than the order's
+    # shares, we record a partial fill (and keep the order active). Otherwise we record the execution for the trade.
+    # Returns the TradeInfo for the order (or None if we don't know the order)
+
+    @synchronized
+    def apply_fill(self, order_id, price, fill_time, filled_shares=None):
+        order = self.get_order(order_id)
+        if not order or order.order_end:
+            return None
+        trade = self.get_trade_for_order(order)
+        filled_shares = filled_shares if filled_shares is not None else order.shares
+        if filled_shares < order.shares:
+            order.add_partial_fill(filled_shares, price)
+            self.order_index.set_status(order, 'partially_filled')
+            trade.record_change(order=order)
+            return trade
+        if order.order_side == OrderSide.BUY:
+            trade.add_buy_order_execution(order.order_type, 'filled', price, fill_time)
+        else:
+            trade.add_sell_order_execution(order.order_type, 'filled', price, fill_time)
+        return trade
+
+    @synchronized
+    def apply_cancel(self, order_id, cancel_time):
+        order = self.get_order(order_id)
+        if not order or order.order_end:
+            return None
+        trade = self.get_trade_for_order(order)
+        trade.close_order(order, 'cancelled', order.actual_price or 0, cancel_time)
+        return trade
+
+    # Build the report column by column (rather than row by row), and format buy_time and sell_time as time strings
+    # in one vectorized pass
 
     def to_dataframe(self):
-        rows = list()  # list of lists of values for each trade
-        for trade in list(self.closed_trades.values()) + list(self.active_trades.values()):
-            rows.append(trade.trade_values())
-        trade_tracker_dataframe = pd.DataFrame(data=rows, columns=trade_tracker_fields_for_csv)
+        with self.lock:  # Only hold the lock while we take a snapshot of the values
+            trades = list(self.closed_trades.values()) + list(self.active_trades.values())
+            columns = {field: [getattr(trade, field) for trade in trades] for field in trade_tracker_fields_for_csv}
+            latencies = [dict(trade.latency) for trade in trades]
+        for field in ['buy_time', 'sell_time']:
+            times = pd.to_datetime(pd.Series(columns[field], dtype=object), utc=True)
+            columns[field] = times.dt.tz_convert('America/New_York').dt.strftime('%H:%M:%S')
+        for interval in latency_intervals:
+            columns[f"{interval}_ms"] = [latency_ms(latency, interval) for latency in latencies]
+        trade_tracker_dataframe = pd.DataFrame(columns, columns=list(columns.keys()))
         return trade_tracker_dataframe
 
+    @synchronized
     def active_symbols(self):
         symbols = set()
         for trade in self.active_trades.values():
@@ -78,8 +237,16 @@ class TradeTracker:
         return list(symbols)
 
 
+# TradeInfo and OrderInfo use __slots__, so each record is a compact fixed-size object (no per-instance __dict__). That
+# keeps long backtests with 100k+ trades comfortably in memory
+
 class TradeInfo:
-    def __init__(self, symbol, decision_time, position_side, data=None):
+    __slots__ = ('symbol', 'decision_time', 'position_side', 'data', 'shares', 'outcome', 'buy_time',
+                 'target_buy_price', 'actual_buy_price', 'sell_time', 'target_sell_price', 'actual_sell_price',
+                 'actual_gain', 'actual_profit', 'current_price', 'latency', 'active_orders', 'closed_orders',
+                 'tracker')
+
+    def __init__(self, symbol, decision_time, position_side, data=None, tracker=None):
         self.symbol = symbol  # string
         self.decision_time = decision_time  # timestamp
         self.position_side = position_side  # PositionSide enum (LONG or SHORT)
@@ -95,45 +262,89 @@ class TradeInfo:
         self.actual_gain = None  # 100 * (actual_sell_price / actual_buy_price - 1)
         self.actual_profit = None  # shares * (actual_sell_price - actual_buy_price)
         self.current_price = None
-        self.active_orders = list()  # list of OrderInfo
+        self.latency = dict()  # stage: wall-clock time (seconds since the epoch)
+        self.active_orders = dict()  # (order_side, order_type): OrderInfo. At most one active order of each kind
         self.closed_orders = list()  # list of OrderInfo
+        self.tracker = tracker  # the TradeTracker that owns this trade (and indexes its orders)
+
+    @property
+    def lock(self):
+        return self.tracker.lock if self.tracker else no_lock
 
     def get_active_order(self, order_side, order_type):
-        for order in self.active_orders:
-            if (order.order_side == order_side) and (order.order_type == order_type):
-                return order
-        return None
+        return self.active_orders.get((order_side, order_type))
 
+    # Record when the trade reached a latency stage (the first time only, e.g., for an order with several fills)
+
+    def mark_latency(self, stage, when=None):
+        self.latency.setdefault(stage, when if when else time.time())
+
+    # Add a new active order. A trade has at most one active order of each (side, type), so placing a second one
+    # before the first is closed (filled or cancelled via close_order) raises a ValueError: replacing it would leave
+    # the first order open in the order index, where it could never be closed through the trade
+
+    @synchronized
     def add_order(self, order_direction, order_type, price, order_start, order_id):
+        previous = self.active_orders.get((order_direction, order_type))
+        if previous:
+            raise ValueError(f"{self.symbol} already has an active {order_direction.name} {order_type.name} order "
+                             + f"({previous.order_id}); close or cancel it before placing {order_id}")
         order = OrderInfo(order_direction, order_type, self.symbol, self.decision_time,
                           self.shares, price, order_start, order_id)
-        self.active_orders.append(order)
+        self.active_orders[(order_direction, order_type)] = order
+        if self.tracker:
+            self.tracker.order_index.add(order)
+        self.record_change(order=order)
         return order
 
+    @synchronized
     def close_order(self, order, status, actual_price, order_end):
         order.close_order(status, actual_price, order_end)
-        self.active_orders.remove(order)
+        self.active_orders.pop((order.order_side, order.order_type), None)
         self.closed_orders.append(order)
+        if self.tracker:
+            self.tracker.order_index.deactivate(order)
+            self.tracker.order_index.set_status(order, status)
+        self.record_change(order=order)
+
+    # Let the tracker know this trade (or one of its orders) changed: we update the portfolio account and stream the
+    # new state to the journal
 
-    def trade_values(self):
-        buy_time = time_string(self.buy_time) if self.buy_time else None
-        sell_time = time_string(self.sell_time) if self.sell_time else None
-        return [self.decision_time, self.symbol, self.shares, self.position_side, self.outcome,
-                buy_time, self.actual_buy_price, self.actual_buy_price,
-                sell_time, self.target_sell_price, self.actual_sell_price, self.actual_gain,
-                self.actual_profit]
+    def record_change(self, order=None):
+        if self.tracker:
+            if not order:
+                self.tracker.account.on_trade_update(self)
+            if self.tracker.journal:
+                if order:
+                    self.tracker.journal.record_order(order)
+                else:
+                    self.tracker.journal.record_trade(self)
 
+    # Mark the open position to a new price quote (only the portfolio account is updated; we don't journal quotes)
+
+    @synchronized
+    def update_current_price(self, price):
+        self.current_price = price
+        if self.tracker:
+            self.tracker.account.on_trade_update(self)
+
+    @synchronized
     def add_market_buy_order(self, shares, target_buy_price, order_start, order_id):
         self.shares = shares
         self.target_buy_price = target_buy_price
+        self.record_change()
         return self.add_order(OrderSide.BUY, OrderType.MARKET, target_buy_price, order_start, order_id)
 
+    @synchronized
     def add_market_sell_order(self, shares, target_sell_price, order_start, order_id):
         self.shares = shares
         self.target_sell_price = target_sell_price
+        self.record_change()
         return self.add_order(OrderSide.SELL, OrderType.MARKET, target_sell_price, order_start, order_id)
 
+    @synchronized
     def add_buy_order_execution(self, order_type, status, actual_purchase_price, order_end):
+        self.mark_latency('buy_filled')
         self.buy_time = order_end
         self.actual_buy_price = actual_purchase_price
         self.current_price = actual_purchase_price
@@ -141,10 +352,13 @@ class TradeInfo:
             self.actual_gain = 100 * (self.actual_sell_price / self.actual_buy_price - 1)
             self.actual_profit = self.shares * (self.actual_sell_price - self.actual_buy_price)
             self.outcome = order_type
+        self.record_change()
         order = self.get_active_order(OrderSide.BUY, order_type)
         self.close_order(order, status, actual_purchase_price, order_end)
 
+    @synchronized
     def add_sell_order_execution(self, order_type, status, actual_sell_price, order_end):
+        self.mark_latency('sell_filled')
         self.sell_time = order_end
         self.actual_sell_price = actual_sell_price
         self.current_price = actual_sell_price
@@ -156,12 +370,15 @@ class TradeInfo:
                 self.actual_gain = 100 * (self.actual_sell_price / self.actual_buy_price - 1)
                 self.actual_profit = self.shares * (self.actual_sell_price - self.actual_buy_price)
             else:
-                print(f'add_sell_order_execution issue: {self.actual_buy_price} {self.actual_sell_price}')
+                log_event('tradeTracker', 'sellExecution', level=logging.WARNING, s='missingPrice', sym=self.symbol,
+                          buyPrice=self.actual_buy_price, sellPrice=self.actual_sell_price)
+        self.record_change()
         order = self.get_active_order(OrderSide.SELL, order_type)
         if order:
             self.close_order(order, status, actual_sell_price, order_end)
         else:
-            print(f"Didn't find SELL order of {order_type}")
+            log_event('tradeTracker', 'sellExecution', level=logging.WARNING, s='missingOrder', sym=self.symbol,
+                      type=order_type.name)
 
     def current_profit(self):
         if (self.position_side == PositionSide.LONG) and self.current_price and self.actual_buy_price:
@@ -172,6 +389,9 @@ class TradeInfo:
 
 
 class OrderInfo:
+    __slots__ = ('order_side', 'order_type', 'symbol', 'decision_time', 'shares', 'target_price', 'order_start',
+                 'order_id', 'status', 'actual_price', 'filled_shares', 'order_end')
+
     def __init__(self, order_side, order_type, symbol, decision_time, shares, target_price, order_start, order_id):
         self.order_side = order_side  # OrderSide.BUY, OrderSide.SELL
         self.order_type = order_type  # OrderType.MARKET, OrderType.LIMIT, OrderType.STOP, ...
@@ -182,14 +402,77 @@ class OrderInfo:
         self.order_start = order_start  # timestamp of when the order was placed
         self.order_id = order_id  # UUID from Alpaca
         self.status = 'not_filled'  # or 'filled', 'partially_filled', 'cancelled'
-
-    actual_price = None
-    order_end = None  # timestamp of when the order ended
+        self.actual_price = None  # average price for the shares filled so far
+        self.filled_shares = 0
+        self.order_end = None  # timestamp of when the order ended
 
     def update_status(self, status):
         self.status = status
 
+    # Record a partial fill. filled_shares is the total number of shares filled so far (which is how Alpaca reports
+    # it), and price is the average price for those shares
+
+    def add_partial_fill(self, filled_shares, price):
+        self.filled_shares = filled_shares
+        self.actual_price = price
+
     def close_order(self, status, actual_price, order_end):
         self.status = status
         self.actual_price = actual_price
+        if status == 'filled':
+            self.filled_shares = self.shares
         self.order_end = order_end
+
+
+# The OrderIndex spans the orders of every trade in a TradeTracker, so that broker events (which are keyed by the
+# Alpaca order UUID) can be applied without scanning trades:
+#   by_id: order_id: OrderInfo (all orders, active or closed)
+#   by_key: (symbol, order_side, order_type): dict of order_id: OrderInfo (active orders only)
+#   by_status: status: dict of order_id: OrderInfo
+#
+# The inner dicts are used as ordered sets, so adding and removing orders is O(1)
+
+class OrderIndex:
+    def __init__(self):
+        self.by_id = dict()
+        self.by_key = dict()
+        self.by_status = dict()
+
+    def add(self, order):
+        self.by_id[order.order_id] = order
+        self.by_key.setdefault((order.symbol, order.order_side, order.order_type), dict())[order.order_id] = order
+        self.by_status.setdefault(order.status, dict())[order.order_id] = order
+
+    # Index all of a trade's orders (its closed orders aren't active)
+
+    def add_trade(self, trade):
+        for order in trade.active_orders.values():
+            self.add(order)
+        for order in trade.closed_orders:
+            self.add(order)
+            self.deactivate(order)
+
+    @staticmethod
+    def for_trades(trades):
+        order_index = OrderIndex()
+        for trade in trades:
+            order_index.add_trade(trade)
+        return order_index
+
+    def deactivate(self, order):
+        key = (order.symbol, order.order_side, order.order_type)
+        orders = self.by_key.get(key)
+        if orders is not None:
+            orders.pop(order.order_id, None)
+            if len(orders) == 0:
+                self.by_key.pop(key)
+
+    # Move the order into the bucket for its new status (the previous bucket is found by searching, since
+    # OrderInfo.close_order may already have changed order.status)
+
+    def set_status(self, order, status):
+        for orders in self.by_status.values():
+            if orders.pop(order.order_id, None) is not None:
+                break
+        order.status = status
+        self.by_status.setdefault(status, dict())[order.order_id] = order
@@ -0,0 +1,117 @@
+# The TradingCalendar holds the NYSE trading dates (and the open/close time of each session) for a configurable range
+# of years.
+#
+# Building the calendar with pandas_market_calendars takes a while, so we only do it the first time it's needed and
+# then cache the result to disk (in the DerivedFiles folder). After that:
+#   ordinal(date): position of the trading date in the calendar (O(1), via a dict)
+#   date_at(i): the trading date at position i (O(1), via the DatetimeIndex)
+#   dates_between(start, end): the trading dates in [start, end] (binary search + slice)
+#   market_open(date), market_close(date), is_early_close(date): session times, which handle the early closes
+#       (e.g., the day after Thanksgiving)
+
+import logging
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from Util.pathsAndStockSets import prod_derived_files_path
+
+calendar_start_year = 2000
+calendar_end_year = 2030
+
+global_trading_calendar = None
+
+
+# Change the range of years covered by the calendar. The calendar will be re-loaded the next time it's used
+
+def set_calendar_years(start_year=2000, end_year=2030):
+    global calendar_start_year, calendar_end_year, global_trading_calendar
+    calendar_start_year, calendar_end_year = start_year, end_year
+    global_trading_calendar = None
+
+
+def trading_calendar():
+    global global_trading_calendar
+    if not global_trading_calendar:
+        global_trading_calendar = TradingCalendar.load(calendar_start_year, calendar_end_year)
+    return global_trading_calendar
+
+
+def calendar_cache_filename(start_year, end_year):
+    return prod_derived_files_path + f"nyseCalendar_{start_year}_{end_year}.pkl"
+
+
+class TradingCalendar:
+    def __init__(self, dates, market_opens, market_closes):
+        self.dates = dates  # DatetimeIndex of trading dates (midnight, NY time)
+        self.market_opens = market_opens  # DatetimeIndex of session open times (NY time)
+        self.market_closes = market_closes  # DatetimeIndex of session close times (NY time)
+        self.date_values = dates.asi8  # int64 nanoseconds, for binary searches
+        self.ordinals = {date: i for i, date in enumerate(dates)}  # Timestamp: position in dates
+
+    @staticmethod
+    def build(start_year, end_year):
+        import pandas_market_calendars as mcal  # Also might need to pip install exchange_calendars
+        schedule = mcal.get_calendar('NYSE').schedule(f"{start_year}-01-01", f"{end_year}-12-31")
+        dates = pd.DatetimeIndex(schedule.index).tz_localize('America/New_York')
+        market_opens = pd.DatetimeIndex(schedule['market_open']).tz_convert('America/New_York')
+        market_closes = pd.DatetimeIndex(schedule['market_close']).tz_convert('America/New_York')
+        return TradingCalendar(dates, market_opens, market_closes)
+
+    # Load the calendar from the disk cache, building (and caching) it if needed
+
+    @staticmethod
+    def load(start_year, end_year):
+        filename = calendar_cache_filename(start_year, end_year)
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                dates, market_opens, market_closes = pickle.load(f)
+            return TradingCalendar(dates, market_opens, market_closes)
+        logging.info(f"c=tradingCalendar a=build startYear={start_year} endYear={end_year}")
+        calendar = TradingCalendar.build(start_year, end_year)
+        with open(filename + '.tmp', 'wb') as f:
+            pickle.dump((calendar.dates, calendar.market_opens, calendar.market_closes), f)
+        os.replace(filename + '.tmp', filename)
+        return calendar
+
+    # Return the position of date in the calendar, or None if it isn't a trading date
+
+    def ordinal(self, date):
+        return self.ordinals.get(date)
+
+    def date_at(self, i):
+        if i < 0 or i >= len(self.dates):
+            return None
+        return self.dates[i]
+
+    # Return the trading dates between start and end (inclusive). Any time component is ignored
+
+    def dates_between(self, start, end):
+        i = np.searchsorted(self.date_values, calendar_date(start).value, side='left')
+        j = np.searchsorted(self.date_values, calendar_date(end).value, side='right')
+        return self.dates[i:j]
+
+    def market_open(self, date):
+        i = self.ordinal(date)
+        return None if i is None else self.market_opens[i]
+
+    def market_close(self, date):
+        i = self.ordinal(date)
+        return None if i is None else self.market_closes[i]
+
+    def is_early_close(self, date):
+        i = self.ordinal(date)
+        if i is None:
+            return False
+        return (self.market_closes[i] - self.dates[i]) < pd.Timedelta('16:00:00')
+
+
+# Convert a Timestamp (with or without a time component) into a midnight, NY time, Timestamp
+
+def calendar_date(time_stamp):
+    time_stamp = pd.Timestamp(time_stamp)
+    if time_stamp.tzinfo is None:
+        time_stamp = time_stamp.tz_localize('America/New_York')
+    return time_stamp.tz_convert('America/New_York').normalize()